@@ -0,0 +1,175 @@
+"""
+Registry of Opentrons Flex robots.
+
+Robots come from a JSON config file (CORNUCOPIA_FLEET_CONFIG, default
+robots.json):
+
+    {"robots": [{"name": "flex-1", "url": "http://10.0.0.11:31950"},
+                {"name": "flex-2", "url": "http://10.0.0.12:31950"}]}
+
+Without a config file the fleet is the single robot at OPENTRONS_FLEX_URL.
+A background task refreshes each robot's health and current run every
+CORNUCOPIA_FLEET_POLL_INTERVAL seconds so dispatch can pick an idle robot.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import List, Optional
+
+from api.flex_client import flex_request, get_flex_client
+
+FLEET_CONFIG = os.getenv("CORNUCOPIA_FLEET_CONFIG", "robots.json")
+FLEET_POLL_INTERVAL = float(os.getenv("CORNUCOPIA_FLEET_POLL_INTERVAL", "10"))
+
+# Protocols are uploaded with key "sha256:<hex digest of the file>" so
+# identical files can be matched to what the robot already stores
+PROTOCOL_KEY_PREFIX = "sha256:"
+
+# Run statuses that mean the robot won't accept another run
+ACTIVE_RUN_STATUSES = {
+    "idle",
+    "running",
+    "paused",
+    "finishing",
+    "stop-requested",
+    "blocked-by-open-door",
+    "awaiting-recovery",
+}
+
+
+def protocol_key(file_data: bytes) -> str:
+    return PROTOCOL_KEY_PREFIX + hashlib.sha256(file_data).hexdigest()
+
+
+class Robot:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.healthy = False
+        self.last_checked: Optional[float] = None
+        self.current_run_id: Optional[str] = None
+        self.current_run_status: Optional[str] = None
+        self.runs_dispatched = 0
+        self.dispatching = 0  # sends in flight that haven't created their run yet
+        self.protocol_ids: dict = {}  # protocol key (content hash) -> protocol ID on this robot
+        self.protocols_synced = False
+        self.pending_uploads: dict = {}  # protocol key -> upload in flight
+
+    @property
+    def busy(self) -> bool:
+        return self.dispatching > 0 or self.current_run_status in ACTIVE_RUN_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "busy": self.busy,
+            "current_run_id": self.current_run_id,
+            "current_run_status": self.current_run_status,
+            "runs_dispatched": self.runs_dispatched,
+            "known_protocols": len(self.protocol_ids),
+            "last_checked": self.last_checked,
+        }
+
+
+class Fleet:
+    def __init__(self, robots: List[Robot]):
+        self.robots = {robot.name: robot for robot in robots}
+        self.run_owners: dict = {}  # run_id -> robot name
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, path: str, default_url: str) -> "Fleet":
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                config = json.load(f)
+            robots = [Robot(r["name"], r["url"]) for r in config.get("robots", [])]
+            if robots:
+                return cls(robots)
+        return cls([Robot("flex", default_url)])
+
+    @property
+    def default(self) -> Robot:
+        return next(iter(self.robots.values()))
+
+    def get(self, name: str) -> Optional[Robot]:
+        return self.robots.get(name)
+
+    def robot_for_run(self, run_id: str) -> Robot:
+        """Robot that a run was dispatched to (default robot for runs we didn't create)."""
+        return self.robots.get(self.run_owners.get(run_id), self.default)
+
+    def pick_idle(self) -> Optional[Robot]:
+        """Least-loaded healthy robot with no active run."""
+        idle = [r for r in self.robots.values() if r.healthy and not r.busy]
+        if not idle:
+            return None
+        return min(idle, key=lambda r: r.runs_dispatched)
+
+    def record_run(self, robot: Robot, run_id: str, status: str):
+        robot.current_run_id = run_id
+        robot.current_run_status = status
+        robot.runs_dispatched += 1
+        self.run_owners[run_id] = robot.name
+
+    def clear_run(self, robot: Robot, run_id: str):
+        """Forget a run that never started, so the robot counts as idle again."""
+        if robot.current_run_id == run_id:
+            robot.current_run_id = None
+            robot.current_run_status = None
+
+    async def sync_protocols(self, robot: Robot):
+        """Seed the robot's content-hash map from the keys of protocols it already stores."""
+        response = await flex_request("GET", robot.url, "/protocols", retries=0, timeout=10.0)
+        if response.status_code != 200:
+            return
+        for protocol in response.json().get("data", []):  # oldest first, so newest wins
+            key = protocol.get("key") or ""
+            if key.startswith(PROTOCOL_KEY_PREFIX):
+                robot.protocol_ids[key] = protocol["id"]
+        robot.protocols_synced = True
+
+    async def refresh(self, robot: Robot):
+        """Update health and current run for one robot."""
+        try:
+            response = await flex_request("GET", robot.url, "/health", retries=0, timeout=5.0)
+            robot.healthy = response.status_code == 200
+            if robot.healthy:
+                runs = await flex_request("GET", robot.url, "/runs", retries=0, timeout=5.0)
+                if runs.status_code == 200:
+                    current = [r for r in runs.json().get("data", []) if r.get("current")]
+                    robot.current_run_id = current[-1]["id"] if current else None
+                    robot.current_run_status = current[-1].get("status") if current else None
+                    if robot.current_run_id:
+                        self.run_owners.setdefault(robot.current_run_id, robot.name)
+                if not robot.protocols_synced:
+                    await self.sync_protocols(robot)
+        except Exception:
+            robot.healthy = False
+        robot.last_checked = time.time()
+
+    async def refresh_all(self):
+        await asyncio.gather(*(self.refresh(robot) for robot in self.robots.values()))
+
+    async def _monitor(self, interval: float):
+        while True:
+            await self.refresh_all()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = FLEET_POLL_INTERVAL):
+        for robot in self.robots.values():
+            get_flex_client(robot.url)
+        if self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor(interval))
+
+    async def stop(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
@@ -1,27 +1,40 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import asyncio
+import hashlib
 import json
 import os
+import uuid
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 import httpx
 import aiofiles
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from agents import set_default_openai_client
 
 # Import your agents (update these import paths as needed)
-from cornucopia_agents.prompt_creator import PromptCreatorAgent
-from cornucopia_agents.protocol_generator import ProtocolGeneratorAgent
-from cornucopia_agents.qc_agent import _simulate_protocol
+from cornucopia_agents.qc_agent import _simulate_protocol_async, simulation_queue_stats
+from cornucopia_agents.runner import clarify_prompt_async, generate_run_block_with_report_async
+from api.fleet import FLEET_CONFIG, Fleet, Robot, protocol_key
+from api.flex_client import close_flex_clients, flex_request
+from api.run_watcher import get_run_watcher, run_watcher_stats, stop_run_watchers
 from utils.io_helpers import save_protocol
 from utils.fixed_header import get_fixed_header
-from agents import Runner
+from utils.index_registry import get_index_registry
+from utils.retrieval import context_cache_stats
+from utils.runtime_estimator import estimate_protocol_file, load_timing_model
+from utils.simulator_pool import get_simulator_pool
+from utils.simulation_cache import get_simulation_cache
 
 # Load environment variables
 load_dotenv()
 BASE_URL = os.getenv("OPENTRONS_FLEX_URL", "http://localhost:31950")
+fleet = Fleet.from_config(FLEET_CONFIG, BASE_URL)
+# Batch items clarified/generated at once; simulation is capped separately
+BATCH_CONCURRENCY = int(os.getenv("CORNUCOPIA_BATCH_CONCURRENCY", str(os.cpu_count() or 4)))
+BATCH_JOB_HISTORY = int(os.getenv("CORNUCOPIA_BATCH_JOB_HISTORY", "100"))
 
 # OpenAI client
 client = AsyncOpenAI(
@@ -45,12 +58,22 @@ class ExperimentRequest(BaseModel):
 
 class FlexRunRequest(BaseModel):
     filepath: str
+    robot: Optional[str] = None  # Robot name; least-loaded idle robot if omitted
+
+
+class ProtocolUploadRequest(BaseModel):
+    filepath: str
+    robots: Optional[List[str]] = None  # Robot names; all healthy robots if omitted
 
 
 class ProtocolValidationRequest(BaseModel):
     protocol_code: str
 
 
+class BatchExperimentRequest(BaseModel):
+    requests: List[ExperimentRequest]
+
+
 class ExperimentTypeRequest(BaseModel):
     experiment_type: str
     parameters: Optional[dict] = {}
@@ -66,6 +89,8 @@ class ExperimentResponse(BaseModel):
     experiment_type: str
     success: bool
     error_message: Optional[str] = None
+    tip_optimization: Optional[dict] = None  # tips / seconds saved (and plan checks for template protocols)
+    estimated_runtime: Optional[dict] = None  # expected run time on the robot, for protocols that pass QC
 
 
 class ValidationResponse(BaseModel):
@@ -77,11 +102,17 @@ class ValidationResponse(BaseModel):
 
 class FlexStatusResponse(BaseModel):
     run_id: str
+    robot: Optional[str] = None
     status: str
     current_command: Optional[str]
+    commands_completed: int = 0
+    commands_failed: int = 0
+    total_commands: Optional[int] = None
+    progress: Optional[float] = None  # 0-1, None until the command count is known
     created_at: Optional[str]
     started_at: Optional[str]
     completed_at: Optional[str]
+    errors: List[str] = []
 
 
 class ExperimentTypeInfo(BaseModel):
@@ -92,6 +123,22 @@ class ExperimentTypeInfo(BaseModel):
     example: Optional[str] = None
 
 
+class BatchItemResult(BaseModel):
+    index: int
+    status: str  # queued | running | completed | failed
+    result: Optional[ExperimentResponse] = None
+    error_message: Optional[str] = None
+
+
+class BatchJobResponse(BaseModel):
+    job_id: str
+    status: str  # running | completed
+    total: int
+    completed: int
+    failed: int
+    items: List[BatchItemResult]
+
+
 # ---------- Helper Functions ----------
 def determine_experiment_type(prompt: str) -> str:
     """Determine experiment type from user input."""
@@ -201,10 +248,15 @@ async def root():
         ],
         "endpoints": [
             "/generate_protocol",
+            "/generate_protocol/stream",
+            "/generate_protocols/batch",
             "/validate_protocol",
             "/send_to_flex",
+            "/protocols/upload",
+            "/robots",
             "/experiments/types",
             "/runs/{run_id}/status",
+            "/runs/{run_id}/events",
             "/runs/{run_id}/stop",
         ],
     }
@@ -218,16 +270,11 @@ async def health_check():
         test_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
         # Test Opentrons connection
-        async with httpx.AsyncClient(timeout=5.0) as http_client:
-            try:
-                opentrons_response = await http_client.get(f"{BASE_URL}/health")
-                opentrons_status = (
-                    "connected"
-                    if opentrons_response.status_code == 200
-                    else "disconnected"
-                )
-            except:
-                opentrons_status = "disconnected"
+        await fleet.refresh_all()
+        healthy = sum(1 for robot in fleet.robots.values() if robot.healthy)
+        opentrons_status = "connected" if healthy else "disconnected"
+
+        sim_cache = get_simulation_cache()
 
         return {
             "status": "healthy",
@@ -238,6 +285,17 @@ async def health_check():
                 ),
                 "opentrons_flex": opentrons_status,
             },
+            "robots": {
+                "total": len(fleet.robots),
+                "healthy": healthy,
+                "busy": sum(1 for robot in fleet.robots.values() if robot.busy),
+            },
+            "run_watchers": run_watcher_stats(),
+            "rag_indexes": get_index_registry().stats(),
+            "rag_context_cache": context_cache_stats(),
+            "simulation_cache": sim_cache.stats() if sim_cache else "disabled",
+            "simulation_queue": simulation_queue_stats(),
+            "runtime_model": load_timing_model().to_dict(),
         }
     except Exception as e:
         return {
@@ -247,78 +305,104 @@ async def health_check():
         }
 
 
-@app.post("/generate_protocol", response_model=ExperimentResponse)
-async def generate_protocol(req: ExperimentRequest):
-    """Generate a protocol from user input using enhanced AI agents."""
-
-    user_input = req.user_input.strip()
+def indent(code: str, spaces: int = 4) -> str:
+    """Indent a run() body so it can follow the fixed header."""
+    pad = " " * spaces
+    return "\n".join(pad + line if line.strip() else "" for line in code.splitlines())
 
-    if not user_input:
-        raise HTTPException(status_code=400, detail="User input cannot be empty")
 
-    try:
-        # Determine experiment type
-        experiment_type = req.experiment_type or determine_experiment_type(user_input)
-
-        # Step 1: Clarify prompt using enhanced agent
-        clarify_result = await Runner.run_async(PromptCreatorAgent, user_input)
-        clarified = json.loads(clarify_result.final_output)
-        confirmation = clarified["confirmation"]
-        clean_prompt = clarified["clean_prompt"]
-
-        if not clean_prompt:
-            return ExperimentResponse(
-                confirmation=confirmation,
-                clean_prompt="",
-                protocol="",
-                qc_result="",
-                filepath="",
-                experiment_type=experiment_type,
-                success=False,
-                error_message="Prompt clarification failed - insufficient information provided",
-            )
-
-        # Step 2: Generate protocol using enhanced agent
-        protocol_result = await Runner.run_async(ProtocolGeneratorAgent, clean_prompt)
-        raw_protocol = protocol_result.final_output.strip()
-
-        if not raw_protocol:
-            return ExperimentResponse(
-                confirmation=confirmation,
-                clean_prompt=clean_prompt,
-                protocol="",
-                qc_result="",
-                filepath="",
-                experiment_type=experiment_type,
-                success=False,
-                error_message="Protocol generation failed",
-            )
-
-        # Format protocol with proper indentation
-        def indent(code: str, spaces: int = 4) -> str:
-            pad = " " * spaces
-            return "\n".join(
-                pad + line if line.strip() else "" for line in code.splitlines()
-            )
+async def protocol_stages(req: ExperimentRequest):
+    """
+    Run clarification, generation and QC, yielding (stage, payload) as each
+    stage finishes. The last item is always ("result", ExperimentResponse).
+    """
+    user_input = req.user_input.strip()
 
-        full_protocol = get_fixed_header().rstrip() + "\n" + indent(raw_protocol)
+    # Determine experiment type
+    experiment_type = req.experiment_type or determine_experiment_type(user_input)
+
+    # Step 1: Clarify prompt using enhanced agent
+    clarified = await clarify_prompt_async(user_input)
+    confirmation = clarified["confirmation"]
+    clean_prompt = clarified["clean_prompt"]
+    yield "clarification", {
+        "confirmation": confirmation,
+        "clean_prompt": clean_prompt,
+        "experiment_type": experiment_type,
+    }
 
-        # Step 3: Save and validate protocol
-        path = save_protocol(
-            full_protocol, filename=f"generated_protocol_{experiment_type}.py"
+    if not clean_prompt:
+        yield "result", ExperimentResponse(
+            confirmation=confirmation,
+            clean_prompt="",
+            protocol="",
+            qc_result="",
+            filepath="",
+            experiment_type=experiment_type,
+            success=False,
+            error_message="Prompt clarification failed - insufficient information provided",
         )
-        qc_result = _simulate_protocol(path)
+        return
 
-        return ExperimentResponse(
+    # Step 2: Generate protocol using enhanced agent
+    raw_protocol, tip_optimization = await generate_run_block_with_report_async(
+        clean_prompt, experiment_type=experiment_type
+    )
+
+    if not raw_protocol:
+        yield "result", ExperimentResponse(
             confirmation=confirmation,
             clean_prompt=clean_prompt,
-            protocol=full_protocol,
-            qc_result=qc_result,
-            filepath=path,
+            protocol="",
+            qc_result="",
+            filepath="",
             experiment_type=experiment_type,
-            success=len(qc_result) == 0,  # Success if no errors
-            error_message=qc_result if qc_result else None,
+            success=False,
+            error_message="Protocol generation failed",
         )
+        return
+
+    full_protocol = get_fixed_header().rstrip() + "\n" + indent(raw_protocol)
+
+    # Step 3: Save and validate protocol (content-hashed name so concurrent
+    # requests never overwrite each other's file)
+    digest = hashlib.sha256(full_protocol.encode()).hexdigest()[:12]
+    path = save_protocol(
+        full_protocol, filename=f"generated_protocol_{experiment_type}_{digest}.py"
+    )
+    yield "protocol", {"protocol": full_protocol, "filepath": path, "tip_optimization": tip_optimization}
+
+    qc_result = await _simulate_protocol_async(path)
+    estimated_runtime = None
+    if not qc_result:
+        estimated_runtime = await asyncio.to_thread(estimate_protocol_file, path)
+    yield "qc", {"qc_result": qc_result, "success": len(qc_result) == 0, "estimated_runtime": estimated_runtime}
+
+    yield "result", ExperimentResponse(
+        confirmation=confirmation,
+        clean_prompt=clean_prompt,
+        protocol=full_protocol,
+        qc_result=qc_result,
+        filepath=path,
+        experiment_type=experiment_type,
+        success=len(qc_result) == 0,  # Success if no errors
+        error_message=qc_result if qc_result else None,
+        tip_optimization=tip_optimization,
+        estimated_runtime=estimated_runtime,
+    )
+
+
+@app.post("/generate_protocol", response_model=ExperimentResponse)
+async def generate_protocol(req: ExperimentRequest):
+    """Generate a protocol from user input using enhanced AI agents."""
+
+    if not req.user_input.strip():
+        raise HTTPException(status_code=400, detail="User input cannot be empty")
+
+    try:
+        async for stage, payload in protocol_stages(req):
+            if stage == "result":
+                return payload
 
     except Exception as e:
         import traceback
@@ -330,6 +414,125 @@ async def generate_protocol(req: ExperimentRequest):
         )
 
 
+@app.post("/generate_protocol/stream")
+async def generate_protocol_stream(req: ExperimentRequest):
+    """
+    Same pipeline as /generate_protocol, streamed as NDJSON: one line per
+    stage (clarification, protocol, qc) as soon as it finishes, then a final
+    "result" line with the full ExperimentResponse.
+    """
+
+    if not req.user_input.strip():
+        raise HTTPException(status_code=400, detail="User input cannot be empty")
+
+    async def events():
+        try:
+            async for stage, payload in protocol_stages(req):
+                if isinstance(payload, BaseModel):
+                    payload = payload.model_dump()
+                yield json.dumps({"stage": stage, **payload}) + "\n"
+        except Exception as e:
+            import traceback
+
+            traceback.print_exc()
+            yield json.dumps(
+                {
+                    "stage": "error",
+                    "detail": f"Internal error during protocol generation: {str(e)}",
+                }
+            ) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# ---------- Batch Generation ----------
+batch_jobs: dict = {}  # job_id -> {"items": [BatchItemResult], "task": asyncio.Task}
+
+
+async def run_batch_item(item: BatchItemResult, req: ExperimentRequest, slots: asyncio.Semaphore):
+    """
+    Clarify and generate under the batch semaphore, then release it before
+    QC so the next item can start while this one waits on the shared
+    simulation queue (_simulate_protocol_async).
+    """
+    if not req.user_input.strip():
+        item.status = "failed"
+        item.error_message = "User input cannot be empty"
+        return
+
+    await slots.acquire()
+    holding = True
+    item.status = "running"
+    try:
+        async for stage, payload in protocol_stages(req):
+            if stage == "protocol":
+                slots.release()
+                holding = False
+            elif stage == "result":
+                item.result = payload
+        item.status = "completed"
+    except Exception as e:
+        item.status = "failed"
+        item.error_message = f"Internal error during protocol generation: {str(e)}"
+    finally:
+        if holding:
+            slots.release()
+
+
+async def run_batch_job(job: dict, requests: List[ExperimentRequest]):
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    await asyncio.gather(
+        *(run_batch_item(item, req, slots) for item, req in zip(job["items"], requests))
+    )
+
+
+def batch_job_response(job_id: str) -> BatchJobResponse:
+    items = batch_jobs[job_id]["items"]
+    completed = sum(1 for item in items if item.status == "completed")
+    failed = sum(1 for item in items if item.status == "failed")
+    return BatchJobResponse(
+        job_id=job_id,
+        status="completed" if completed + failed == len(items) else "running",
+        total=len(items),
+        completed=completed,
+        failed=failed,
+        items=items,
+    )
+
+
+def prune_batch_jobs():
+    """Forget the oldest finished jobs beyond BATCH_JOB_HISTORY."""
+    finished = [job_id for job_id, job in batch_jobs.items() if job["task"].done()]
+    for job_id in finished[: max(0, len(batch_jobs) - BATCH_JOB_HISTORY)]:
+        del batch_jobs[job_id]
+
+
+@app.post("/generate_protocols/batch", response_model=BatchJobResponse)
+async def generate_protocols_batch(req: BatchExperimentRequest):
+    """Start generating protocols for many experiments; poll the returned job ID for results."""
+
+    if not req.requests:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one request")
+
+    prune_batch_jobs()
+    job_id = uuid.uuid4().hex
+    job = {"items": [BatchItemResult(index=i, status="queued") for i in range(len(req.requests))]}
+    batch_jobs[job_id] = job
+    job["task"] = asyncio.create_task(run_batch_job(job, req.requests))
+
+    return batch_job_response(job_id)
+
+
+@app.get("/generate_protocols/batch/{job_id}", response_model=BatchJobResponse)
+async def get_batch_job(job_id: str):
+    """Get progress and per-item results of a batch generation job."""
+
+    if job_id not in batch_jobs:
+        raise HTTPException(status_code=404, detail=f"Batch job not found: {job_id}")
+
+    return batch_job_response(job_id)
+
+
 @app.post("/validate_protocol", response_model=ValidationResponse)
 async def validate_protocol(req: ProtocolValidationRequest):
     """Validate a protocol without generating a new one."""
@@ -339,10 +542,12 @@ async def validate_protocol(req: ProtocolValidationRequest):
 
     try:
         # Save protocol temporarily for validation
-        temp_path = save_protocol(req.protocol_code, filename="temp_validation.py")
+        temp_path = save_protocol(
+            req.protocol_code, filename=f"temp_validation_{uuid.uuid4().hex}.py"
+        )
 
         # Run simulation
-        stderr = _simulate_protocol(temp_path)
+        stderr = await _simulate_protocol_async(temp_path)
 
         # Analyze results
         analysis = analyze_qc_errors(stderr)
@@ -367,77 +572,155 @@ async def validate_protocol(req: ProtocolValidationRequest):
         )
 
 
+async def upload_protocol(robot: Robot, file_data: bytes) -> Tuple[str, bool]:
+    """
+    Return the robot's protocol ID for this file and whether it had to be uploaded.
+
+    Files are keyed by content hash, so a protocol the robot already stores
+    is reused instead of uploaded again.
+    """
+    key = protocol_key(file_data)
+    protocol_id = robot.protocol_ids.get(key)
+    if protocol_id:
+        return protocol_id, False
+
+    # Concurrent sends of the same file share one upload
+    pending = robot.pending_uploads.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_upload_protocol_file(robot, file_data, key))
+        robot.pending_uploads[key] = pending
+        pending.add_done_callback(lambda _: robot.pending_uploads.pop(key, None))
+    return await asyncio.shield(pending), True
+
+
+async def _upload_protocol_file(robot: Robot, file_data: bytes, key: str) -> str:
+    files = {"files": ("protocol.py", file_data, "text/x-python")}
+
+    upload_response = await flex_request(
+        "POST", robot.url, "/protocols", files=files, data={"key": key}
+    )
+
+    if upload_response.status_code not in [200, 201]:
+        raise HTTPException(
+            status_code=upload_response.status_code,
+            detail=f"Protocol upload to {robot.name} failed: {upload_response.text}",
+        )
+
+    protocol_id = upload_response.json()["data"]["id"]
+    robot.protocol_ids[key] = protocol_id
+    return protocol_id
+
+
+async def read_protocol_file(filepath: str) -> bytes:
+    if not os.path.exists(filepath):
+        raise HTTPException(
+            status_code=400, detail=f"Protocol file not found: {filepath}"
+        )
+
+    async with aiofiles.open(filepath, "rb") as f:
+        return await f.read()
+
+
+async def release_run(robot, run_id: str):
+    """
+    Un-current a run that failed to start. An idle current run counts as
+    busy, so otherwise the robot is never picked again.
+    """
+    try:
+        response = await flex_request(
+            "PATCH", robot.url, f"/runs/{run_id}", json={"data": {"current": False}}
+        )
+        if response.status_code != 200:
+            print(f"⚠️ Couldn't release run {run_id} on {robot.name}: {response.text}")
+    except Exception as e:
+        print(f"⚠️ Couldn't release run {run_id} on {robot.name}: {e}")
+    fleet.clear_run(robot, run_id)
+
+
 @app.post("/send_to_flex")
 async def send_to_flex(req: FlexRunRequest):
-    """Send protocol to Opentrons Flex for execution."""
+    """Send protocol to an Opentrons Flex for execution (the least-loaded idle robot unless one is named)."""
 
     filepath = req.filepath
 
     try:
-        if not os.path.exists(filepath):
-            raise HTTPException(
-                status_code=400, detail=f"Protocol file not found: {filepath}"
-            )
-
         # Read protocol file
-        async with aiofiles.open(filepath, "rb") as f:
-            file_data = await f.read()
-
-        # Upload protocol to Opentrons
-        files = {"files": ("protocol.py", file_data, "text/x-python")}
-        headers = {"opentrons-version": "2"}
+        file_data = await read_protocol_file(filepath)
+
+        # Pick a robot; nothing awaits between picking and marking it busy,
+        # so concurrent sends never land on the same robot
+        if req.robot:
+            robot = fleet.get(req.robot)
+            if robot is None:
+                raise HTTPException(status_code=404, detail=f"Unknown robot: {req.robot}")
+        else:
+            robot = fleet.pick_idle()
+            if robot is None:
+                raise HTTPException(
+                    status_code=503, detail="No idle Opentrons Flex available, try again later"
+                )
+        robot.dispatching += 1
 
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            upload_response = await http_client.post(
-                f"{BASE_URL}/protocols", files=files, headers=headers
-            )
+        try:
+            # Upload protocol to Opentrons (skipped if the robot already has it)
+            protocol_id, uploaded = await upload_protocol(robot, file_data)
 
-        if upload_response.status_code not in [200, 201]:
-            raise HTTPException(
-                status_code=upload_response.status_code,
-                detail=f"Protocol upload failed: {upload_response.text}",
+            # Create run
+            run_response = await flex_request(
+                "POST", robot.url, "/runs", json={"data": {"protocolId": protocol_id}}
             )
 
-        protocol_data = upload_response.json()
-        protocol_id = protocol_data["data"]["id"]
-
-        # Create run
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            run_response = await http_client.post(
-                f"{BASE_URL}/runs",
-                json={"data": {"protocolId": protocol_id}},
-                headers=headers,
-            )
+            # The robot deleted the protocol we remembered; forget it and upload again
+            if run_response.status_code == 404 and not uploaded:
+                robot.protocol_ids.pop(protocol_key(file_data), None)
+                protocol_id, uploaded = await upload_protocol(robot, file_data)
+                run_response = await flex_request(
+                    "POST", robot.url, "/runs", json={"data": {"protocolId": protocol_id}}
+                )
 
-        if run_response.status_code != 201:
-            raise HTTPException(
-                status_code=run_response.status_code,
-                detail=f"Run creation failed: {run_response.text}",
-            )
+            if run_response.status_code != 201:
+                raise HTTPException(
+                    status_code=run_response.status_code,
+                    detail=f"Run creation failed: {run_response.text}",
+                )
 
-        run_data = run_response.json()
-        run_id = run_data["data"]["id"]
+            run_data = run_response.json()
+            run_id = run_data["data"]["id"]
+            fleet.record_run(robot, run_id, run_data["data"].get("status", "idle"))
+        finally:
+            robot.dispatching -= 1
 
         # Start run
-        async with httpx.AsyncClient(timeout=30.0) as http_client:
-            start_response = await http_client.post(
-                f"{BASE_URL}/runs/{run_id}/actions",
+        try:
+            start_response = await flex_request(
+                "POST",
+                robot.url,
+                f"/runs/{run_id}/actions",
                 json={"data": {"actionType": "play"}},
-                headers=headers,
             )
+        except Exception:
+            await release_run(robot, run_id)
+            raise
 
-        if start_response.status_code != 200:
+        if start_response.status_code not in [200, 201]:
+            await release_run(robot, run_id)
             raise HTTPException(
                 status_code=start_response.status_code,
                 detail=f"Run start failed: {start_response.text}",
             )
+        robot.current_run_status = "running"
+
+        # Watch until the run finishes so the fleet sees it end even if nobody subscribes
+        get_run_watcher(run_id, robot, until_done=True)
 
         return {
             "status": "success",
-            "message": "Protocol sent to Opentrons Flex successfully",
+            "message": f"Protocol sent to Opentrons Flex {robot.name} successfully",
             "run_id": run_id,
             "protocol_id": protocol_id,
             "protocol_name": os.path.basename(filepath),
+            "robot": robot.name,
+            "uploaded": uploaded,
         }
 
     except HTTPException:
@@ -451,6 +734,50 @@ async def send_to_flex(req: FlexRunRequest):
         )
 
 
+@app.post("/protocols/upload")
+async def upload_to_robots(req: ProtocolUploadRequest):
+    """Upload a protocol to several robots in parallel (all healthy robots by default)."""
+
+    file_data = await read_protocol_file(req.filepath)
+
+    if req.robots:
+        unknown = [name for name in req.robots if fleet.get(name) is None]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Unknown robots: {', '.join(unknown)}")
+        robots = [fleet.get(name) for name in req.robots]
+    else:
+        robots = [robot for robot in fleet.robots.values() if robot.healthy]
+
+    results = await asyncio.gather(
+        *(upload_protocol(robot, file_data) for robot in robots), return_exceptions=True
+    )
+
+    uploads = {}
+    for robot, result in zip(robots, results):
+        if isinstance(result, Exception):
+            detail = result.detail if isinstance(result, HTTPException) else str(result)
+            uploads[robot.name] = {"status": "failed", "error": detail}
+        else:
+            protocol_id, uploaded = result
+            uploads[robot.name] = {
+                "status": "success",
+                "protocol_id": protocol_id,
+                "uploaded": uploaded,
+            }
+
+    return {"protocol_name": os.path.basename(req.filepath), "uploads": uploads}
+
+
+@app.get("/robots")
+async def list_robots(refresh: bool = False):
+    """List the robots in the fleet with their health and current run."""
+
+    if refresh:
+        await fleet.refresh_all()
+
+    return {"robots": [robot.to_dict() for robot in fleet.robots.values()]}
+
+
 @app.get("/experiments/types")
 async def get_experiment_types():
     """Get list of supported experiment types with descriptions."""
@@ -512,50 +839,58 @@ async def get_experiment_types():
 async def get_run_status(run_id: str):
     """Get the status of a running protocol on Opentrons Flex."""
 
+    # Served from the run's shared watcher, so repeated polls don't each hit the robot
+    watcher = get_run_watcher(run_id, fleet.robot_for_run(run_id))
     try:
-        async with httpx.AsyncClient(timeout=10.0) as http_client:
-            response = await http_client.get(
-                f"{BASE_URL}/runs/{run_id}", headers={"opentrons-version": "2"}
-            )
-
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Failed to get run status: {response.text}",
-            )
-
-        run_data = response.json()["data"]
-
-        return FlexStatusResponse(
-            run_id=run_id,
-            status=run_data.get("status", "unknown"),
-            current_command=run_data.get("current"),
-            created_at=run_data.get("createdAt"),
-            started_at=run_data.get("startedAt"),
-            completed_at=run_data.get("completedAt"),
-        )
-
-    except HTTPException:
-        raise
+        return FlexStatusResponse(**await watcher.latest())
+    except RuntimeError as e:
+        status_code = watcher.error_status if watcher.error else 504
+        raise HTTPException(status_code=status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error getting run status: {str(e)}"
         )
 
 
+@app.get("/runs/{run_id}/events")
+async def stream_run_status(run_id: str):
+    """
+    Stream run status as Server-Sent Events, one event per change until the
+    run finishes. All viewers of a run share one upstream poll.
+    """
+
+    watcher = get_run_watcher(run_id, fleet.robot_for_run(run_id))
+
+    async def events():
+        try:
+            async for snapshot in watcher.subscribe():
+                yield f"event: status\ndata: {json.dumps(snapshot)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/runs/{run_id}/stop")
 async def stop_run(run_id: str):
     """Stop a running protocol on Opentrons Flex."""
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as http_client:
-            response = await http_client.post(
-                f"{BASE_URL}/runs/{run_id}/actions",
-                json={"data": {"actionType": "stop"}},
-                headers={"opentrons-version": "2"},
-            )
+        robot = fleet.robot_for_run(run_id)
+        response = await flex_request(
+            "POST",
+            robot.url,
+            f"/runs/{run_id}/actions",
+            json={"data": {"actionType": "stop"}},
+            timeout=10.0,
+        )
 
-        if response.status_code != 200:
+        if response.status_code not in [200, 201]:
             raise HTTPException(
                 status_code=response.status_code,
                 detail=f"Failed to stop run: {response.text}",
@@ -574,14 +909,14 @@ async def stop_run(run_id: str):
 
 
 @app.get("/protocols")
-async def list_protocols():
-    """List all available protocols on the Opentrons Flex."""
+async def list_protocols(robot: Optional[str] = None):
+    """List all available protocols on an Opentrons Flex (the default robot unless one is named)."""
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as http_client:
-            response = await http_client.get(
-                f"{BASE_URL}/protocols", headers={"opentrons-version": "2"}
-            )
+        target = fleet.get(robot) if robot else fleet.default
+        if target is None:
+            raise HTTPException(status_code=404, detail=f"Unknown robot: {robot}")
+        response = await flex_request("GET", target.url, "/protocols", timeout=10.0)
 
         if response.status_code != 200:
             raise HTTPException(
@@ -602,30 +937,39 @@ async def list_protocols():
 # ---------- Error Handlers ----------
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {
+    # Endpoints raise 404 for missing runs/jobs; keep their detail message
+    detail = getattr(exc, "detail", None)
+    if detail and detail != "Not Found":
+        return JSONResponse(status_code=404, content={"detail": detail})
+    return JSONResponse(status_code=404, content={
         "error": "endpoint_not_found",
         "message": f"The requested endpoint was not found",
         "available_endpoints": [
             "/",
             "/health",
             "/generate_protocol",
+            "/generate_protocol/stream",
+            "/generate_protocols/batch",
             "/validate_protocol",
             "/send_to_flex",
+            "/protocols/upload",
+            "/robots",
             "/experiments/types",
             "/runs/{run_id}/status",
+            "/runs/{run_id}/events",
             "/runs/{run_id}/stop",
             "/protocols",
         ],
-    }
+    })
 
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    return {
+    return JSONResponse(status_code=500, content={
         "error": "internal_server_error",
         "message": "An internal server error occurred",
         "details": str(exc) if hasattr(exc, "detail") else "Unknown error",
-    }
+    })
 
 
 # ---------- Startup/Shutdown Events ----------
@@ -633,21 +977,27 @@ async def internal_error_handler(request, exc):
 async def startup_event():
     """Initialize the application."""
     print("🚀 CornucopiaV2 Enhanced API starting up...")
-    print(f"📡 Opentrons Flex URL: {BASE_URL}")
+    for robot in fleet.robots.values():
+        print(f"📡 Opentrons Flex {robot.name}: {robot.url}")
     print(
         f"🤖 OpenAI API Key configured: {'✅' if os.getenv('OPENAI_API_KEY') else '❌'}"
     )
 
     # Test connections
-    try:
-        # Test Opentrons connection
-        async with httpx.AsyncClient(timeout=5.0) as http_client:
-            response = await http_client.get(f"{BASE_URL}/health")
-            print(
-                f"🔬 Opentrons Flex connection: {'✅ Connected' if response.status_code == 200 else '❌ Failed'}"
-            )
-    except:
-        print("🔬 Opentrons Flex connection: ❌ Failed to connect")
+    await fleet.refresh_all()
+    for robot in fleet.robots.values():
+        print(
+            f"🔬 Opentrons Flex {robot.name} connection: {'✅ Connected' if robot.healthy else '❌ Failed'}"
+        )
+
+    # One keep-alive client per robot for the app's lifetime, plus the
+    # background health/run monitor used for dispatch
+    fleet.start()
+
+    # Warm up simulator workers so the first /generate_protocol doesn't pay the Opentrons import
+    pool = get_simulator_pool()
+    pool.start()
+    print(f"🧪 Simulator workers: {pool.size}")
 
     print("✅ API ready to accept requests")
 
@@ -656,6 +1006,10 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown."""
     print("🛑 CornucopiaV2 API shutting down...")
+    get_simulator_pool().close()
+    await stop_run_watchers()
+    await fleet.stop()
+    await close_flex_clients()
     print("✅ Cleanup completed")
 
 
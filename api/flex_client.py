@@ -0,0 +1,89 @@
+"""
+Shared HTTP clients for Opentrons Flex robot-server calls.
+
+One keep-alive httpx.AsyncClient per robot base URL for the lifetime of the
+app, so calls reuse open connections instead of paying a new TCP handshake.
+
+Settings (environment variables):
+    OPENTRONS_FLEX_TIMEOUT          default request timeout in seconds (default 30)
+    OPENTRONS_FLEX_RETRIES          retries on connection errors / 502-504 (default 3)
+    OPENTRONS_FLEX_BACKOFF          first retry delay in seconds, doubled each retry (default 0.5)
+    OPENTRONS_FLEX_MAX_CONNECTIONS  connections per robot (default 10)
+"""
+import asyncio
+import os
+from typing import Optional
+
+import httpx
+
+FLEX_TIMEOUT = float(os.getenv("OPENTRONS_FLEX_TIMEOUT", "30"))
+FLEX_RETRIES = int(os.getenv("OPENTRONS_FLEX_RETRIES", "3"))
+FLEX_BACKOFF = float(os.getenv("OPENTRONS_FLEX_BACKOFF", "0.5"))
+FLEX_MAX_CONNECTIONS = int(os.getenv("OPENTRONS_FLEX_MAX_CONNECTIONS", "10"))
+FLEX_HEADERS = {"opentrons-version": "2"}
+
+# Safe to resend after the request may have reached the robot
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUS_CODES = {502, 503, 504}
+
+_clients: dict = {}
+
+
+def get_flex_client(base_url: str) -> httpx.AsyncClient:
+    """App-lifetime client for one robot, created on first use."""
+    client = _clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=FLEX_HEADERS,
+            timeout=FLEX_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=FLEX_MAX_CONNECTIONS,
+                max_keepalive_connections=FLEX_MAX_CONNECTIONS,
+            ),
+        )
+        _clients[base_url] = client
+    return client
+
+
+async def close_flex_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+async def flex_request(
+    method: str,
+    base_url: str,
+    path: str,
+    retries: Optional[int] = None,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Send a request to a robot with retry and exponential backoff.
+
+    Connection failures are retried for every method since the robot never
+    saw the request. Read timeouts and 502/503/504 are only retried for
+    idempotent methods, so a run is never created or started twice.
+    """
+    client = get_flex_client(base_url)
+    retries = FLEX_RETRIES if retries is None else retries
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+
+    for attempt in range(retries + 1):
+        last_try = attempt == retries
+        try:
+            response = await client.request(method, path, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            if last_try:
+                raise
+        except (httpx.ReadTimeout, httpx.RemoteProtocolError):
+            if last_try or not idempotent:
+                raise
+        else:
+            if last_try or not idempotent or response.status_code not in RETRY_STATUS_CODES:
+                return response
+        await asyncio.sleep(FLEX_BACKOFF * (2 ** attempt))
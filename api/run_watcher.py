@@ -0,0 +1,234 @@
+"""
+Shared watchers for runs on Opentrons Flex robots.
+
+One background task per active run polls the robot's run and command
+endpoints and fans each status snapshot out to every subscriber, so any
+number of viewers cost a single upstream poll. Commands are fetched
+incrementally with the robot-server's cursor, starting at the first
+command that hadn't finished on the previous poll.
+
+Settings (environment variables):
+    CORNUCOPIA_RUN_POLL_INTERVAL  seconds between robot polls (default 1)
+    CORNUCOPIA_RUN_WATCH_IDLE     seconds a watcher keeps polling with no
+                                  subscribers or status reads before stopping
+                                  (default 30); watchers for runs this API
+                                  started poll until the run finishes
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from api.fleet import Robot
+from api.flex_client import flex_request
+
+RUN_POLL_INTERVAL = float(os.getenv("CORNUCOPIA_RUN_POLL_INTERVAL", "1"))
+RUN_WATCH_IDLE = float(os.getenv("CORNUCOPIA_RUN_WATCH_IDLE", "30"))
+COMMAND_PAGE_LENGTH = 200
+
+TERMINAL_RUN_STATUSES = {"succeeded", "failed", "stopped"}
+FINISHED_COMMAND_STATUSES = {"succeeded", "failed"}
+
+_watchers: dict = {}  # run_id -> RunWatcher
+
+
+class RunWatcher:
+    def __init__(self, run_id: str, robot: Robot, interval: float = RUN_POLL_INTERVAL, until_done: bool = False):
+        self.run_id = run_id
+        self.robot = robot
+        self.interval = interval
+        self.until_done = until_done  # keep polling without readers, so the fleet sees the run finish
+        self.snapshot: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.error_status = 500
+        self.done = False
+        self.subscribers = 0
+        self.cursor = 0  # first command not yet seen finished
+        self.commands_finished = 0
+        self.commands_failed = 0
+        self.total_commands: Optional[int] = None
+        self.current_command: Optional[str] = None
+        self.upstream_polls = 0
+        self._last_subscriber = time.monotonic()
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def latest(self, timeout: float = 10.0) -> dict:
+        """Current snapshot, waiting for the first poll if there isn't one yet."""
+        self._last_subscriber = time.monotonic()  # a status read keeps the watcher alive too
+        if self.snapshot is None and self.error is None and not self.done:
+            try:
+                await asyncio.wait_for(self._first_poll(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.snapshot is None:
+            raise RuntimeError(self.error or f"No status for run {self.run_id} yet")
+        return self.snapshot
+
+    async def _first_poll(self):
+        while self.snapshot is None and self.error is None and not self.done:
+            await self._wait_changed()
+
+    async def _wait_changed(self):
+        self._changed.clear()
+        await self._changed.wait()
+
+    async def subscribe(self):
+        """Yield each new snapshot until the run finishes."""
+        self.subscribers += 1
+        sent = None
+        try:
+            while True:
+                if self.snapshot is not None and self.snapshot is not sent:
+                    sent = self.snapshot
+                    yield sent
+                if self.done:
+                    if self.error and sent is None:
+                        raise RuntimeError(self.error)
+                    return
+                await self._wait_changed()
+        finally:
+            self.subscribers -= 1
+            self._last_subscriber = time.monotonic()
+
+    async def _fetch_total_commands(self, protocol_id: str):
+        """Command count from the protocol's analysis, used for progress."""
+        try:
+            response = await flex_request(
+                "GET", self.robot.url, f"/protocols/{protocol_id}/analyses", timeout=10.0
+            )
+            if response.status_code == 200:
+                analyses = response.json().get("data", [])
+                if analyses and analyses[-1].get("status") == "completed":
+                    self.total_commands = len(analyses[-1].get("commands", []))
+        except Exception:
+            pass
+
+    async def _fetch_new_commands(self):
+        """Fetch commands from the cursor on and advance past finished ones."""
+        while True:
+            response = await flex_request(
+                "GET",
+                self.robot.url,
+                f"/runs/{self.run_id}/commands",
+                params={"cursor": self.cursor, "pageLength": COMMAND_PAGE_LENGTH},
+                timeout=10.0,
+            )
+            if response.status_code != 200:
+                return
+            body = response.json()
+            commands = body.get("data", [])
+            if commands:
+                self.current_command = commands[-1].get("commandType")
+            for command in commands:
+                if command.get("status") not in FINISHED_COMMAND_STATUSES:
+                    return
+                self.cursor += 1
+                self.commands_finished += 1
+                if command.get("status") == "failed":
+                    self.commands_failed += 1
+            total = body.get("meta", {}).get("totalLength", 0)
+            if len(commands) < COMMAND_PAGE_LENGTH or self.cursor >= total:
+                return
+
+    def _build_snapshot(self, run: dict) -> dict:
+        status = run.get("status", "unknown")
+        progress = None
+        if status == "succeeded":
+            progress = 1.0
+        elif self.total_commands:
+            progress = min(self.commands_finished / self.total_commands, 0.99)
+        return {
+            "run_id": self.run_id,
+            "robot": self.robot.name,
+            "status": status,
+            "current_command": self.current_command,
+            "commands_completed": self.commands_finished,
+            "commands_failed": self.commands_failed,
+            "total_commands": self.total_commands,
+            "progress": progress,
+            "created_at": run.get("createdAt"),
+            "started_at": run.get("startedAt"),
+            "completed_at": run.get("completedAt"),
+            "errors": [e.get("detail") for e in run.get("errors", [])],
+        }
+
+    def _publish(self, snapshot: dict):
+        if snapshot != self.snapshot:
+            self.snapshot = snapshot
+        self._changed.set()
+
+    async def _watch(self):
+        try:
+            while True:
+                response = await flex_request(
+                    "GET", self.robot.url, f"/runs/{self.run_id}", timeout=10.0
+                )
+                self.upstream_polls += 1
+                if response.status_code != 200:
+                    self.error = f"Failed to get run status: {response.text}"
+                    self.error_status = response.status_code
+                    return
+                run = response.json()["data"]
+
+                if self.total_commands is None and run.get("protocolId") and self.upstream_polls == 1:
+                    await self._fetch_total_commands(run["protocolId"])
+                if run.get("startedAt") or run.get("status") not in (None, "idle"):
+                    await self._fetch_new_commands()
+
+                status = run.get("status")
+                if self.robot.current_run_id == self.run_id:
+                    self.robot.current_run_status = status
+                self._publish(self._build_snapshot(run))
+
+                if status in TERMINAL_RUN_STATUSES:
+                    return
+                idle = time.monotonic() - self._last_subscriber > RUN_WATCH_IDLE
+                if not self.until_done and not self.subscribers and idle:
+                    return
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = f"Error watching run {self.run_id}: {str(e)}"
+        finally:
+            self.done = True
+            self._changed.set()
+            if _watchers.get(self.run_id) is self:
+                del _watchers[self.run_id]
+
+
+def get_run_watcher(run_id: str, robot: Robot, until_done: bool = False) -> RunWatcher:
+    """Running watcher for a run, started on first use; until_done keeps it polling until the run finishes."""
+    watcher = _watchers.get(run_id)
+    if watcher is None:
+        watcher = RunWatcher(run_id, robot, until_done=until_done)
+        _watchers[run_id] = watcher
+        watcher.start()
+    watcher.until_done = watcher.until_done or until_done
+    return watcher
+
+
+def run_watcher_stats() -> dict:
+    return {
+        run_id: {"subscribers": w.subscribers, "upstream_polls": w.upstream_polls}
+        for run_id, w in _watchers.items()
+    }
+
+
+async def stop_run_watchers():
+    watchers = list(_watchers.values())
+    _watchers.clear()
+    await asyncio.gather(*(w.stop() for w in watchers), return_exceptions=True)
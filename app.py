@@ -4,10 +4,12 @@ from openai import AsyncOpenAI
 from agents import set_default_openai_client
 from cornucopia_agents.prompt_creator import PromptCreatorAgent
 from cornucopia_agents.protocol_generator import ProtocolGeneratorAgent
-from cornucopia_agents.qc_agent import QCAgent, _simulate_protocol, _extract_missing
-from cornucopia_agents.runner import Runner
+from cornucopia_agents.qc_agent import QCAgent, _check_protocol, _extract_missing
+from cornucopia_agents.runner import Runner, clarify_prompt, generate_run_block_with_report
 from utils.io_helpers import save_protocol
 from utils.fixed_header import get_fixed_header
+from utils.simulator_pool import get_simulator_pool
+from utils.runtime_estimator import estimate_protocol_file
 
 import json
 from openai import OpenAI
@@ -36,6 +38,33 @@ set_default_openai_client(client)
 
 ensure_event_loop()
 
+@st.cache_resource
+def warm_simulator_pool():
+    """Start the simulator workers once per Streamlit server, not once per rerun."""
+    pool = get_simulator_pool()
+    pool.start()
+    return pool
+
+warm_simulator_pool()
+
+API_URL = os.getenv("CORNUCOPIA_API_URL", "http://localhost:8000")
+
+def iter_run_events(run_id):
+    """Yield status snapshots from the API's run event stream until the run ends."""
+    with httpx.stream("GET", f"{API_URL}/runs/{run_id}/events", timeout=None) as resp:
+        resp.raise_for_status()
+        event = None
+        for line in resp.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise RuntimeError(data.get("detail", "run status stream failed"))
+                if event == "end":
+                    return
+                yield data
+
 # --- UI Helper Functions ---
 def render_chat(role, message):
     avatar = "🧑" if role == "user" else "🤖"
@@ -76,6 +105,7 @@ def render_protocol(code, sent_state, experiment_type=None):
         sent_key = sent_state['sent_key']
         running_key = sent_state['running_key']
         finished_key = sent_state['finished_key']
+        run_key = f"run_{hash(code)}"
 
         col1, col2 = st.columns([1, 3])
         
@@ -89,10 +119,11 @@ def render_protocol(code, sent_state, experiment_type=None):
 
                         path = save_protocol(code, filename="generated_protocol.py")
                         resp = requests.post(
-                            "http://localhost:8000/send_to_flex",
+                            f"{API_URL}/send_to_flex",
                             json={"filepath": path}
                         )
                         if resp.status_code == 200:
+                            st.session_state[run_key] = resp.json()["run_id"]
                             st.session_state[sent_key] = True
                             st.session_state[running_key] = True
                             st.success("Protocol sent to Opentrons!")
@@ -113,32 +144,51 @@ def render_protocol(code, sent_state, experiment_type=None):
 
         if st.session_state[sent_key] and st.session_state[running_key] and not st.session_state[finished_key]:
             with st.spinner("Experiment is running on Opentrons..."):
-                import time
                 progress_bar = st.progress(0, text="Running protocol...")
-                for percent in range(0, 101, 10):
-                    progress_bar.progress(percent, text=f"Running protocol... {percent}%")
-                    time.sleep(0.15)
+                final = None
+                try:
+                    for snapshot in iter_run_events(st.session_state[run_key]):
+                        final = snapshot
+                        text = f"Running protocol... {snapshot['status']}"
+                        if snapshot.get("current_command"):
+                            text += f" · {snapshot['current_command']}"
+                        if snapshot.get("total_commands"):
+                            text += f" ({snapshot['commands_completed']}/{snapshot['total_commands']} steps)"
+                        progress_bar.progress(snapshot.get("progress") or 0.0, text=text)
+                except Exception as e:
+                    st.error(f"Lost track of the run: {e}")
                 st.session_state[running_key] = False
                 st.session_state[finished_key] = True
+                st.session_state[f"{run_key}_status"] = final["status"] if final else "unknown"
                 st.rerun()
         elif st.session_state[finished_key]:
-            st.success("✅ Experiment completed!")
+            run_status = st.session_state.get(f"{run_key}_status", "succeeded")
+            if run_status == "succeeded":
+                st.success("✅ Experiment completed!")
+            else:
+                st.warning(f"⚠️ Experiment ended with status: {run_status}")
             if st.button("🔄 Start new experiment", key=f"reset_{hash(code)}"):
                 # Reset chat and protocol state
                 st.session_state['chat_history'] = []
-                for k in [sent_key, running_key, finished_key]:
+                for k in [sent_key, running_key, finished_key, run_key, f"{run_key}_status"]:
                     st.session_state.pop(k, None)
                 st.rerun()
 
-def render_simulation_status(stderr, experiment_type=None):
+def render_simulation_status(stderr, experiment_type=None, runtime=None, checked_by="simulator"):
     with st.chat_message("assistant", avatar="🤖"):
         st.markdown("**🔍 Protocol Validation:**")
         
         if not stderr:
-            st.success("✅ Protocol simulation succeeded. No errors detected.")
+            if checked_by == "static":
+                st.success("✅ Static checks passed (tips, deck slots, volumes). Simulation was not needed.")
+            else:
+                st.success("✅ Protocol simulation succeeded. No errors detected.")
             st.markdown("*The protocol is ready for execution on the Opentrons Flex.*")
+            if runtime:
+                calibrated = "calibrated" if runtime["calibrated"] else "uncalibrated"
+                st.caption(f"⏱️ Estimated run time: ~{runtime['minutes']} min ({runtime['steps']} steps, {calibrated} model)")
         else:
-            st.error("❌ Protocol simulation failed.")
+            st.error("❌ Static checks failed." if checked_by == "static" else "❌ Protocol simulation failed.")
             
             # error analysis
             error_analysis = analyze_error(stderr)
@@ -272,107 +322,124 @@ with chat_container:
             st.session_state['pending_message'] = user_input
             st.rerun()
 
+# --- Render Chat History ---
+def render_message(msg):
+    experiment_type = msg.get('experiment_type')
+
+    if msg.get('clarification'):
+        render_clarification(msg['content'], experiment_type)
+    elif msg.get('protocol_code'):
+        render_protocol(msg['content'], msg, experiment_type)
+    elif msg.get('qc'):
+        render_simulation_status(msg['content'], experiment_type, msg.get('estimated_runtime'), msg.get('checked_by', 'simulator'))
+    else:
+        render_chat(msg['role'], msg['content'])
+
+def post_message(msg):
+    """Add a message to the history and show it right away, so each pipeline stage appears as soon as it finishes."""
+    st.session_state['chat_history'].append(msg)
+    with chat_container:
+        render_message(msg)
+
+with chat_container:
+    for msg in st.session_state['chat_history']:
+        render_message(msg)
+
 # --- Process pending messages ---
 if 'pending_message' in st.session_state:
     pending = st.session_state.pop('pending_message')
     experiment_type = get_experiment_type_from_prompt(pending)
     
-    st.session_state['chat_history'].append({
+    post_message({
         'role': 'user', 
         'content': pending,
         'experiment_type': experiment_type
     })
     
-    with st.spinner("Processing your request..."):
-        try:
-            # Step 1: Prompt clarification
-            clarify_result = Runner.run_sync(PromptCreatorAgent, pending)
-            clarified = json.loads(clarify_result.final_output)
-            confirmation = clarified["confirmation"]
-            clean_prompt = clarified["clean_prompt"]
-            
-            st.session_state['chat_history'].append({
+    try:
+        # Step 1: Prompt clarification
+        with st.spinner("Clarifying your request..."):
+            clarified = clarify_prompt(pending)
+        confirmation = clarified["confirmation"]
+        clean_prompt = clarified["clean_prompt"]
+        
+        post_message({
+            'role': 'assistant', 
+            'content': confirmation, 
+            'clarification': True,
+            'experiment_type': experiment_type
+        })
+
+        # Only run protocol generator if clean_prompt exists
+        if not clean_prompt:
+            st.warning("Please provide more details about your experiment.")
+            post_message({
                 'role': 'assistant', 
-                'content': confirmation, 
-                'clarification': True,
-                'experiment_type': experiment_type
+                'content': "Please provide more details about your experiment."
             })
-
-            # Only run protocol generator if clean_prompt exists
-            if not clean_prompt:
-                st.warning("Please provide more details about your experiment.")
-                st.session_state['chat_history'].append({
-                    'role': 'assistant', 
-                    'content': "Please provide more details about your experiment."
+        else:
+            # Step 2: Protocol generation
+            with st.spinner("Generating protocol..."):
+                agent_reply, tip_report = generate_run_block_with_report(clean_prompt)
+            if tip_report and tip_report["tips_saved"]:
+                st.caption(
+                    f"♻️ Tip optimizer: {tip_report['tips_saved']} tips saved "
+                    f"(~{tip_report['seconds_saved'] / 60:.1f} min of robot time)"
+                )
+            
+            # Step 3: Show protocol code if generated
+            if "protocol.load_instrument" in agent_reply or "pipette" in agent_reply:
+                def indent(code: str, spaces: int = 4) -> str:
+                    pad = " " * spaces
+                    return "\n".join(pad + line if line.strip() != "" else "" for line in code.splitlines())
+                
+                full_protocol = get_fixed_header().rstrip() + "\n" + indent(agent_reply)
+                
+                # Track protocol send state in session
+                sent_key = f"sent_{hash(full_protocol)}"
+                running_key = f"running_{hash(full_protocol)}"
+                finished_key = f"finished_{hash(full_protocol)}"
+                
+                for k in [sent_key, running_key, finished_key]:
+                    if k not in st.session_state:
+                        st.session_state[k] = False
+                
+                post_message({
+                    'role': 'assistant',
+                    'content': full_protocol,
+                    'protocol_code': True,
+                    'sent_key': sent_key,
+                    'running_key': running_key,
+                    'finished_key': finished_key,
+                    'experiment_type': experiment_type
                 })
-            else:
-                # Step 2: Protocol generation
-                protocol_result = Runner.run_sync(ProtocolGeneratorAgent, clean_prompt)
-                agent_reply = protocol_result.final_output.strip()
                 
-                # Step 3: Show protocol code if generated
-                if "protocol.load_instrument" in agent_reply or "pipette" in agent_reply:
-                    def indent(code: str, spaces: int = 4) -> str:
-                        pad = " " * spaces
-                        return "\n".join(pad + line if line.strip() != "" else "" for line in code.splitlines())
-                    
-                    full_protocol = get_fixed_header().rstrip() + "\n" + indent(agent_reply)
-                    
-                    # Track protocol send state in session
-                    sent_key = f"sent_{hash(full_protocol)}"
-                    running_key = f"running_{hash(full_protocol)}"
-                    finished_key = f"finished_{hash(full_protocol)}"
-                    
-                    for k in [sent_key, running_key, finished_key]:
-                        if k not in st.session_state:
-                            st.session_state[k] = False
-                    
-                    st.session_state['chat_history'].append({
-                        'role': 'assistant',
-                        'content': full_protocol,
-                        'protocol_code': True,
-                        'sent_key': sent_key,
-                        'running_key': running_key,
-                        'finished_key': finished_key,
-                        'experiment_type': experiment_type
-                    })
-                    
-                    # Save and QC
+                # Save and QC
+                with st.spinner("Simulating protocol..."):
                     path = save_protocol(full_protocol)
-                    stderr = _simulate_protocol(path)
-                    st.session_state['chat_history'].append({
-                        'role': 'assistant', 
-                        'content': stderr, 
-                        'qc': True,
-                        'experiment_type': experiment_type
-                    })
-                else:
-                    st.error("Failed to generate valid protocol code.")
-                    st.session_state['chat_history'].append({
-                        'role': 'assistant',
-                        'content': f"I had trouble generating the protocol. Here's what I got: {agent_reply}"
-                    })
-        
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-            st.session_state['chat_history'].append({
-                'role': 'assistant',
-                'content': f"Sorry, I encountered an error: {str(e)}"
-            })
-
-# --- Render Chat History ---
-with chat_container:
-    for idx, msg in enumerate(st.session_state['chat_history']):
-        experiment_type = msg.get('experiment_type')
-        
-        if msg.get('clarification'):
-            render_clarification(msg['content'], experiment_type)
-        elif msg.get('protocol_code'):
-            render_protocol(msg['content'], msg, experiment_type)
-        elif msg.get('qc'):
-            render_simulation_status(msg['content'], experiment_type)
-        else:
-            render_chat(msg['role'], msg['content'])
+                    stderr, checked_by = _check_protocol(path)
+                    runtime = estimate_protocol_file(path) if not stderr else None
+                post_message({
+                    'role': 'assistant', 
+                    'content': stderr, 
+                    'qc': True,
+                    'checked_by': checked_by,
+                    'estimated_runtime': runtime,
+                    'experiment_type': experiment_type
+                })
+            else:
+                st.error("Failed to generate valid protocol code.")
+                post_message({
+                    'role': 'assistant',
+                    'content': f"I had trouble generating the protocol. Here's what I got: {agent_reply}"
+                })
+    
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+        post_message({
+            'role': 'assistant',
+            'content': f"Sorry, I encountered an error: {str(e)}"
+        })
 
 # --- Footer ---
 st.markdown("---")
@@ -0,0 +1,91 @@
+"""
+Fit the run-time estimator (utils/runtime_estimator.py) to completed robot runs.
+
+Pulls the commands of every succeeded run from each robot in the fleet
+(robots.json, or OPENTRONS_FLEX_URL), fits the timing model to their
+measured durations and writes CORNUCOPIA_RUNTIME_MODEL (default
+runtime_model.json). The API and UI pick the new model up on their next
+estimate.
+
+    python calibrate_runtime.py                  # runs on the robots
+    python calibrate_runtime.py run1.json ...    # exported command lists instead
+"""
+import asyncio
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from api.fleet import FLEET_CONFIG, Fleet
+from api.flex_client import close_flex_clients, flex_request
+from utils.runtime_estimator import RUNTIME_MODEL_PATH, TimingModel, fit_timing_model
+
+load_dotenv()
+
+COMMANDS_PAGE_LENGTH = 200
+MAX_RUNS_PER_ROBOT = int(os.getenv("CORNUCOPIA_CALIBRATION_RUNS", "50"))
+
+
+async def fetch_run_commands(url: str, run_id: str) -> list:
+    commands, cursor = [], 0
+    while True:
+        response = await flex_request(
+            "GET", url, f"/runs/{run_id}/commands",
+            params={"cursor": cursor, "pageLength": COMMANDS_PAGE_LENGTH},
+        )
+        response.raise_for_status()
+        page = response.json()
+        commands.extend(page.get("data", []))
+        total = page.get("meta", {}).get("totalLength", 0)
+        cursor += COMMANDS_PAGE_LENGTH
+        if cursor >= total or not page.get("data"):
+            return commands
+
+
+async def fetch_fleet_runs(fleet: Fleet) -> list:
+    runs = []
+    for robot in fleet.robots.values():
+        try:
+            response = await flex_request("GET", robot.url, "/runs")
+            response.raise_for_status()
+            succeeded = [r["id"] for r in response.json().get("data", []) if r.get("status") == "succeeded"]
+            for run_id in succeeded[-MAX_RUNS_PER_ROBOT:]:
+                runs.append(await fetch_run_commands(robot.url, run_id))
+            print(f"🤖 {robot.name}: {len(succeeded[-MAX_RUNS_PER_ROBOT:])} succeeded run(s)")
+        except Exception as e:
+            print(f"⚠️ Skipping {robot.name} ({robot.url}): {e}")
+    await close_flex_clients()
+    return runs
+
+
+def load_run_files(paths: list) -> list:
+    runs = []
+    for path in paths:
+        with open(path, "r") as f:
+            data = json.load(f)
+        runs.append(data.get("data", data.get("commands", [])) if isinstance(data, dict) else data)
+    return runs
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        runs = load_run_files(sys.argv[1:])
+    else:
+        fleet = Fleet.from_config(FLEET_CONFIG, os.getenv("OPENTRONS_FLEX_URL", "http://localhost:31950"))
+        runs = asyncio.run(fetch_fleet_runs(fleet))
+    if not runs:
+        print("❌ No completed runs to calibrate from.")
+        sys.exit(1)
+
+    try:
+        model = fit_timing_model(runs, base=TimingModel())
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    model.save(RUNTIME_MODEL_PATH)
+    print(f"✅ Fitted on {model.fitted_on['runs']} run(s), {model.fitted_on['commands']} timed commands "
+          f"(mean error {model.fitted_on['mean_abs_error_s']} s per command)")
+    for name, value in model.parameters.items():
+        print(f"   {name}: {value:.4g}")
+    print(f"💾 Saved to {RUNTIME_MODEL_PATH}")
@@ -1,10 +1,16 @@
-import os.path
+import hashlib
+import json
+import os
+import re
 import subprocess
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 
 from bs4 import BeautifulSoup
 from bs4.element import Tag
-from markdownify import markdownify  # type: ignore
+from markdownify import MarkdownConverter, markdownify  # type: ignore
+
+from utils.markdown_chunker import SECTION_MARKER
 
 
 def run_sphinx_build(command: str) -> None:
@@ -15,51 +21,48 @@ def run_sphinx_build(command: str) -> None:
         print(f"An error occurred while running Sphinx build: {e}")
 
 
-def remove_specific_logos(soup: BeautifulSoup) -> BeautifulSoup:
-    """Remove specific logos from the HTML."""
-    logos = soup.find_all("img", src=lambda x: x and ("opentrons-images/website" in x))
-    for logo in logos:
-        logo.decompose()
-    return soup
+# lxml parses the singlehtml build several times faster than html.parser
+try:
+    import lxml  # type: ignore  # noqa: F401
 
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
-def remove_all_images(soup: BeautifulSoup) -> BeautifulSoup:
-    """Remove all images from the HTML."""
-    all_images = soup.find_all("img")
-    for img in all_images:
-        img.decompose()
-    return soup
+# Processes for converting doc sections (default: one per CPU)
+CONVERT_WORKERS = int(os.getenv("CORNUCOPIA_CONVERT_WORKERS", "0")) or os.cpu_count() or 1
 
+# Converted sections are cached here by the hash of their HTML; bump
+# CONVERTER_VERSION when a conversion change should invalidate them
+SECTION_CACHE_DIR = os.path.join(os.path.dirname(__file__), "build", "markdown_cache")
+CONVERTER_VERSION = "2"
 
-def remove_pilcrow_symbols(soup: BeautifulSoup) -> BeautifulSoup:
-    """Remove all pilcrow symbols from the HTML."""
-    pilcrow_symbols = soup.find_all("a", string="¶")
-    for symbol in pilcrow_symbols:
-        symbol.decompose()
-    return soup
+PLACEHOLDER_PREFIX = "tabSectionIs"
+PLACEHOLDER_RE = re.compile(PLACEHOLDER_PREFIX + r"[0-9a-f]{32}")
 
 
-def remove_list_items_containing_ot1(soup: BeautifulSoup) -> BeautifulSoup:
-    """Remove all <li> elements containing 'OT-1'."""
-    list_items = soup.find_all("li")
-    for li in list_items:
-        if "OT-1" in li.get_text():
-            li.decompose()
-    return soup
+def is_removable(tag: Tag) -> bool:
+    """Whether clean_html drops this tag (and everything inside it)."""
+    # Images, including the Opentrons website logos
+    if tag.name == "img":
+        return True
+    # Pilcrow symbols (header permalinks)
+    if tag.name == "a" and tag.string == "¶":
+        return True
+    # List items about the OT-1
+    if tag.name == "li" and "OT-1" in tag.get_text():
+        return True
+    return False
 
 
-def remove_top_section(soup: BeautifulSoup) -> BeautifulSoup:
+def remove_top_section(soup: BeautifulSoup, start_section, head_tag) -> BeautifulSoup:
     """Remove everything before a Python API docs header section."""
-    # Remove everything before the <div class="document"> element
-    start_section = soup.find("div", class_="document")
-
     # Check if the section was found
-    if not start_section:
+    if not isinstance(start_section, Tag):
         print("Start section not found in the HTML content.")
         return soup
 
-    # Find the head tag and remove it
-    head_tag = soup.find("head")
+    # Remove the head tag
     if isinstance(head_tag, Tag):
         head_tag.decompose()
 
@@ -77,102 +80,225 @@ def remove_top_section(soup: BeautifulSoup) -> BeautifulSoup:
     return soup
 
 
-def remove_footer_content(soup: BeautifulSoup) -> BeautifulSoup:
-    """Remove the footer content from the HTML."""
-    footer_section = soup.find("footer")
+def clean_html(soup: BeautifulSoup) -> BeautifulSoup:
+    """
+    Clean up the unused features in the HTML file in a single walk over the
+    tree: drop images, pilcrows and OT-1 list items, and note the head,
+    the <div class="document"> start section and the footer on the way.
+    """
+    head_tag = start_section = footer_section = None
+    for tag in soup.find_all(True):
+        if tag.decomposed:  # inside a tag removed earlier in the walk
+            continue
+        if is_removable(tag):
+            tag.decompose()
+        elif tag.name == "head" and head_tag is None:
+            head_tag = tag
+        elif tag.name == "div" and start_section is None and "document" in (tag.get("class") or []):
+            start_section = tag
+        elif tag.name == "footer" and footer_section is None:
+            footer_section = tag
+
+    # Everything before <div class="document"> goes
+    soup = remove_top_section(soup, start_section, head_tag)
     if isinstance(footer_section, Tag):
         footer_section.decompose()
     return soup
 
 
-def clean_html(soup: BeautifulSoup) -> BeautifulSoup:
-    """Clean up the unused features in the HTML file."""
-    soup = remove_specific_logos(soup)
-    soup = remove_all_images(soup)
-    soup = remove_pilcrow_symbols(soup)
-    soup = remove_list_items_containing_ot1(soup)
-    soup = remove_top_section(soup)
-    soup = remove_footer_content(soup)
-    return soup
-
-
-def extract_and_remove_api_reference(html_file_path: str, output_file_path: str) -> BeautifulSoup:
-    """Extract and remove the API Version 2 Reference section and write it to a Markdown file."""
-
-    with open(html_file_path, "r", encoding="utf-8") as file:
-        html_content = file.read()
-
-    soup = BeautifulSoup(html_content, "html.parser")
-    soup = clean_html(soup)
-
+def extract_and_remove_api_reference(soup: BeautifulSoup) -> tuple[BeautifulSoup, str | None]:
+    """Cut the API Version 2 Reference section out of the soup and return its HTML."""
     # Find the start and end points
     start_span = soup.find("span", id="document-new_protocol_api")
     if start_span is None:
         print("Start span not found.")
-        return soup
+        return soup, None
 
     # Get the section to keep
     api_section = start_span.find_next_sibling("section", id="api-version-2-reference")
     if api_section is None:
         print("API section not found.")
-        return soup
+        return soup, None
 
-    # Create a BeautifulSoup object for the extracted section
     extracted_html = str(start_span) + str(api_section)
-    reference_markdown = markdownify(extracted_html)
-
-    # Write the extracted content to a Markdown file
-    with open(output_file_path, "w", encoding="utf-8") as file:
-        file.write(reference_markdown)
 
     # Remove it from the main markdown file
     if isinstance(start_span, Tag) and isinstance(api_section, Tag):
         start_span.decompose()
         api_section.decompose()
 
-    return soup
+    return soup, extracted_html
 
 
-def extract_tab_content(soup: BeautifulSoup) -> tuple[BeautifulSoup, dict[str, str]]:
-    """Find all tabbed content sections and convert each tabbed section to markdown format."""
+def extract_tab_content(soup: BeautifulSoup) -> tuple[BeautifulSoup, list[tuple[str, list[tuple[str, str]]]]]:
+    """
+    Replace every tabbed content section with a unique placeholder.
+    Returns the sections as (placeholder, [(tab title, panel HTML)]) for conversion.
+    """
     tab_sections = soup.find_all(class_="sphinx-tabs docutils container")
-    tab_markdown = {}
+    sections = []
 
-    for _idx, tab_section in enumerate(tab_sections):
+    for tab_section in tab_sections:
         tab_buttons = tab_section.find_all(class_="sphinx-tabs-tab")
         tab_panels = tab_section.find_all(class_="sphinx-tabs-panel")
-
-        section_markdown = []
-        for button, panel in zip(tab_buttons, tab_panels, strict=False):
-            section_markdown.append(f"### {button.text.strip()}\n")
-            panel_content = markdownify(str(panel), strip=["div"])
-            section_markdown.append(panel_content)
-        combined_section_markdown = "\n".join(section_markdown) + "\n\n"
+        tabs = [
+            (button.text.strip(), str(panel))
+            for button, panel in zip(tab_buttons, tab_panels, strict=False)
+        ]
         # Replace the original tab section with an unique placeholder in the soup
-        placeholder = f"tabSectionIs{uuid.uuid4().hex}"
-        tab_markdown[placeholder] = combined_section_markdown
+        placeholder = f"{PLACEHOLDER_PREFIX}{uuid.uuid4().hex}"
+        sections.append((placeholder, tabs))
         placeholder_tag = soup.new_tag("div")
         placeholder_tag.string = placeholder
         tab_section.replace_with(placeholder_tag)
 
-    return soup, tab_markdown
-
+    return soup, sections
 
-def convert_html_to_markdown(html_file_path: str, markdown_file_path: str, reference_file_path: str) -> None:
-    """Converts an HTML file to a Markdown file with specific modifications."""
 
-    soup = extract_and_remove_api_reference(html_file_path, reference_file_path)
-    soup, tab_markdown = extract_tab_content(soup)
+def combine_tab_sections(sections: list[tuple[str, list[tuple[str, str]]]]) -> dict[str, str]:
+    """Placeholder -> markdown of its tab section."""
+    tab_markdown = {}
+    for placeholder, tabs in sections:
+        section_markdown = []
+        for title, panel in tabs:
+            section_markdown.append(f"### {title}\n")
+            section_markdown.append(markdownify(panel, strip=["div"]))
+        tab_markdown[placeholder] = "\n".join(section_markdown) + "\n\n"
+    return tab_markdown
+
+
+def substitute_placeholders(markdown: str, tab_markdown: dict[str, str]) -> str:
+    """Put the tab sections back in a single pass over the markdown."""
+    return PLACEHOLDER_RE.sub(lambda m: tab_markdown.get(m.group(0), m.group(0)), markdown)
+
+
+def section_to_markdown(section_html: str) -> str:
+    """Convert one doc section, tabs included (runs in the process pool)."""
+    soup = BeautifulSoup(section_html, HTML_PARSER)
+    soup, tab_sections = extract_tab_content(soup)
+    # Converting the soup directly skips serializing and re-parsing it
+    markdown = MarkdownConverter().convert_soup(soup)
+    return substitute_placeholders(markdown, combine_tab_sections(tab_sections))
+
+
+def split_html_sections(soup: BeautifulSoup) -> list[tuple[str, str]]:
+    """
+    Split the cleaned build into its source documents: (section ID, HTML).
+    singlehtml marks where each document starts with <span id="document-...">;
+    anything before the first marker belongs to the index document.
+    """
+    first_marker = soup.find("span", id=lambda x: x and x.startswith("document-"))
+    container = first_marker.parent if first_marker is not None else (soup.body or soup)
+
+    sections: list[tuple[str, list[str]]] = [("document-index", [])]
+    for child in container.children:
+        child_id = child.get("id", "") if isinstance(child, Tag) else ""
+        if child.name == "span" and child_id.startswith("document-"):
+            sections.append((child_id, []))
+        sections[-1][1].append(str(child))
+    return [(section_id, "".join(parts)) for section_id, parts in sections if "".join(parts).strip()]
+
+
+def section_hash(section_html: str) -> str:
+    return hashlib.sha256(f"{CONVERTER_VERSION}\n{section_html}".encode("utf-8")).hexdigest()
+
+
+def convert_sections(
+    sections: list[tuple[str, str]], cache_dir: str, pool: ProcessPoolExecutor
+) -> list[tuple[str, str, str]]:
+    """
+    Markdown for each (section ID, HTML): (section ID, hash, markdown).
+    Sections already in the cache are read back; only the rest are converted.
+    """
+    hashes = [section_hash(html) for _, html in sections]
+    markdown: dict[str, str] = {}
+    missing = []
+    for (_, html), digest in zip(sections, hashes):
+        path = os.path.join(cache_dir, f"{digest}.md")
+        if digest in markdown:
+            continue
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                markdown[digest] = file.read()
+        else:
+            markdown[digest] = ""
+            missing.append((digest, html))
+
+    converted = pool.map(section_to_markdown, [html for _, html in missing])
+    for (digest, _), section_markdown in zip(missing, converted):
+        markdown[digest] = section_markdown
+        with open(os.path.join(cache_dir, f"{digest}.md"), "w", encoding="utf-8") as file:
+            file.write(section_markdown)
+
+    print(f"♻️ {len(sections) - len(missing)}/{len(sections)} sections cached, {len(missing)} converted")
+    return [(section_id, digest, markdown[digest]) for (section_id, _), digest in zip(sections, hashes)]
+
+
+def sections_file_path(markdown_file_path: str) -> str:
+    return os.path.splitext(markdown_file_path)[0] + ".sections.json"
+
+
+def write_markdown_sections(markdown_file_path: str, sections: list[tuple[str, str, str]]) -> list[str]:
+    """
+    Write the markdown, one marker line per section, and the sections file
+    next to it listing the section hashes and which sections changed since
+    the previous conversion (create_index.py re-chunks only those).
+    Returns the changed section IDs.
+    """
+    full_markdown = "\n\n".join(
+        SECTION_MARKER.format(section_id) + "\n\n" + markdown for section_id, _, markdown in sections
+    )
+    with open(markdown_file_path, "w", encoding="utf-8") as file:
+        file.write(full_markdown)
 
-    modified_html_content = str(soup)
-    full_markdown = markdownify(modified_html_content)
+    previous = None
+    if os.path.exists(sections_file_path(markdown_file_path)):
+        with open(sections_file_path(markdown_file_path), "r", encoding="utf-8") as file:
+            previous = json.load(file)
+    old_hashes = {section["id"]: section["sha256"] for section in previous["sections"]} if previous else {}
+
+    changed = [section_id for section_id, digest, _ in sections if old_hashes.get(section_id) != digest]
+    current_ids = {section_id for section_id, _, _ in sections}
+    record = {
+        "source": os.path.basename(markdown_file_path),
+        "sha256": hashlib.sha256(full_markdown.encode("utf-8")).hexdigest(),
+        # The file the changes are relative to; None on the first conversion
+        "base_sha256": previous["sha256"] if previous else None,
+        "sections": [{"id": section_id, "sha256": digest} for section_id, digest, _ in sections],
+        "changed": changed,
+        "removed": [section_id for section_id in old_hashes if section_id not in current_ids],
+    }
+    with open(sections_file_path(markdown_file_path), "w", encoding="utf-8") as file:
+        json.dump(record, file, indent=2)
+    return changed
+
+
+def convert_html_to_markdown(
+    html_file_path: str, markdown_file_path: str, reference_file_path: str, cache_dir: str = SECTION_CACHE_DIR
+) -> dict[str, list[str]]:
+    """
+    Converts an HTML file to a Markdown file with specific modifications.
+    Each source document in the build is converted separately and cached by
+    the hash of its HTML, so a new docs build only converts the sections that
+    changed. Returns the changed section IDs of each written file.
+    """
+    with open(html_file_path, "r", encoding="utf-8") as file:
+        html_content = file.read()
 
-    for placeholder, section_md in tab_markdown.items():
-        if placeholder in full_markdown:
-            full_markdown = full_markdown.replace(placeholder, section_md)
+    soup = clean_html(BeautifulSoup(html_content, HTML_PARSER))
+    soup, reference_html = extract_and_remove_api_reference(soup)
+    outputs = [(markdown_file_path, split_html_sections(soup))]
+    if reference_html:
+        outputs.append((reference_file_path, [("document-new_protocol_api", reference_html)]))
 
-    with open(markdown_file_path, "w", encoding="utf-8") as file:
-        file.write(full_markdown)
+    os.makedirs(cache_dir, exist_ok=True)
+    changed = {}
+    # Sections convert in parallel, one per pool task
+    with ProcessPoolExecutor(max_workers=CONVERT_WORKERS) as pool:
+        for path, sections in outputs:
+            changed[path] = write_markdown_sections(path, convert_sections(sections, cache_dir, pool))
+            print(f"📝 {os.path.basename(path)}: {len(changed[path])} changed sections")
+    return changed
 
 
 def get_latest_version() -> str:
@@ -192,8 +318,11 @@ def get_latest_version() -> str:
         return ""
 
 
-def get_markdown_format() -> None:
-    """Generates a version-aware Markdown file from HTML documentation."""
+def get_markdown_format() -> dict[str, list[str]]:
+    """
+    Generates a version-aware Markdown file from HTML documentation.
+    Returns the changed section IDs of each file (also in its .sections.json).
+    """
     current_version = get_latest_version()
     current_dir = os.path.dirname(__file__)
 
@@ -207,7 +336,7 @@ def get_markdown_format() -> None:
 
     run_sphinx_build(command)
 
-    convert_html_to_markdown(html_file_path, markdown_file_path, reference_file_path)
+    return convert_html_to_markdown(html_file_path, markdown_file_path, reference_file_path)
 
 
 if __name__ == "__main__":
@@ -9,7 +9,10 @@ def clarify_experiment_request(raw: str) -> str:
     but preserves any specific information the user provides.
     Returns a JSON string with keys: confirmation, clean_prompt.
     """
-    
+    return _clarify_experiment_request(raw)
+
+# ✅ Raw callable version for direct use (fast path in runner.py)
+def _clarify_experiment_request(raw: str) -> str:
     prompt = raw.strip()
     lower_prompt = prompt.lower()
     
@@ -1,5 +1,21 @@
 from agents import Agent, function_tool, ModelSettings
+from cornucopia_agents.protocol_ir import (
+    Comment,
+    Delay,
+    Labware,
+    Note,
+    Pipette,
+    ProtocolPlan,
+    Reagent,
+    Repeat,
+    Transfer,
+    TrashBin,
+    Wells,
+    compile_protocol,
+    optimize_plan,
+)
 from utils.fixed_header import get_fixed_header
+from utils.tip_optimizer import OPTIMIZE_TIPS
 import re
 import json
 
@@ -9,11 +25,28 @@ def generate_general_protocol(clean_prompt: str) -> str:
     Generates Opentrons protocol code for various types of experiments based on the clean prompt.
     Supports serial dilutions, PCR setup, plate washing, sample transfers, and more.
     """
-    
+    return _generate_general_protocol(clean_prompt)
+
+# ✅ Raw callable version for direct use (fast path in runner.py)
+def _generate_general_protocol(clean_prompt: str) -> str:
+    return generate_protocol_with_report(clean_prompt)[0]
+
+
+def generate_protocol_with_report(clean_prompt: str):
+    """
+    (run block, optimization report): the experiment's plan after the
+    protocol_ir passes, compiled to code. Tip reuse follows CORNUCOPIA_OPTIMIZE_TIPS.
+    """
+    plan = build_protocol_plan(clean_prompt)
+    report = optimize_plan(plan, tip_reuse=OPTIMIZE_TIPS)
+    return compile_protocol(plan), report
+
+
+def build_protocol_plan(clean_prompt: str) -> ProtocolPlan:
     # Parse experiment type and parameters from the prompt
     experiment_info = parse_experiment_details(clean_prompt)
     
-    # Generate appropriate protocol code based on experiment type
+    # Build the plan for the experiment type
     if experiment_info["type"] == "serial_dilution":
         return generate_serial_dilution_protocol(experiment_info)
     elif experiment_info["type"] == "pcr_setup":
@@ -97,8 +130,9 @@ def parse_experiment_details(prompt: str) -> dict:
     elif "8-channel" in prompt_lower or "multi" in prompt_lower:
         info["pipette_type"] = "flex_8channel_1000"
     
-    if "50ul" in prompt_lower or "50 ul" in prompt_lower:
-        info["pipette_type"] = "flex_8channel_50"
+    if re.search(r'(?<![\d.])50\s?ul', prompt_lower):  # not "150 ul"
+        # Same channel count, 50 µL model
+        info["pipette_type"] = info["pipette_type"].rsplit("_", 1)[0] + "_50"
         info["tip_type"] = "opentrons_flex_96_tiprack_50ul"
     
     # Extract plate preferences
@@ -106,275 +140,211 @@ def parse_experiment_details(prompt: str) -> dict:
         info["plate_type"] = "nest_96_wellplate_100ul_pcr_full_skirt"
     elif "384" in prompt_lower:
         info["plate_type"] = "corning_384_wellplate_112ul_flat"
+
+    # One sample per well: more than the plate holds can't be addressed
+    plate_wells = Labware("plate", info["plate_type"], "").well_count or 96
+    num_samples = min(max(info["num_samples"], 1), plate_wells)
+    if num_samples != info["num_samples"]:
+        print(f"⚠️ {info['num_samples']} samples don't fit a {plate_wells}-well plate; using {num_samples}")
+        info["num_samples"] = num_samples
     
     return info
 
-def generate_serial_dilution_protocol(info: dict) -> str:
-    """Generate serial dilution protocol code."""
+def base_plan(info: dict, header: list, plates: list, reagents: list, source: str = None) -> ProtocolPlan:
+    """
+    Plan with the deck every template shares: the pipette and its tip rack
+    in A1, `plates` as (var, load_name, slot), the trash in D1, and
+    `reagents` (names of wells 0, 1, ... of the `source` labware).
+    """
+    tiprack = Labware("tiprack", info["tip_type"], "A1")
+    labware = [tiprack] + [Labware(var, load_name, slot) for var, load_name, slot in plates]
+    pipette = Pipette("pipette", info["pipette_type"], info["pipette_mount"], [tiprack])
+    source_labware = next((lw for lw in labware if lw.var == source), None)
+    return ProtocolPlan(
+        header=header,
+        pipettes=[pipette],
+        labware=labware,
+        trash=TrashBin("trash", "D1"),
+        reagents=[Reagent(name, source_labware, well) for well, name in enumerate(reagents)],
+        steps=[],
+    )
+
+
+def plan_parts(plan: ProtocolPlan):
+    """(pipette, labware by var, reagents by var) for building steps."""
+    return (
+        plan.pipettes[0],
+        {labware.var: labware for labware in plan.labware},
+        {reagent.var: reagent for reagent in plan.reagents},
+    )
+
+
+def generate_serial_dilution_protocol(info: dict) -> ProtocolPlan:
+    """Plan for a serial dilution protocol."""
     
     # Determine if using 8-channel (row-wise) or 1-channel (well-wise)
     is_multichannel = "8channel" in info["pipette_type"]
+    steps = info["num_dilutions"]
+
+    plan = base_plan(
+        info,
+        [
+            "Serial Dilution Protocol",
+            f'Type: {info["type"]}, Samples: {info["num_samples"]}, Volume: {info["volume"]}µL',
+            f'Dilution: 1:{info["dilution_factor"]}, Steps: {steps}',
+        ],
+        [("plate", info["plate_type"], "D2"), ("trough", info["source_labware"], "B2")],
+        ["diluent", "sample"],
+        source="trough",
+    )
+    pipette, labware, reagents = plan_parts(plan)
+    plate = labware["plate"]
+
+    # 8-channel: one column per dilution step (row A), 1-channel: one well
+    def positions(start, stop):
+        return Wells(plate, start, stop, by_column=is_multichannel)
+
+    plan.steps = [
+        Note(f"Add diluent to wells A2–A{steps + 1} (8-channel, row-wise)" if is_multichannel
+             else "Add diluent to wells (1-channel, individual wells)"),
+        Transfer(pipette, info["volume"], reagents["diluent"], positions(1, steps + 1)),
+        Note("Add sample to first well A1" if is_multichannel else "Add sample to first well"),
+        Transfer(pipette, info["volume"], reagents["sample"], positions(0, 1)),
+        Note(f"Serial dilution across A1 to A{steps + 1}" if is_multichannel else "Serial dilution"),
+        Transfer(pipette, info["volume"], positions(0, steps), positions(1, steps + 1), mix=(3, info["volume"])),
+    ]
+    return plan
+
+PCR_PLATE = "nest_96_wellplate_100ul_pcr_full_skirt"
+
+
+def generate_pcr_setup_protocol(info: dict) -> ProtocolPlan:
+    """Plan for a PCR setup protocol."""
     
-    header = f"""# Serial Dilution Protocol
-# Type: {info["type"]}, Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-# Dilution: 1:{info["dilution_factor"]}, Steps: {info["num_dilutions"]}
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-plate = protocol.load_labware("{info["plate_type"]}", "D2")
-trough = protocol.load_labware("{info["source_labware"]}", "B2")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-diluent = trough.wells()[0]
-sample = trough.wells()[1]
-"""
-
-    if is_multichannel:
-        protocol_body = f"""
-# Add diluent to wells A2–A{info["num_dilutions"]+1} (8-channel, row-wise)
-for well in plate.rows()[0][1:{info["num_dilutions"]+1}]:
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"]}, diluent)
-    pipette.dispense({info["volume"]}, well)
-    pipette.drop_tip()
-
-# Add sample to first well A1
-pipette.pick_up_tip()
-pipette.aspirate({info["volume"]}, sample)
-pipette.dispense({info["volume"]}, plate.rows()[0][0])
-pipette.drop_tip()
-
-# Serial dilution across A1 to A{info["num_dilutions"]+1}
-for i in range({info["num_dilutions"]}):
-    source = plate.rows()[0][i]
-    dest = plate.rows()[0][i+1]
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"]}, source)
-    pipette.dispense({info["volume"]}, dest)
-    pipette.mix(3, {info["volume"]}, dest)
-    pipette.drop_tip()
-"""
-    else:
-        protocol_body = f"""
-# Add diluent to wells (1-channel, individual wells)
-for i in range(1, {info["num_dilutions"]+1}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"]}, diluent)
-    pipette.dispense({info["volume"]}, plate.wells()[i])
-    pipette.drop_tip()
-
-# Add sample to first well
-pipette.pick_up_tip()
-pipette.aspirate({info["volume"]}, sample)
-pipette.dispense({info["volume"]}, plate.wells()[0])
-pipette.drop_tip()
-
-# Serial dilution
-for i in range({info["num_dilutions"]}):
-    source = plate.wells()[i]
-    dest = plate.wells()[i+1]
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"]}, source)
-    pipette.dispense({info["volume"]}, dest)
-    pipette.mix(3, {info["volume"]}, dest)
-    pipette.drop_tip()
-"""
+    plan = base_plan(
+        info,
+        ["PCR Setup Protocol", f'Samples: {info["num_samples"]}, Volume: {info["volume"]}µL'],
+        [("pcr_plate", PCR_PLATE, "D2"), ("reagent_plate", info["source_labware"], "B2")],
+        ["master_mix", "primer_mix", "template"],
+        source="reagent_plate",
+    )
+    pipette, labware, reagents = plan_parts(plan)
+    samples = Wells(labware["pcr_plate"], 0, info["num_samples"])
+    plan.steps = [
+        Note("Distribute master mix"),
+        Transfer(pipette, info["volume"] * 0.7, reagents["master_mix"], samples),
+        Note("Add primer mix"),
+        Transfer(pipette, info["volume"] * 0.2, reagents["primer_mix"], samples),
+        Note("Add template DNA"),
+        Transfer(pipette, info["volume"] * 0.1, reagents["template"], samples, mix=(3, info["volume"] * 0.5)),
+    ]
+    return plan
+
+def generate_plate_washing_protocol(info: dict) -> ProtocolPlan:
+    """Plan for a plate washing protocol."""
     
-    return header + protocol_body
-
-def generate_pcr_setup_protocol(info: dict) -> str:
-    """Generate PCR setup protocol code."""
+    plan = base_plan(
+        info,
+        ["Plate Washing Protocol", f'Samples: {info["num_samples"]}, Volume: {info["volume"]}µL'],
+        [("plate", info["plate_type"], "D2"), ("trough", info["source_labware"], "B2")],
+        ["wash_buffer"],
+        source="trough",
+    )
+    pipette, labware, reagents = plan_parts(plan)
+    samples = Wells(labware["plate"], 0, info["num_samples"])
+    plan.steps = [
+        Note("Wash cycle (3 times)"),
+        Repeat(3, [
+            Note("Add wash buffer"),
+            Transfer(pipette, info["volume"], reagents["wash_buffer"], samples),
+            Note("Incubate"),
+            Delay(2),
+            Note("Remove wash buffer"),
+            Transfer(pipette, info["volume"], samples, plan.trash),
+        ]),
+    ]
+    return plan
+
+def generate_sample_transfer_protocol(info: dict) -> ProtocolPlan:
+    """Plan for a sample transfer protocol."""
     
-    return f"""# PCR Setup Protocol
-# Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-pcr_plate = protocol.load_labware("nest_96_wellplate_100ul_pcr_full_skirt", "D2")
-reagent_plate = protocol.load_labware("{info["source_labware"]}", "B2")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-master_mix = reagent_plate.wells()[0]
-primer_mix = reagent_plate.wells()[1]
-template = reagent_plate.wells()[2]
-
-# Distribute master mix
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.7}, master_mix)
-    pipette.dispense({info["volume"] * 0.7}, pcr_plate.wells()[i])
-    pipette.drop_tip()
-
-# Add primer mix
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.2}, primer_mix)
-    pipette.dispense({info["volume"] * 0.2}, pcr_plate.wells()[i])
-    pipette.drop_tip()
-
-# Add template DNA
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.1}, template)
-    pipette.dispense({info["volume"] * 0.1}, pcr_plate.wells()[i])
-    pipette.mix(3, {info["volume"] * 0.5}, pcr_plate.wells()[i])
-    pipette.drop_tip()
-"""
-
-def generate_plate_washing_protocol(info: dict) -> str:
-    """Generate plate washing protocol code."""
+    plan = base_plan(
+        info,
+        ["Sample Transfer Protocol", f'Samples: {info["num_samples"]}, Volume: {info["volume"]}µL'],
+        [("source_plate", info["plate_type"], "D2"), ("dest_plate", info["plate_type"], "D3")],
+        [],
+    )
+    pipette, labware, _ = plan_parts(plan)
+    plan.steps = [
+        Note("Transfer samples from source to destination"),
+        Transfer(
+            pipette, info["volume"],
+            Wells(labware["source_plate"], 0, info["num_samples"]),
+            Wells(labware["dest_plate"], 0, info["num_samples"]),
+        ),
+    ]
+    return plan
+
+def generate_cell_culture_protocol(info: dict) -> ProtocolPlan:
+    """Plan for a cell culture protocol."""
     
-    return f"""# Plate Washing Protocol
-# Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-plate = protocol.load_labware("{info["plate_type"]}", "D2")
-trough = protocol.load_labware("{info["source_labware"]}", "B2")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-wash_buffer = trough.wells()[0]
-
-# Wash cycle (3 times)
-for cycle in range(3):
-    # Add wash buffer
-    for i in range({info["num_samples"]}):
-        pipette.pick_up_tip()
-        pipette.aspirate({info["volume"]}, wash_buffer)
-        pipette.dispense({info["volume"]}, plate.wells()[i])
-        pipette.drop_tip()
+    plan = base_plan(
+        info,
+        ["Cell Culture Protocol", f'Samples: {info["num_samples"]}, Volume: {info["volume"]}µL'],
+        [("culture_plate", info["plate_type"], "D2"), ("trough", info["source_labware"], "B2")],
+        ["media", "cells"],
+        source="trough",
+    )
+    pipette, labware, reagents = plan_parts(plan)
+    samples = Wells(labware["culture_plate"], 0, info["num_samples"])
+    plan.steps = [
+        Note("Add media to wells"),
+        Transfer(pipette, info["volume"] * 0.8, reagents["media"], samples),
+        Note("Add cells"),
+        Transfer(pipette, info["volume"] * 0.2, reagents["cells"], samples, mix=(3, info["volume"] * 0.4)),
+    ]
+    return plan
+
+def generate_enzyme_assay_protocol(info: dict) -> ProtocolPlan:
+    """Plan for an enzyme assay protocol."""
     
-    # Incubate
-    protocol.delay(minutes=2)
+    plan = base_plan(
+        info,
+        ["Enzyme Assay Protocol", f'Samples: {info["num_samples"]}, Volume: {info["volume"]}µL'],
+        [("assay_plate", info["plate_type"], "D2"), ("trough", info["source_labware"], "B2")],
+        ["substrate", "enzyme", "buffer"],
+        source="trough",
+    )
+    pipette, labware, reagents = plan_parts(plan)
+    samples = Wells(labware["assay_plate"], 0, info["num_samples"])
+    plan.steps = [
+        Note("Add buffer"),
+        Transfer(pipette, info["volume"] * 0.6, reagents["buffer"], samples),
+        Note("Add substrate"),
+        Transfer(pipette, info["volume"] * 0.3, reagents["substrate"], samples),
+        Note("Add enzyme to start reaction"),
+        Transfer(pipette, info["volume"] * 0.1, reagents["enzyme"], samples, mix=(2, info["volume"] * 0.3)),
+    ]
+    return plan
+
+def generate_generic_protocol(info: dict) -> ProtocolPlan:
+    """Plan for a generic protocol (unrecognized experiment types)."""
     
-    # Remove wash buffer
-    for i in range({info["num_samples"]}):
-        pipette.pick_up_tip()
-        pipette.aspirate({info["volume"]}, plate.wells()[i])
-        pipette.dispense({info["volume"]}, trash)
-        pipette.drop_tip()
-"""
-
-def generate_sample_transfer_protocol(info: dict) -> str:
-    """Generate sample transfer protocol code."""
-    
-    return f"""# Sample Transfer Protocol
-# Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-source_plate = protocol.load_labware("{info["plate_type"]}", "D2")
-dest_plate = protocol.load_labware("{info["plate_type"]}", "D3")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-# Transfer samples from source to destination
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"]}, source_plate.wells()[i])
-    pipette.dispense({info["volume"]}, dest_plate.wells()[i])
-    pipette.drop_tip()
-"""
-
-def generate_cell_culture_protocol(info: dict) -> str:
-    """Generate cell culture protocol code."""
-    
-    return f"""# Cell Culture Protocol
-# Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-culture_plate = protocol.load_labware("{info["plate_type"]}", "D2")
-trough = protocol.load_labware("{info["source_labware"]}", "B2")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-media = trough.wells()[0]
-cells = trough.wells()[1]
-
-# Add media to wells
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.8}, media)
-    pipette.dispense({info["volume"] * 0.8}, culture_plate.wells()[i])
-    pipette.drop_tip()
-
-# Add cells
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.2}, cells)
-    pipette.dispense({info["volume"] * 0.2}, culture_plate.wells()[i])
-    pipette.mix(3, {info["volume"] * 0.4}, culture_plate.wells()[i])
-    pipette.drop_tip()
-"""
-
-def generate_enzyme_assay_protocol(info: dict) -> str:
-    """Generate enzyme assay protocol code."""
-    
-    return f"""# Enzyme Assay Protocol
-# Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-assay_plate = protocol.load_labware("{info["plate_type"]}", "D2")
-trough = protocol.load_labware("{info["source_labware"]}", "B2")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-substrate = trough.wells()[0]
-enzyme = trough.wells()[1]
-buffer = trough.wells()[2]
-
-# Add buffer
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.6}, buffer)
-    pipette.dispense({info["volume"] * 0.6}, assay_plate.wells()[i])
-    pipette.drop_tip()
-
-# Add substrate
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.3}, substrate)
-    pipette.dispense({info["volume"] * 0.3}, assay_plate.wells()[i])
-    pipette.drop_tip()
-
-# Add enzyme to start reaction
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"] * 0.1}, enzyme)
-    pipette.dispense({info["volume"] * 0.1}, assay_plate.wells()[i])
-    pipette.mix(2, {info["volume"] * 0.3}, assay_plate.wells()[i])
-    pipette.drop_tip()
-"""
-
-def generate_generic_protocol(info: dict) -> str:
-    """Generate a generic protocol for unrecognized experiment types."""
-    
-    return f"""# Generic Laboratory Protocol
-# Type: {info["type"]}, Samples: {info["num_samples"]}, Volume: {info["volume"]}µL
-
-pipette = protocol.load_instrument("{info["pipette_type"]}", "{info["pipette_mount"]}")
-tiprack = protocol.load_labware("{info["tip_type"]}", "A1")
-plate = protocol.load_labware("{info["plate_type"]}", "D2")
-trough = protocol.load_labware("{info["source_labware"]}", "B2")
-trash = protocol.load_trash_bin("D1")
-pipette.tip_racks = [tiprack]
-
-reagent = trough.wells()[0]
-
-# Basic liquid handling - distribute reagent to samples
-for i in range({info["num_samples"]}):
-    pipette.pick_up_tip()
-    pipette.aspirate({info["volume"]}, reagent)
-    pipette.dispense({info["volume"]}, plate.wells()[i])
-    pipette.drop_tip()
+    plan = base_plan(
+        info,
+        ["Generic Laboratory Protocol", f'Type: {info["type"]}, Samples: {info["num_samples"]}, Volume: {info["volume"]}µL'],
+        [("plate", info["plate_type"], "D2"), ("trough", info["source_labware"], "B2")],
+        ["reagent"],
+        source="trough",
+    )
+    pipette, labware, reagents = plan_parts(plan)
+    plan.steps = [
+        Note("Basic liquid handling - distribute reagent to samples"),
+        Transfer(pipette, info["volume"], reagents["reagent"], Wells(labware["plate"], 0, info["num_samples"])),
+        Comment("Generic protocol completed. Please review and modify as needed."),
+    ]
+    return plan
 
-protocol.comment("Generic protocol completed. Please review and modify as needed.")
-"""
 
 # Protocol Generator Agent
 ProtocolGeneratorAgent = Agent(
@@ -385,7 +355,12 @@ ProtocolGeneratorAgent = Agent(
         "Support multiple experiment types including serial dilutions, PCR setup, plate washing, "
         "sample transfers, cell culture, and enzyme assays. "
         "Return only the raw Python code that goes inside the run(protocol) function. "
-        "Parse the experiment type and parameters from the clean_prompt and generate appropriate code."
+        "With a multichannel pipette on a 96-well plate, work a column at a time (plate.columns()[i][0]), "
+        "not well by well. "
+        "Parse the experiment type and parameters from the clean_prompt and generate appropriate code. "
+        "The input may end with 'Relevant Opentrons API documentation'; never pass that section to the tool. "
+        "If the experiment is none of the supported types, do not call the tool: write the run(protocol) "
+        "body yourself for an Opentrons Flex (apiLevel 2.19), using only API calls shown in that documentation."
     ),
     tools=[generate_general_protocol],
     output_type=str,
@@ -0,0 +1,533 @@
+"""
+Intermediate representation (IR) for template-generated protocols.
+
+The templates in protocol_generator.py describe a protocol as a
+ProtocolPlan: the labware, pipettes and named reagent wells it loads, and
+a list of steps (Transfer, Delay, Comment, Note, Repeat). Sample positions are
+Wells ranges (wells i..j of a plate, or columns i..j for a multichannel
+pipette) rather than one object per well, so a 96-well step is one node.
+Every node uses __slots__.
+
+Passes rewrite the plan in place; they walk the step list, not the
+generated code, and finish in well under a millisecond:
+    batch_columns   multichannel pipette on a 96-well plate: whole columns
+                    at once, a partial last column well by well with a
+                    single-channel pipette on the other mount
+    reuse_tips      reagent-to-many transfers share one tip / multi-dispense
+                    (same rules as utils/tip_optimizer.py, which handles
+                    code that wasn't generated from a plan)
+    check_plan      tip rack capacity, pipette and well volumes, deck slots
+
+compile_protocol() then writes the run(protocol) body:
+
+    plan = generate_pcr_setup_protocol(info)
+    report = optimize_plan(plan)
+    code = compile_protocol(plan)
+"""
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from utils.tip_optimizer import (
+    MIN_TOP_DISPENSE_UL,
+    PIPETTE_MIN_VOLUME,
+    estimate_seconds_saved,
+)
+
+CHANNELS = 8  # Flex multichannel pipettes cover one 96-well plate column
+TIP_RACK_SIZE = 96
+FLEX_DECK_SLOTS = [f"{row}{column}" for row in "ABCD" for column in "123"]
+
+WELL_COUNT_RE = re.compile(r"_(\d+)_(?:wellplate|tiprack|reservoir|tuberack)")
+VOLUME_RE = re.compile(r"_(\d+(?:\.\d+)?)(ul|ml)\b")
+MODEL_VOLUME_RE = re.compile(r"_(\d+)$")
+
+
+def _number(value) -> str:
+    """Volumes as the templates write them: 35, 0.5."""
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+class Node:
+    __slots__ = ()
+
+    def replace(self, **changes):
+        """Copy with some fields changed."""
+        node = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(node, name, changes.get(name, getattr(self, name)))
+        return node
+
+
+# --- Deck ---
+
+class Labware(Node):
+    __slots__ = ("var", "load_name", "slot")
+
+    def __init__(self, var: str, load_name: str, slot: str):
+        self.var = var
+        self.load_name = load_name
+        self.slot = slot
+
+    @property
+    def well_count(self) -> Optional[int]:
+        match = WELL_COUNT_RE.search(self.load_name)
+        return int(match.group(1)) if match else None
+
+    @property
+    def max_volume(self) -> Optional[float]:
+        """Well (or tip) capacity in µL, from the load name."""
+        match = VOLUME_RE.search(self.load_name)
+        if not match:
+            return None
+        return float(match.group(1)) * (1000 if match.group(2) == "ml" else 1)
+
+
+class TrashBin(Node):
+    __slots__ = ("var", "slot")
+
+    def __init__(self, var: str, slot: str):
+        self.var = var
+        self.slot = slot
+
+
+class Pipette(Node):
+    __slots__ = ("var", "model", "mount", "tip_racks")
+
+    def __init__(self, var: str, model: str, mount: str, tip_racks: List[Labware]):
+        self.var = var
+        self.model = model
+        self.mount = mount
+        self.tip_racks = tip_racks
+
+    @property
+    def channels(self) -> int:
+        if "96channel" in self.model:
+            return 96
+        return CHANNELS if "8channel" in self.model else 1
+
+    @property
+    def capacity(self) -> Optional[float]:
+        """Largest volume per aspiration: the pipette's or its tips', whichever is smaller."""
+        match = MODEL_VOLUME_RE.search(self.model)
+        volumes = [float(match.group(1))] if match else []
+        volumes += [rack.max_volume for rack in self.tip_racks if rack.max_volume]
+        return min(volumes) if volumes else None
+
+
+class Reagent(Node):
+    """A named well holding one reagent (`master_mix = reagent_plate.wells()[0]`)."""
+
+    __slots__ = ("var", "labware", "well")
+
+    def __init__(self, var: str, labware: Labware, well: int):
+        self.var = var
+        self.labware = labware
+        self.well = well
+
+
+class Wells(Node):
+    """
+    Consecutive sample positions on a plate: wells start..stop-1 in
+    wells() order, or columns start..stop-1 when by_column.
+    """
+
+    __slots__ = ("labware", "start", "stop", "by_column")
+
+    def __init__(self, labware: Labware, start: int, stop: int, by_column: bool = False):
+        self.labware = labware
+        self.start = start
+        self.stop = stop
+        self.by_column = by_column
+
+    def __len__(self) -> int:
+        return max(0, self.stop - self.start)
+
+    def well_indices(self) -> range:
+        """wells() indices covered (8 per column)."""
+        if self.by_column:
+            return range(self.start * CHANNELS, self.stop * CHANNELS)
+        return range(self.start, self.stop)
+
+
+# --- Steps ---
+
+class Transfer(Node):
+    """
+    Move `volume` from source to dest once per position; a Wells source and
+    a Wells dest advance together. By default every transfer gets a fresh
+    tip; reuse_tips() may switch to one tip for the step ("once"), with
+    multi-dispensing and/or dispensing at the top of the wells.
+    """
+
+    __slots__ = ("pipette", "volume", "source", "dest", "mix", "new_tip", "multi_dispense", "top")
+
+    def __init__(self, pipette: Pipette, volume: float, source, dest, mix: Tuple = None):
+        self.pipette = pipette
+        self.volume = volume
+        self.source = source
+        self.dest = dest
+        self.mix = mix  # (repetitions, volume) in dest after dispensing
+        self.new_tip = "always"
+        self.multi_dispense = False
+        self.top = False
+
+    @property
+    def positions(self) -> Wells:
+        return self.dest if isinstance(self.dest, Wells) else self.source
+
+
+class Delay(Node):
+    __slots__ = ("minutes",)
+
+    def __init__(self, minutes: float):
+        self.minutes = minutes
+
+
+class Comment(Node):
+    """protocol.comment() shown on the robot."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class Note(Node):
+    """A `# ...` line in the generated code; nothing on the robot."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class Repeat(Node):
+    __slots__ = ("count", "steps", "var")
+
+    def __init__(self, count: int, steps: list, var: str = "cycle"):
+        self.count = count
+        self.steps = steps
+        self.var = var
+
+
+class ProtocolPlan(Node):
+    __slots__ = ("header", "pipettes", "labware", "trash", "reagents", "steps")
+
+    def __init__(self, header: List[str], pipettes: List[Pipette], labware: List[Labware],
+                 trash: Optional[TrashBin], reagents: List[Reagent], steps: list):
+        self.header = header  # comment lines at the top of the code
+        self.pipettes = pipettes
+        self.labware = labware
+        self.trash = trash
+        self.reagents = reagents
+        self.steps = steps
+
+    def transfers(self, steps: list = None, repeats: int = 1):
+        """(Transfer, times it runs) for every transfer, in order."""
+        for step in self.steps if steps is None else steps:
+            if isinstance(step, Repeat):
+                yield from self.transfers(step.steps, repeats * step.count)
+            elif isinstance(step, Transfer):
+                yield step, repeats
+
+
+# --- Compiler ---
+
+def _location(location, var: Optional[str], origin: int) -> str:
+    """Code for a location; var indexes Wells relative to origin (None: a single position)."""
+    if not isinstance(location, Wells):
+        return location.var
+    if var is None:
+        index = str(location.start)
+    else:
+        offset = location.start - origin
+        index = var if offset == 0 else f"{var} {'+' if offset > 0 else '-'} {abs(offset)}"
+    accessor = f"columns()[{index}][0]" if location.by_column else f"wells()[{index}]"
+    return f"{location.labware.var}.{accessor}"
+
+
+def _compile_transfer(step: Transfer) -> List[str]:
+    positions = step.positions
+    p = step.pipette.var
+    var = None if len(positions) == 1 else ("col" if positions.by_column else "i")
+    start = f"{positions.start}, " if positions.start else ""
+    iterable = f"range({start}{positions.stop})"
+    source = _location(step.source, var, positions.start)
+    dest = _location(step.dest, var, positions.start)
+    dispense_at = f"{dest}.top()" if step.top else dest
+    volume = _number(step.volume)
+
+    if step.multi_dispense and var is not None:
+        return [f'{p}.distribute({volume}, {source}, [{dispense_at} for {var} in {iterable}], new_tip="once")']
+
+    body = [f"{p}.aspirate({volume}, {source})", f"{p}.dispense({volume}, {dispense_at})"]
+    if step.mix:
+        body.append(f"{p}.mix({step.mix[0]}, {_number(step.mix[1])}, {dest})")
+    if step.new_tip == "always":
+        body = [f"{p}.pick_up_tip()"] + body + [f"{p}.drop_tip()"]
+        return body if var is None else [f"for {var} in {iterable}:"] + ["    " + line for line in body]
+    if var is not None:
+        body = [f"for {var} in {iterable}:"] + ["    " + line for line in body]
+    return [f"{p}.pick_up_tip()"] + body + [f"{p}.drop_tip()"]
+
+
+def _compile_steps(steps: list) -> List[str]:
+    lines = []
+    for step in steps:
+        if isinstance(step, Note):
+            if lines and lines[-1]:
+                lines.append("")
+            lines.append(f"# {step.text}")
+        elif isinstance(step, Transfer):
+            lines += _compile_transfer(step)
+        elif isinstance(step, Delay):
+            lines.append(f"protocol.delay(minutes={_number(step.minutes)})")
+        elif isinstance(step, Comment):
+            lines.append(f"protocol.comment({step.text!r})")
+        elif isinstance(step, Repeat):
+            lines.append(f"for {step.var} in range({step.count}):")
+            lines += ["    " + line if line else "" for line in _compile_steps(step.steps)]
+    return lines
+
+
+def compile_protocol(plan: ProtocolPlan) -> str:
+    """The run(protocol) body for a plan, unindented."""
+    lines = [f"# {line}" for line in plan.header] + [""]
+    for pipette in plan.pipettes:
+        lines.append(f'{pipette.var} = protocol.load_instrument("{pipette.model}", "{pipette.mount}")')
+    for labware in plan.labware:
+        lines.append(f'{labware.var} = protocol.load_labware("{labware.load_name}", "{labware.slot}")')
+    if plan.trash is not None:
+        lines.append(f'{plan.trash.var} = protocol.load_trash_bin("{plan.trash.slot}")')
+    for pipette in plan.pipettes:
+        lines.append(f"{pipette.var}.tip_racks = [{', '.join(rack.var for rack in pipette.tip_racks)}]")
+    if plan.reagents:
+        lines.append("")
+        for reagent in plan.reagents:
+            lines.append(f"{reagent.var} = {reagent.labware.var}.wells()[{reagent.well}]")
+    lines.append("")
+    lines += _compile_steps(plan.steps)
+    return "\n".join(lines) + "\n"
+
+
+# --- Passes ---
+
+def _single_channel_for(plan: ProtocolPlan, pipette: Pipette) -> Pipette:
+    """Single-channel pipette of the same volume on the other mount (loaded on first use)."""
+    model = pipette.model.replace(f"{CHANNELS}channel", "1channel")
+    for other in plan.pipettes:
+        if other.model == model:
+            return other
+    mount = "left" if pipette.mount == "right" else "right"
+    single = Pipette("single", model, mount, pipette.tip_racks)
+    plan.pipettes.append(single)
+    return single
+
+
+def _batch_steps(plan: ProtocolPlan, steps: list) -> Tuple[list, int]:
+    batched, moves_saved = [], 0
+    for step in steps:
+        if isinstance(step, Repeat):
+            inner, saved = _batch_steps(plan, step.steps)
+            batched.append(step.replace(steps=inner))
+            moves_saved += saved * step.count
+            continue
+        wells = [loc for loc in (getattr(step, "source", None), getattr(step, "dest", None)) if isinstance(loc, Wells)]
+        if (
+            not isinstance(step, Transfer)
+            or step.pipette.channels != CHANNELS
+            or not wells
+            or any(loc.by_column or loc.labware.well_count != 96 or loc.start % CHANNELS for loc in wells)
+        ):
+            batched.append(step)
+            continue
+
+        full_columns, leftover = divmod(len(wells[0]), CHANNELS)
+        if full_columns:
+            batched.append(step.replace(**{
+                name: Wells(loc.labware, loc.start // CHANNELS, loc.start // CHANNELS + full_columns, by_column=True)
+                for name, loc in (("source", step.source), ("dest", step.dest)) if isinstance(loc, Wells)
+            }))
+        if leftover:
+            # An 8-channel pipette can't address single wells at this apiLevel
+            first = full_columns * CHANNELS
+            batched.append(step.replace(pipette=_single_channel_for(plan, step.pipette), **{
+                name: Wells(loc.labware, loc.start + first, loc.stop)
+                for name, loc in (("source", step.source), ("dest", step.dest)) if isinstance(loc, Wells)
+            }))
+        moves_saved += len(wells[0]) - full_columns - leftover
+    return batched, moves_saved
+
+
+def batch_columns(plan: ProtocolPlan) -> int:
+    """
+    Turn per-well transfers of a multichannel pipette on 96-well plates into
+    column moves. Returns the pipette moves saved.
+    """
+    plan.steps, moves_saved = _batch_steps(plan, plan.steps)
+    return moves_saved
+
+
+def _dispense_targets(steps: list) -> set:
+    """(labware var, well index) of every well the steps dispense into."""
+    targets = set()
+    for step in steps:
+        if isinstance(step, Repeat):
+            targets |= _dispense_targets(step.steps)
+        elif isinstance(step, Transfer) and isinstance(step.dest, Wells):
+            targets.update((step.dest.labware.var, well) for well in step.dest.well_indices())
+    return targets
+
+
+def doses_per_aspiration(step: Transfer) -> int:
+    capacity = step.pipette.capacity
+    if not capacity or not step.volume:
+        return 1
+    return max(1, int((capacity - PIPETTE_MIN_VOLUME.get(int(capacity), 1.0)) // step.volume))
+
+
+def _reuse_tips(steps: list, filled: set):
+    for step in steps:
+        if isinstance(step, Repeat):
+            inner = set(filled)
+            if step.count > 1:
+                # A later cycle finds the wells this one fills
+                inner |= _dispense_targets(step.steps)
+            _reuse_tips(step.steps, inner)
+        elif (
+            isinstance(step, Transfer)
+            and step.new_tip == "always"
+            and isinstance(step.source, Reagent)
+            and isinstance(step.dest, Wells)
+            and len(step.dest) > 1
+            and not step.mix
+        ):
+            shared = True
+            if any((step.dest.labware.var, well) in filled for well in step.dest.well_indices()):
+                # The wells may hold liquid already: keep the tip out of it
+                shared = step.volume >= MIN_TOP_DISPENSE_UL
+                step.top = shared
+            if shared:
+                step.new_tip = "once"
+                step.multi_dispense = doses_per_aspiration(step) >= 2
+        filled |= _dispense_targets([step])
+
+
+def reuse_tips(plan: ProtocolPlan):
+    """
+    One tip per reagent-to-many transfer (source is a reagent well, nothing
+    is mixed), multi-dispensing when the tip holds two doses or more.
+    Sample transfers and mixing steps keep fresh tips.
+    """
+    _reuse_tips(plan.steps, set())
+
+
+def add_tip_racks(plan: ProtocolPlan) -> int:
+    """
+    Load more racks of the same tips into free deck slots for pipettes that
+    need more tips than their racks hold. Returns the number of racks added.
+    """
+    columns: Dict[int, list] = {}  # id(tip_racks) -> [tip_racks, full columns, single tips]
+    for step, repeats in plan.transfers():
+        pick_ups = (len(step.positions) if step.new_tip == "always" else 1) * repeats
+        entry = columns.setdefault(id(step.pipette.tip_racks), [step.pipette.tip_racks, 0, 0])
+        if step.pipette.channels == 1:
+            entry[2] += pick_ups
+        else:
+            entry[1] += pick_ups * step.pipette.channels // CHANNELS
+
+    used = {labware.slot for labware in plan.labware} | ({plan.trash.slot} if plan.trash else set())
+    free = [slot for slot in FLEX_DECK_SLOTS if slot not in used]
+    added = 0
+    for tip_racks, full_columns, single_tips in columns.values():
+        if not tip_racks:
+            continue
+        # Single tips come out of partly used columns, which a multichannel then skips
+        needed = math.ceil((full_columns + math.ceil(single_tips / CHANNELS)) * CHANNELS / TIP_RACK_SIZE)
+        while len(tip_racks) < needed and free:
+            rack = Labware(f"{tip_racks[0].var}_{len(tip_racks) + 1}", tip_racks[0].load_name, free.pop(0))
+            plan.labware.append(rack)
+            tip_racks.append(rack)  # shared with a partial-column `single` pipette
+            added += 1
+    return added
+
+
+def plan_counts(plan: ProtocolPlan) -> Dict[str, int]:
+    """Tip pick-ups, tips and aspirations the plan will use."""
+    counts = {"pick_ups": 0, "tips": 0, "aspirations": 0}
+    for step, repeats in plan.transfers():
+        n = len(step.positions)
+        if step.new_tip == "always":
+            pick_ups, aspirations = n, n
+        else:
+            pick_ups = 1
+            aspirations = math.ceil(n / doses_per_aspiration(step)) if step.multi_dispense else n
+        counts["pick_ups"] += pick_ups * repeats
+        counts["tips"] += pick_ups * repeats * step.pipette.channels
+        counts["aspirations"] += aspirations * repeats
+    return counts
+
+
+def check_plan(plan: ProtocolPlan) -> List[str]:
+    """Problems visible in the plan itself: tips, volumes, deck slots."""
+    warnings = []
+
+    slots: Dict[str, str] = {}
+    for item in plan.labware + ([plan.trash] if plan.trash else []):
+        if item.slot in slots:
+            warnings.append(f"Slot {item.slot} holds both {slots[item.slot]} and {item.var}")
+        slots[item.slot] = item.var
+
+    tips_by_racks: Dict[tuple, int] = {}
+    for step, repeats in plan.transfers():
+        pick_ups = len(step.positions) if step.new_tip == "always" else 1
+        racks = tuple(rack.var for rack in step.pipette.tip_racks)
+        tips_by_racks[racks] = tips_by_racks.get(racks, 0) + pick_ups * repeats * step.pipette.channels
+        capacity = step.pipette.capacity
+        if capacity and step.volume > capacity:
+            warnings.append(f"{step.pipette.var} moves {_number(step.volume)} µL, over its {_number(capacity)} µL")
+    for racks, tips in tips_by_racks.items():
+        available = TIP_RACK_SIZE * len(racks)
+        if tips > available:
+            warnings.append(f"Needs {tips} tips but its tip racks ({', '.join(racks) or 'none'}) hold {available}")
+
+    # Net volume per well, for wells that can overflow
+    volumes: Dict[tuple, float] = {}
+    for step, repeats in plan.transfers():
+        for location, sign in ((step.dest, 1), (step.source, -1)):
+            if not isinstance(location, Wells):
+                continue
+            for well in location.well_indices():  # a column move fills all 8 wells
+                key = (location.labware.var, well)
+                volumes[key] = volumes.get(key, 0.0) + sign * step.volume * repeats
+    capacities = {labware.var: labware.max_volume for labware in plan.labware}
+    overfull = {var for (var, _), volume in volumes.items() if capacities.get(var) and volume > capacities[var]}
+    for var in sorted(overfull):
+        warnings.append(f"Wells of {var} receive more than their {_number(capacities[var])} µL")
+    return warnings
+
+
+def optimize_plan(plan: ProtocolPlan, tip_reuse: bool = True) -> dict:
+    """
+    Run the passes over the plan (in place). Returns what they changed:
+    pipette moves saved by column batching, tips / aspirations / estimated
+    seconds saved by tip reuse, tip racks added, and check_plan() warnings.
+    """
+    moves_saved = batch_columns(plan)
+    before = plan_counts(plan)
+    if tip_reuse:
+        reuse_tips(plan)
+    after = plan_counts(plan)
+    tip_racks_added = add_tip_racks(plan)
+    pick_ups_saved = before["pick_ups"] - after["pick_ups"]
+    aspirations_saved = before["aspirations"] - after["aspirations"]
+    return {
+        "moves_saved": moves_saved,
+        "tips_saved": before["tips"] - after["tips"],
+        "aspirations_saved": aspirations_saved,
+        "seconds_saved": round(estimate_seconds_saved(pick_ups_saved, aspirations_saved), 1),
+        "tips_used": after["tips"],
+        "tip_racks_added": tip_racks_added,
+        "warnings": check_plan(plan),
+    }
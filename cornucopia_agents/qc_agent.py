@@ -1,16 +1,62 @@
 from agents import Agent, function_tool, ModelSettings
-import subprocess
+from utils.io_helpers import read_file
+from utils.simulation_cache import simulate_with_cache
+from utils.simulator_pool import get_simulator_pool
+from utils.static_analyzer import check_before_simulation, static_gate_stats
+import asyncio
+import os
+
+def _run_simulator(path: str) -> str:
+    result = simulate_with_cache(path)
+    return "" if result.ok else result.stderr  # "" means no error
+
+def _static_gate(path: str):
+    """Static analyzer verdict: error text, "" (passed, no simulation needed) or None (simulate)."""
+    try:
+        return check_before_simulation(read_file(path))
+    except OSError:
+        return None  # let the simulator report the unreadable file
+
+def _check_protocol(path: str) -> tuple:
+    """QC errors ("" means none) and what found them: "static" (analyzer only) or "simulator"."""
+    verdict = _static_gate(path)
+    if verdict is not None:
+        return verdict, "static"
+    return _run_simulator(path), "simulator"
 
 # ✅ Raw callable version for direct use in main.py
 def _simulate_protocol(path: str) -> str:
+    return _check_protocol(path)[0]
+
+# ✅ Async version for the API: runs off the event loop, at most
+# CORNUCOPIA_MAX_CONCURRENT_SIMS at a time, later callers wait their turn
+MAX_CONCURRENT_SIMS = int(os.getenv("CORNUCOPIA_MAX_CONCURRENT_SIMS", "0")) or get_simulator_pool().size
+_simulation_slots = asyncio.Semaphore(MAX_CONCURRENT_SIMS)
+_simulation_counts = {"queued": 0, "running": 0}
+
+async def _simulate_protocol_async(path: str) -> str:
+    # The static check takes milliseconds: rejected and confidently passing
+    # protocols never wait for a simulation slot
+    verdict = _static_gate(path)
+    if verdict is not None:
+        return verdict
+    _simulation_counts["queued"] += 1
+    waiting = True
     try:
-        proc = subprocess.run(
-            ["opentrons_simulate", path],
-            capture_output=True, text=True, check=True
-        )
-        return ""  # no error
-    except subprocess.CalledProcessError as e:
-        return e.stderr
+        async with _simulation_slots:
+            _simulation_counts["queued"] -= 1
+            waiting = False
+            _simulation_counts["running"] += 1
+            try:
+                return await asyncio.to_thread(_run_simulator, path)
+            finally:
+                _simulation_counts["running"] -= 1
+    finally:
+        if waiting:  # cancelled while still queued
+            _simulation_counts["queued"] -= 1
+
+def simulation_queue_stats() -> dict:
+    return {"max_concurrent": MAX_CONCURRENT_SIMS, **_simulation_counts, "static_gate": static_gate_stats()}
 
 def _extract_missing(stderr: str) -> str:
     if "KeyError" in stderr:
@@ -1,14 +1,120 @@
-
-
 from agents import Runner
-from cornucopia_agents.prompt_creator import PromptCreatorAgent
-from cornucopia_agents.protocol_generator import ProtocolGeneratorAgent
-from cornucopia_agents.qc_agent import QCAgent
-from utils.fixed_header import get_fixed_header
+from cornucopia_agents.prompt_creator import (
+    PromptCreatorAgent,
+    _clarify_experiment_request,
+    determine_experiment_type,
+)
+from cornucopia_agents.protocol_generator import (
+    ProtocolGeneratorAgent,
+    _generate_general_protocol,
+    generate_protocol_with_report,
+    parse_experiment_details,
+)
+from cornucopia_agents.qc_agent import QCAgent, _simulate_protocol
+from utils.fixed_header import get_api_level, get_fixed_header
 from utils.io_helpers import save_protocol
+from utils.retrieval import get_protocol_context
+from utils.tip_optimizer import OPTIMIZE_TIPS, optimize_tip_usage
+import asyncio
 import json
+import os
+
+# Fast path: when the experiment type is recognized, call the deterministic
+# tool handlers directly instead of paying an LLM round trip just to forward
+# the string. Set CORNUCOPIA_FAST_PATH=0 to always go through the agents.
+FAST_PATH = os.getenv("CORNUCOPIA_FAST_PATH", "1") != "0"
+
+
+def _use_fast_path(fast_path) -> bool:
+    return FAST_PATH if fast_path is None else fast_path
+
+
+def can_fast_clarify(user_prompt: str) -> bool:
+    return determine_experiment_type(user_prompt.lower()) != "generic"
+
+
+def can_fast_generate(clean_prompt: str) -> bool:
+    return parse_experiment_details(clean_prompt)["type"] != "generic"
+
+
+def clarify_prompt(user_prompt: str, fast_path: bool = None) -> dict:
+    """Returns dict with keys confirmation, clean_prompt."""
+    if _use_fast_path(fast_path) and can_fast_clarify(user_prompt):
+        return json.loads(_clarify_experiment_request(user_prompt))
+    clarify_result = Runner.run_sync(PromptCreatorAgent, user_prompt)
+    return json.loads(clarify_result.final_output)
+
+
+async def clarify_prompt_async(user_prompt: str, fast_path: bool = None) -> dict:
+    if _use_fast_path(fast_path) and can_fast_clarify(user_prompt):
+        return json.loads(_clarify_experiment_request(user_prompt))
+    clarify_result = await Runner.run(PromptCreatorAgent, user_prompt)
+    return json.loads(clarify_result.final_output)
+
+
+def build_generator_input(clean_prompt: str, experiment_type: str = None) -> str:
+    """Clean prompt plus retrieved API documentation for the generator agent."""
+    experiment_type = experiment_type or parse_experiment_details(clean_prompt)["type"]
+    # Docs for the apiLevel the generated protocol will declare (the fixed header's)
+    context = get_protocol_context(clean_prompt, experiment_type, api_level=get_api_level())
+    if not context:
+        return clean_prompt
+    return (
+        f"{clean_prompt}\n\n"
+        "Relevant Opentrons API documentation (reference only, not part of the request):\n"
+        f"{context}"
+    )
 
-def run_protocol_pipeline(user_prompt: str):
+
+def generate_run_block(clean_prompt: str, fast_path: bool = None, experiment_type: str = None) -> str:
+    """Returns the code that goes inside run(protocol), unindented."""
+    if _use_fast_path(fast_path) and can_fast_generate(clean_prompt):
+        return _generate_general_protocol(clean_prompt).strip()
+    generator_input = build_generator_input(clean_prompt, experiment_type)
+    protocol_result = Runner.run_sync(ProtocolGeneratorAgent, generator_input)
+    return protocol_result.final_output.strip()
+
+
+async def generate_run_block_async(clean_prompt: str, fast_path: bool = None, experiment_type: str = None) -> str:
+    if _use_fast_path(fast_path) and can_fast_generate(clean_prompt):
+        return _generate_general_protocol(clean_prompt).strip()
+    # Retrieval may embed the query or read the index from disk, so keep it off the event loop
+    generator_input = await asyncio.to_thread(build_generator_input, clean_prompt, experiment_type)
+    protocol_result = await Runner.run(ProtocolGeneratorAgent, generator_input)
+    return protocol_result.final_output.strip()
+
+
+def optimize_run_block(run_block: str):
+    """
+    Tip-usage pass over a generated run() body (utils/tip_optimizer.py).
+    Returns (code, report); report is None when CORNUCOPIA_OPTIMIZE_TIPS=0.
+    """
+    if not OPTIMIZE_TIPS:
+        return run_block, None
+    return optimize_tip_usage(run_block)
+
+
+def generate_run_block_with_report(clean_prompt: str, fast_path: bool = None, experiment_type: str = None):
+    """
+    (run block, optimization report). Template protocols are optimized on
+    their plan (protocol_ir.py) before compiling; code the agent wrote goes
+    through optimize_run_block().
+    """
+    if _use_fast_path(fast_path) and can_fast_generate(clean_prompt):
+        code, report = generate_protocol_with_report(clean_prompt)
+        return code.strip(), report
+    return optimize_run_block(generate_run_block(clean_prompt, False, experiment_type))
+
+
+async def generate_run_block_with_report_async(clean_prompt: str, fast_path: bool = None, experiment_type: str = None):
+    if _use_fast_path(fast_path) and can_fast_generate(clean_prompt):
+        code, report = generate_protocol_with_report(clean_prompt)
+        return code.strip(), report
+    run_block = await generate_run_block_async(clean_prompt, False, experiment_type)
+    return optimize_run_block(run_block)
+
+
+def run_protocol_pipeline(user_prompt: str, fast_path: bool = None):
     """
     Run the full Cornucopia agent pipeline:
     1. Clarify prompt
@@ -22,19 +128,18 @@ def run_protocol_pipeline(user_prompt: str):
             protocol_code (str)
             path (str)
             qc_error (str or None)
+            tip_optimization (dict or None)
     """
     results = {}
 
     # Step 1: Clarify prompt
-    clarify_result = Runner.run_sync(PromptCreatorAgent, user_prompt)
-    clarified = json.loads(clarify_result.final_output)
+    clarified = clarify_prompt(user_prompt, fast_path)
     results["confirmation"] = clarified["confirmation"]
     clean_prompt = clarified["clean_prompt"]
     results["clean_prompt"] = clean_prompt
 
-    # Step 2: Generate protocol code
-    protocol_result = Runner.run_sync(ProtocolGeneratorAgent, clean_prompt)
-    run_block = protocol_result.final_output.strip()
+    # Step 2: Generate protocol code (grounded in retrieved API docs when the agent writes it)
+    run_block, results["tip_optimization"] = generate_run_block_with_report(clean_prompt, fast_path)
     full_code = get_fixed_header().rstrip() + "\n" + run_block
     results["protocol_code"] = full_code
 
@@ -42,8 +147,12 @@ def run_protocol_pipeline(user_prompt: str):
     path = save_protocol(full_code)
     results["path"] = path
 
-    # Step 4: Simulate & QC
-    qc_result = Runner.run_sync(QCAgent, path)
-    results["qc_error"] = qc_result.final_output.strip() or None
+    # Step 4: Simulate & QC (the QC agent only forwards to the simulator,
+    # so the fast path calls it directly)
+    if _use_fast_path(fast_path):
+        results["qc_error"] = _simulate_protocol(path) or None
+    else:
+        qc_result = Runner.run_sync(QCAgent, path)
+        results["qc_error"] = qc_result.final_output.strip() or None
 
     return results
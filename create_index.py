@@ -1,43 +1,307 @@
+import glob
+import hashlib
+import json
 import os
+import time
+import numpy as np
 from dotenv import load_dotenv
 from llama_index.llms.openai import OpenAI
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
-from llama_index.core import StorageContext, load_index_from_storage
 from llama_index.core.workflow import Context  # For chat memory
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.core.settings import Settings
 
 from openai import OpenAI as OpenAIClient
+from utils.bm25 import bm25_index_exists, write_bm25_index
+from utils.embeddings import get_embedder
+from utils.index_registry import api_level_from_name
+from utils.markdown_chunker import SECTION_MARKER, chunk_markdown, split_sections
+from utils.retrieval import HybridRetriever, can_reuse_embedding
+from utils.semantic_cache import SemanticCache
+from utils.vector_store import (
+    VECTOR_DTYPES,
+    load_manifest,
+    load_vector_store,
+    save_manifest,
+    write_vector_store,
+)
 
 
 # Load environment variables
 load_dotenv()
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Register embedding model
-Settings.embed_model = OpenAIEmbedding(
-    model_name="text-embedding-ada-002",
-    client=client,
-)
+# Chunking settings; changing them (or the embedding backend) forces a full rebuild
+CHUNK_SIZE = 1024  # tokens, estimated
+CHUNKER = "markdown-v1"
+MANIFEST_VERSION = 4  # 2: compact vector store, 3: embedding backends, 4: markdown chunker
+
+# On-disk precision of the vectors; float16 halves the file at a tiny recall cost
+VECTOR_DTYPE = os.getenv("CORNUCOPIA_VECTOR_DTYPE", "float32")
+if VECTOR_DTYPE not in VECTOR_DTYPES:
+    raise ValueError(f"CORNUCOPIA_VECTOR_DTYPE must be one of {sorted(VECTOR_DTYPES)}")
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def index_settings(embedder) -> dict:
+    """Everything that changes the stored vectors besides the chunk text itself."""
+    return {
+        "version": MANIFEST_VERSION,
+        "embedding": embedder.config(),
+        "chunker": CHUNKER,
+        "chunk_size": CHUNK_SIZE,
+    }
+
+
+class Chunk:
+    """One indexed chunk; id_ is a hash of the text that gets embedded."""
+
+    def __init__(self, text: str, metadata: dict):
+        self.text = text
+        self.metadata = metadata
+        self.embed_text = f"{metadata['header_path']}\n{metadata['symbols']}\n\n{text}"
+        self.id_ = ""
+        self.vector = None  # stored embedding, when carried over from the index
+
+
+def split_into_chunks(file_path: str, kept_sections: dict = None):
+    """
+    Split the doc with the structure-aware markdown chunker (whole sections,
+    API members and code blocks; see utils/markdown_chunker.py). Chunk
+    boundaries follow the doc's structure, so an edit only changes the
+    chunks of the section it touches.
+
+    kept_sections maps source document IDs to chunks already indexed for
+    them; those sections are taken as-is instead of being chunked again.
+    """
+    kept_sections = kept_sections or {}
+    with open(file_path, "r", encoding="utf-8") as f:
+        markdown = f.read()
+
+    chunks, used_ids = [], set()
+    for section_id, text in split_sections(markdown):
+        if section_id in kept_sections:
+            section_chunks = kept_sections[section_id]
+        else:
+            marker = SECTION_MARKER.format(section_id) + "\n" if section_id else ""
+            section_chunks = [Chunk(c["text"], c["metadata"]) for c in chunk_markdown(marker + text, CHUNK_SIZE)]
+        for chunk in section_chunks:
+            if not chunk.id_:
+                digest = hashlib.sha256(chunk.embed_text.encode("utf-8")).hexdigest()[:32]
+                # Identical chunks (repeated boilerplate) still need distinct IDs
+                chunk.id_, n = digest, 1
+                while chunk.id_ in used_ids:
+                    n += 1
+                    chunk.id_ = f"{digest}-{n}"
+            used_ids.add(chunk.id_)
+        chunks.extend(section_chunks)
+    return chunks
+
+
+def load_section_changes(file_path: str):
+    """The sections file convert_to_markdown.py wrote next to the doc, if any."""
+    path = os.path.splitext(file_path)[0] + ".sections.json"
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def unchanged_section_chunks(store, changes: dict) -> dict:
+    """
+    Chunks (with their stored vectors) of the indexed sections that the last
+    conversion reports as unchanged, by section ID.
+    """
+    unchanged = {section["id"] for section in changes["sections"]} - set(changes["changed"])
+    kept = {}
+    for row in range(len(store)):
+        node = store.node(row)
+        section_id = node["metadata"].get("section")
+        if section_id in unchanged:
+            chunk = Chunk(node["text"], node["metadata"])
+            chunk.id_ = node["id"]
+            chunk.vector = np.array(store.vectors[row], dtype=np.float32)
+            kept.setdefault(section_id, []).append(chunk)
+    return kept
 
-def create_index(data_path: str, data_file: str, index_name: str):
+
+def keyword_text(text: str, metadata: dict) -> str:
+    """Text for the BM25 index: the chunk plus its section headings and API member names."""
+    return f"{metadata.get('header_path', '')}\n{metadata.get('symbols', '')}\n{text}"
+
+
+def create_index(
+    data_path: str,
+    data_file: str,
+    index_name: str,
+    backend: str = None,
+    api_level: str = None,
+):
+    """
+    Build or update index/<index_name> from one doc. backend picks the
+    embedding backend (see utils/embeddings.py); an existing index keeps
+    its own backend unless another one is asked for. api_level is the API
+    version the doc describes (default: from the file name), recorded in the
+    manifest so the index registry can route requests to it.
+    """
     persist_dir = os.path.join("index", index_name)
     file_path = os.path.join(data_path, data_file)
+    api_level = api_level or api_level_from_name(data_file)
 
-    if not os.path.exists(persist_dir):
-        print("🔧 Creating new index...")
-        documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
-        index = VectorStoreIndex.from_documents(documents)
-        index.storage_context.persist(persist_dir=persist_dir)
-        return index
-    else:
+    manifest = load_manifest(persist_dir)
+    if backend is None and manifest and "embedding" in manifest.get("settings", {}):
+        backend = manifest["settings"]["embedding"]["backend"]
+    embedder = get_embedder(backend)
+    source_hash = file_sha256(file_path)
+    settings = index_settings(embedder)
+    store = load_vector_store(persist_dir)
+
+    reusable = (
+        store is not None
+        and manifest is not None
+        and manifest.get("settings") == settings
+        and manifest.get("source") == data_file
+    )
+
+    if reusable and manifest.get("source_sha256") == source_hash and manifest.get("dtype") == VECTOR_DTYPE:
         print("✅ Using existing index.")
-        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
-        return load_index_from_storage(storage_context)
+        if not bm25_index_exists(persist_dir):
+            print("🔤 Adding BM25 index...")
+            records = [store.node(row) for row in range(len(store))]
+            write_bm25_index(persist_dir, [keyword_text(r["text"], r["metadata"]) for r in records])
+        if manifest.get("api_level") != api_level:
+            save_manifest(persist_dir, dict(manifest, api_level=api_level))
+        return store
+
+    start = time.time()
+    # When the doc was converted from the state this index was built from,
+    # its sections file says which source documents changed; the others keep
+    # their chunks and vectors without being chunked again
+    kept_sections = {}
+    changes = load_section_changes(file_path)
+    if (
+        reusable
+        and not embedder.fitted
+        and changes is not None
+        and changes.get("base_sha256") == manifest.get("source_sha256")
+    ):
+        kept_sections = unchanged_section_chunks(store, changes)
+        print(f"🧩 {len(changes['changed'])} changed sections, {len(kept_sections)} kept as indexed")
+    nodes = split_into_chunks(file_path, kept_sections)
+    node_ids = [node.id_ for node in nodes]
+
+    # Vectors of chunks that are still present are copied over as-is;
+    # anything not carried into the new store is dropped with the old files
+    reused = {node.id_: node.vector for node in nodes if node.vector is not None}
+    if reusable and not embedder.fitted:
+        print("🔄 Updating index incrementally...")
+        current = set(node_ids)
+        for row, node_id in enumerate(manifest["nodes"]):
+            if node_id in current and node_id not in reused:
+                reused[node_id] = np.array(store.vectors[row], dtype=np.float32)
+        removed = len(manifest["nodes"]) - len(reused)
+    else:
+        if os.path.exists(persist_dir):
+            print("🔧 Index settings changed or no manifest found, rebuilding index...")
+        else:
+            print("🔧 Creating new index...")
+        removed = 0
+    if store is not None:
+        store.close()
+
+    # Corpus-fitted backends (hashed TF-IDF) refit and re-embed everything;
+    # they are local and cheap, and old vectors would carry stale weights
+    if embedder.fitted:
+        embedder.fit([node.embed_text for node in nodes])
+    new_nodes = [node for node in nodes if node.id_ not in reused]
+    new_embeddings = embedder.embed_documents(
+        [node.embed_text for node in new_nodes]
+    )
+    embedded = dict(zip((node.id_ for node in new_nodes), new_embeddings))
+
+    write_vector_store(
+        persist_dir,
+        ids=node_ids,
+        texts=[node.text for node in nodes],
+        metadatas=[node.metadata for node in nodes],
+        embeddings=[reused[i] if i in reused else embedded[i] for i in node_ids],
+        dtype=VECTOR_DTYPE,
+    )
+    # Cheap enough to rebuild in full every time
+    write_bm25_index(persist_dir, [keyword_text(node.text, node.metadata) for node in nodes])
+    embedder.save(persist_dir)
+    save_manifest(
+        persist_dir,
+        {
+            "settings": settings,
+            "source": data_file,
+            "source_sha256": source_hash,
+            "api_level": api_level,
+            "dtype": VECTOR_DTYPE,
+            "updated": time.time(),
+            "nodes": node_ids,
+        },
+    )
+    print(
+        f"📚 Indexed {len(node_ids)} chunks: {len(new_nodes)} embedded, {removed} removed, "
+        f"{len(reused)} reused ({time.time() - start:.1f}s)"
+    )
+    return load_vector_store(persist_dir)
+
+
+def create_all_indexes(data_path: str = "data", backend: str = None) -> list:
+    """
+    Index every converted doc in data_path: python_api_<ver>_docs.md into
+    v<ver>_ref and python_api_<ver>_reference.md into v<ver>_api.
+    Returns the index names.
+    """
+    names = []
+    for path in sorted(glob.glob(os.path.join(data_path, "python_api_*_*.md"))):
+        data_file = os.path.basename(path)
+        version, kind = data_file[len("python_api_"):-len(".md")].split("_", 1)
+        suffix = {"docs": "ref", "reference": "api"}.get(kind)
+        if suffix is None:
+            continue
+        name = f"v{version}_{suffix}"
+        create_index(data_path, data_file, name, backend=backend)
+        names.append(name)
+    return names
+
+
+def answer_question(query: str, retrievers: list, cache: SemanticCache) -> str:
+    """
+    Answer a question from the indexes. Answers are cached by query embedding,
+    so a repeated or near-identical question skips retrieval and the LLM call
+    (and an exact repeat skips the embedding call as well). The query is
+    embedded once for every index built with the same (unfitted) embedder.
+    """
+    answer = cache.lookup(query)
+    if answer is not None:
+        return answer
+    embedder = retrievers[0].embedder
+    embedding = embedder.embed_query(query)
+    hit = cache.search(embedding)
+    if hit is not None:
+        return hit[0]
+
+    results = []
+    for retriever in retrievers:
+        shared = can_reuse_embedding(retriever, embedder)
+        results.extend(retriever.search(query, top_k=3, query_embedding=embedding if shared else None))
+    context = "\n\n".join(result["text"] for result in results)
+    answer = str(client.complete(f"Answer using this Opentrons documentation:\n{context}\n\nQuestion: {query}"))
+    cache.put(query, embedding, answer)
+    return answer
+
 
 if __name__ == "__main__":
-    index = create_index("data", "python_api_219_docs.md", "v219_ref")
-    query_engine = index.as_query_engine()
+    names = create_all_indexes("data")
+    retrievers = [HybridRetriever(os.path.join("index", name)) for name in names]
+    cache = SemanticCache()
     while True:
         query = input("Ask a question: ")
-        print(query_engine.query(query))
+        print(answer_question(query, retrievers, cache))
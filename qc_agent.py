@@ -1,12 +1,7 @@
-import subprocess
+from utils.simulation_cache import simulate_with_cache
 
 def simulate_protocol(path: str) -> tuple[str, str]:
-    result = subprocess.run(
-        ["opentrons_simulate", path],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    result = simulate_with_cache(path)
     return result.stdout, result.stderr
 
 def extract_missing_params(stderr: str) -> list[str]:
@@ -0,0 +1,41 @@
+import create_index
+from utils.embeddings import get_embedder
+
+
+class FakeRetriever:
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.query_embeddings = []
+
+    def search(self, query, top_k=5, query_embedding=None):
+        self.query_embeddings.append(query_embedding)
+        return [{"text": "Use pipette.distribute()."}]
+
+
+class NoCache:
+    def lookup(self, query):
+        return None
+
+    def search(self, embedding):
+        return None
+
+    def put(self, query, embedding, answer):
+        pass
+
+
+class FakeLLM:
+    def complete(self, prompt):
+        return "distribute()"
+
+
+def test_query_is_embedded_once_for_matching_indexes(monkeypatch):
+    monkeypatch.setattr(create_index, "client", FakeLLM())
+    # Each retriever loads its own embedder instance, as HybridRetriever does
+    retrievers = [FakeRetriever(get_embedder("local")) for _ in range(2)]
+    calls = []
+    for retriever in retrievers:
+        monkeypatch.setattr(retriever.embedder, "embed_query", lambda query: calls.append(query) or [0.0])
+
+    assert create_index.answer_question("how do I distribute?", retrievers, NoCache()) == "distribute()"
+    assert len(calls) == 1
+    assert all(r.query_embeddings == [[0.0]] for r in retrievers)
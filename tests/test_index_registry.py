@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+import utils.index_registry as index_registry
+from utils.index_registry import IndexRegistry
+
+
+class FakeRetriever:
+    def __init__(self, persist_dir):
+        self.persist_dir = persist_dir
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_retrievers(monkeypatch):
+    monkeypatch.setattr(index_registry, "HybridRetriever", FakeRetriever)
+
+
+def write_index(root, name, api_level, size=100, mtime=None):
+    persist_dir = os.path.join(root, name)
+    os.makedirs(persist_dir, exist_ok=True)
+    with open(os.path.join(persist_dir, "vectors.npy"), "wb") as f:
+        f.write(b"\0" * size)
+    manifest = os.path.join(persist_dir, "manifest.json")
+    with open(manifest, "w") as f:
+        json.dump({"api_level": api_level}, f)
+    if mtime is not None:
+        os.utime(manifest, (mtime, mtime))
+
+
+def test_new_indexes_are_found_without_restart(tmp_path):
+    root = str(tmp_path)
+    write_index(root, "v219_docs", "2.19")
+    registry = IndexRegistry(root=root)
+    assert registry.resolve("2.20") == "2.19"
+
+    write_index(root, "v220_docs", "2.20")
+    assert registry.resolve("2.20") == "2.20"
+    scans = registry.scans
+    registry.resolve("2.20")
+    assert registry.scans == scans  # nothing changed: no rescan
+
+
+def test_rebuilt_index_is_reopened(tmp_path):
+    root = str(tmp_path)
+    write_index(root, "v219_docs", "2.19", mtime=1000)
+    registry = IndexRegistry(root=root)
+    [old] = registry.retrievers_for("2.19")
+    registry.release([old])
+
+    write_index(root, "v219_docs", "2.19", mtime=2000)
+    [new] = registry.retrievers_for("2.19")
+    assert new is not old and old.closed
+
+
+def test_evicted_retrievers_are_closed_after_last_release(tmp_path):
+    root = str(tmp_path)
+    write_index(root, "v218_docs", "2.18")
+    write_index(root, "v219_docs", "2.19")
+    registry = IndexRegistry(root=root, max_bytes=150)  # room for one index
+
+    [in_use] = registry.retrievers_for("2.18")
+    [idle] = registry.retrievers_for("2.19")
+    assert registry.stats()["evictions"] == 1
+    assert not in_use.closed  # still being searched
+    registry.release([in_use])
+    assert in_use.closed
+
+    registry.release([idle])
+    registry.retrievers_for("2.18")
+    assert idle.closed
@@ -0,0 +1,27 @@
+import pytest
+
+from cornucopia_agents.protocol_generator import generate_protocol_with_report, parse_experiment_details
+
+
+def test_samples_are_clamped_to_the_plate():
+    assert parse_experiment_details("transfer 100 samples")["num_samples"] == 96
+    assert parse_experiment_details("transfer 400 samples on a 384 plate")["num_samples"] == 384
+    assert parse_experiment_details("transfer 0 samples")["num_samples"] == 1
+
+
+def test_pipette_volume_parse():
+    assert parse_experiment_details("transfer 20 samples 50 ul single")["pipette_type"] == "flex_1channel_50"
+    assert parse_experiment_details("cell culture 24 wells 150 ul")["pipette_type"] == "flex_8channel_1000"
+
+
+@pytest.mark.parametrize("prompt, racks", [
+    ("PCR setup on 96 samples", 2),
+    ("wash 96 wells 200 ul", 4),
+    ("transfer 20 samples 100 ul", 1),
+])
+def test_tip_racks_cover_the_tips_used(prompt, racks):
+    code, report = generate_protocol_with_report(prompt)
+    assert code.count("opentrons_flex_96_tiprack") == racks
+    assert report["tip_racks_added"] == racks - 1
+    assert report["tips_used"] <= 96 * racks
+    assert not any("tips" in warning for warning in report["warnings"])
@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+
+import api.run_watcher as run_watcher
+from api.fleet import Robot
+
+
+def fake_robot(monkeypatch, requests: list):
+    async def flex_request(method, url, path, **kwargs):
+        requests.append(path)
+        data = {"id": "run1", "status": "running", "startedAt": "2025-03-04T15:00:00Z"}
+        if path.endswith("/commands"):
+            data = []
+        return httpx.Response(200, json={"data": data, "meta": {"totalLength": 0}})
+
+    monkeypatch.setattr(run_watcher, "flex_request", flex_request)
+    monkeypatch.setattr(run_watcher, "RUN_WATCH_IDLE", 0.05)
+    return Robot("flex1", "http://flex1:31950")
+
+
+def test_status_reads_keep_the_watcher_alive(monkeypatch):
+    requests = []
+    robot = fake_robot(monkeypatch, requests)
+
+    async def poll_status():
+        watcher = run_watcher.RunWatcher("run1", robot, interval=0.01)
+        watcher.start()
+        for _ in range(10):  # GET /runs/{id}/status, well past RUN_WATCH_IDLE in total
+            await watcher.latest()
+            await asyncio.sleep(0.02)
+        running = not watcher.done
+        await watcher.stop()
+        return running
+
+    assert asyncio.run(poll_status())
+
+
+def test_dispatched_runs_are_watched_until_done(monkeypatch):
+    requests = []
+    robot = fake_robot(monkeypatch, requests)
+
+    async def watch():
+        watcher = run_watcher.RunWatcher("run1", robot, interval=0.01, until_done=True)
+        watcher.start()
+        await asyncio.sleep(0.2)  # well past RUN_WATCH_IDLE with no readers
+        running = not watcher.done
+        await watcher.stop()
+        return running
+
+    assert asyncio.run(watch())
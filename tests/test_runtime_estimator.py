@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from utils.runtime_estimator import (
+    TimingModel, fit_timing_model, step_features, steps_from_commands, steps_from_simulation_log,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def run_commands():
+    # One page of GET /runs/{id}/commands from a Flex
+    with open(os.path.join(DATA, "flex_run_commands.json"), "r") as f:
+        return json.load(f)["data"]
+
+
+def test_steps_from_commands(run_commands):
+    steps = steps_from_commands(run_commands)
+    assert [(step["kind"], step.get("slot")) for step in steps] == [
+        ("pick_up_tip", "D1"),
+        ("aspirate", "D2"),
+        ("dispense", "C2"),
+        ("delay", None),
+        ("drop_tip", "A3"),  # movableTrashA3
+        ("pick_up_tip", "D1"),
+        ("drop_tip", "D3"),  # 1ChannelWasteChute
+    ]
+    assert all(step["pipette"] == "flex_1channel_1000" for step in steps if step["kind"] != "delay")
+    assert steps[1]["volume"] == 100.0 and steps[1]["flow_rate"] == 716.0
+    assert steps[3]["seconds"] == 30.0
+    # moveToAddressableAreaForDropTip + dropTipInPlace count as one drop
+    assert steps[4]["duration"] == pytest.approx(5.1)
+    assert steps[6]["duration"] == pytest.approx(5.5)
+
+
+def test_simulation_log_matches_command_slots():
+    log = """
+Picking up tip from A1 of Opentrons Flex 96 Tip Rack 200 µL on slot D1
+Aspirating 100.0 uL from A1 of NEST 12 Well Reservoir 15 mL on slot D2 at 716.0 uL/sec
+Dispensing 100.0 uL into A1 of NEST 96 Well Plate 200 µL Flat on slot C2 at 716.0 uL/sec
+Delaying for 0 minutes and 30.0 seconds
+Dropping tip into Trash Bin on slot A3
+Picking up tip from B1 of Opentrons Flex 96 Tip Rack 200 µL on slot D1
+Dropping tip into Waste Chute
+"""
+    steps = steps_from_simulation_log(log)
+    assert [(step["kind"], step.get("slot")) for step in steps] == [
+        ("pick_up_tip", "D1"), ("aspirate", "D2"), ("dispense", "C2"), ("delay", None),
+        ("drop_tip", "A3"), ("pick_up_tip", "D1"), ("drop_tip", "D3"),
+    ]
+
+
+def test_estimate_counts_travel_once(run_commands):
+    model = TimingModel({"travel_s_per_mm": 0.0, "slot_change_s": 0.0})
+    estimate = model.estimate(steps_from_commands(run_commands))
+    parameters = model.parameters
+    assert estimate["by_kind"]["drop_tip"] == pytest.approx(2 * parameters["drop_tip_s"])
+    assert estimate["by_kind"]["delay"] == 30.0
+
+
+def timed_run(durations: list) -> list:
+    """Commands for a run of (commandType, params, seconds), one after another."""
+    commands = [
+        {"commandType": "loadLabware", "params": {"location": {"slotName": "C2"}}, "result": {"labwareId": "plate"}},
+        {"commandType": "loadPipette", "params": {"pipetteName": "flex_1channel_1000"}, "result": {"pipetteId": "p"}},
+    ]
+    clock = 0.0
+    for command_type, params, seconds in durations:
+        commands.append({
+            "commandType": command_type, "params": {"pipetteId": "p", "labwareId": "plate", **params},
+            "startedAt": f"2025-03-04T15:{int(clock // 60):02d}:{clock % 60:09.6f}+00:00",
+            "completedAt": f"2025-03-04T15:{int((clock + seconds) // 60):02d}:{(clock + seconds) % 60:09.6f}+00:00",
+        })
+        clock += seconds
+    return commands
+
+
+def test_fit_is_non_negative_least_squares():
+    # Dispenses take less than the liquid time alone would predict: an
+    # unconstrained fit gives dispense_s < 0, which must be pinned to 0
+    run = []
+    for volume in (50.0, 100.0, 200.0, 400.0):
+        run.append(("aspirate", {"volume": volume, "flowRate": 100.0}, 1.0 + volume / 100.0))
+        run.append(("dispense", {"volume": volume, "flowRate": 100.0}, volume / 100.0 - 0.3))
+    model = fit_timing_model([timed_run(run)])
+    assert all(value >= 0 for value in model.parameters.values())
+    assert model.parameters["dispense_s"] == 0.0
+
+    # The reported error is the error of the returned parameters
+    steps = steps_from_commands(timed_run(run))
+    predicted = [sum(model.parameters[name] * value for name, value in step_features(step, None).items())
+                 for step in steps]
+    error = sum(abs(p - step["duration"]) for p, step in zip(predicted, steps)) / len(steps)
+    assert model.fitted_on["mean_abs_error_s"] == pytest.approx(error, abs=1e-3)
@@ -0,0 +1,17 @@
+from utils.simulation_cache import SimulationCache
+from utils.simulator_pool import SimulationResult
+
+CODE = 'requirements = {"robotType": "Flex", "apiLevel": "2.19"}\n\ndef run(protocol):\n    pass\n'
+
+
+def test_protocol_results_are_cached(tmp_path):
+    cache = SimulationCache(cache_dir=str(tmp_path))
+    cache.put(CODE, SimulationResult(ok=False, stderr="OutOfTipsError"))
+    assert cache.get(CODE).stderr == "OutOfTipsError"
+
+
+def test_infrastructure_failures_are_not_cached(tmp_path):
+    cache = SimulationCache(cache_dir=str(tmp_path))
+    cache.put(CODE, SimulationResult(ok=False, stderr="SimulatorCrashed: worker exited", infrastructure_error=True))
+    cache.put(CODE, SimulationResult(ok=False, stderr="SimulationTimeout", timed_out=True, infrastructure_error=True))
+    assert cache.get(CODE) is None
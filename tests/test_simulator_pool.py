@@ -0,0 +1,46 @@
+import utils.simulator_pool as simulator_pool
+from utils.simulator_pool import SimulationResult, SimulatorPool, WorkerError
+
+
+class BrokenWorker:
+    """A worker whose process never gets ready (e.g. opentrons isn't installed)."""
+
+    ready = False
+
+    def __init__(self, python):
+        pass
+
+    def alive(self):
+        return True
+
+    def wait_ready(self):
+        raise WorkerError("ModuleNotFoundError: No module named 'opentrons'")
+
+    def close(self):
+        pass
+
+
+def test_startup_failure_backs_off_instead_of_disabling(monkeypatch, tmp_path):
+    clock = [1000.0]
+    monkeypatch.setattr(simulator_pool.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(simulator_pool, "SimulatorWorker", BrokenWorker)
+    monkeypatch.setattr(simulator_pool, "STARTUP_RETRY", 30.0)
+    fallback = []
+    monkeypatch.setattr(simulator_pool, "simulate_subprocess",
+                        lambda path, timeout=None: fallback.append(path) or SimulationResult(ok=True))
+
+    pool = SimulatorPool(size=1)
+    protocol = str(tmp_path / "protocol.py")
+    assert pool.simulate(protocol).ok
+    assert not pool.available and pool.startup_failures == 1
+
+    clock[0] += 31  # cooldown over: the workers are tried again
+    assert pool.available
+    pool.simulate(protocol)
+    assert pool.startup_failures == 2
+
+    clock[0] += 31  # second cooldown is twice as long
+    assert not pool.available
+    clock[0] += 30
+    assert pool.available
+    assert len(fallback) == 2
@@ -0,0 +1,182 @@
+import glob
+import os
+
+import pytest
+
+import utils.static_analyzer as static_analyzer
+from cornucopia_agents.protocol_generator import generate_protocol_with_report
+from utils.fixed_header import get_fixed_header
+from utils.static_analyzer import analyze_protocol, check_before_simulation
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+FLEX_HEADER = """from opentrons import protocol_api
+
+requirements = {"robotType": "Flex", "apiLevel": "2.19"}
+
+"""
+
+
+def full_protocol(run_body: str) -> str:
+    """A run() body behind the fixed header, as the API and app assemble it."""
+    body = "\n".join("    " + line if line.strip() else "" for line in run_body.splitlines())
+    return get_fixed_header().rstrip() + "\n" + body
+
+
+def flex_protocol(run_body: str, module_level: str = "") -> str:
+    body = "\n".join("    " + line if line.strip() else "" for line in run_body.strip("\n").splitlines())
+    return FLEX_HEADER + module_level + "def run(protocol):\n" + body + "\n"
+
+
+LOADS = """
+tips = protocol.load_labware("opentrons_flex_96_tiprack_200ul", "D1")
+plate = protocol.load_labware("nest_96_wellplate_200ul_flat", "C2")
+trash = protocol.load_trash_bin("A3")
+p = protocol.load_instrument("flex_1channel_1000", "right", tip_racks=[tips])
+"""
+
+RESERVOIR_LOADS = LOADS + 'reservoir = protocol.load_labware("nest_12_reservoir_15ml", "D2")\n'
+
+
+# --- templates ---
+
+@pytest.mark.parametrize("prompt", [
+    "serial dilution 6 steps 100 ul single channel",
+    "serial dilution 5 steps multi",
+    "PCR setup 20 samples 50 ul 8-channel",
+    "wash 12 wells 200 ul single",
+    "transfer 20 samples 100 ul",
+    "transfer 96 samples 100 ul single",
+    "enzyme assay 16 samples 100 ul",
+    "do something 10 samples 50 ul",
+    "PCR setup on 96 samples",
+    "wash 96 wells 200 ul",
+    "transfer 100 samples",
+    "cell culture 24 wells 150 ul",
+])
+def test_templates_pass_confidently(prompt):
+    code, _ = generate_protocol_with_report(prompt)
+    report = analyze_protocol(full_protocol(code))
+    assert report.errors == []
+    assert report.confident, report.unsupported
+
+
+# --- test_files/ ---
+
+def test_every_test_file_is_analyzed():
+    names = {os.path.basename(path) for path in glob.glob(os.path.join(TEST_FILES, "*.py"))}
+    assert names == {"compare.py", "run1.py", "run2.py", "runAI.py", "runOTFAI.py", "test_new.py", "thisworks.py"}
+
+
+@pytest.mark.parametrize("name", ["compare.py", "run1.py", "run2.py", "runAI.py", "thisworks.py"])
+def test_test_files_are_not_rejected(name):
+    with open(os.path.join(TEST_FILES, name), "r") as f:
+        report = analyze_protocol(f.read())
+    assert report.errors == []
+    assert not report.confident  # parameters / OT-2 pipettes the model doesn't cover: simulate
+
+
+def test_test_new_is_confident():
+    with open(os.path.join(TEST_FILES, "test_new.py"), "r") as f:
+        report = analyze_protocol(f.read())
+    assert report.confident, report.unsupported
+
+
+def test_run_otfai_runs_out_of_tips():
+    # 1 tip for the diluent + 8 rows x 12 tips with one 96-tip rack
+    with open(os.path.join(TEST_FILES, "runOTFAI.py"), "r") as f:
+        report = analyze_protocol(f.read())
+    assert any("OutOfTipsError" in error for error in report.errors)
+
+
+# --- false positives: unknown values make the result not confident, never errors ---
+
+@pytest.mark.parametrize("module_level, body", [
+    ("", "import math\nprotocol.comment(str(math.ceil(2.5)))"),
+    ("from opentrons import types\n\n", "point = types.Point(1, 2, 3)"),
+    ("VOL = 50\n\n", LOADS + "p.transfer(VOL, plate['A1'], plate['A2'])"),
+    ("from helpers import *\n\n", "helper(protocol)"),
+])
+def test_unknown_names_are_simulated_not_rejected(module_level, body):
+    report = analyze_protocol(flex_protocol(body, module_level))
+    assert report.errors == []
+    assert not report.confident
+
+
+def test_unknown_tip_rack_is_not_an_error():
+    body = LOADS.replace('"opentrons_flex_96_tiprack_200ul"', "protocol.params.tip_type") + "p.pick_up_tip()\np.drop_tip()"
+    report = analyze_protocol(flex_protocol(body))
+    assert report.errors == []
+    assert not report.confident
+
+
+def test_state_errors_after_unsupported_code_are_not_errors():
+    body = LOADS + "if protocol.params.prewet:\n    p.pick_up_tip()\np.aspirate(50, plate['A1'])"
+    report = analyze_protocol(flex_protocol(body))
+    assert report.errors == []
+    assert not report.confident
+
+
+@pytest.mark.parametrize("body", [
+    "p.transfer(50, reservoir['A1'], plate['A1'], blowout=True)",
+    "p.transfer(50, reservoir['A1'], plate['A1'], mix_after=3)",
+    "p.distribute(50, reservoir['A1'], 'A1')",
+    "p.transfer(-20, reservoir['A1'], plate['A1'])",
+    "p.pick_up_tip()\np.aspirate(50, 'A1')",
+    "p.pick_up_tip()\np.mix('3', 50, plate['A1'])",
+])
+def test_unchecked_arguments_are_simulated(body):
+    # Wrong keywords and argument types fail in the simulator; the model doesn't vouch for them
+    report = analyze_protocol(full_protocol(RESERVOIR_LOADS + body))
+    assert report.errors == []
+    assert not report.confident
+
+
+def test_checked_keywords_stay_confident():
+    body = RESERVOIR_LOADS + "p.transfer(50, reservoir['A1'], plate.wells()[:8], mix_after=(3, 50), new_tip='always')"
+    report = analyze_protocol(full_protocol(body))
+    assert report.confident, report.unsupported
+    assert [step["kind"] for step in report.steps].count("aspirate") == 8 * 4
+
+
+# --- true positives ---
+
+@pytest.mark.parametrize("body, expected", [
+    (LOADS + "p.pick_up_tip()\np.pick_up_tip()", "while a tip is still attached"),
+    (LOADS + "p.aspirate(50, plate['A1'])", "without a tip attached"),
+    (LOADS + "for well in plate.wells() + plate.wells():\n    p.pick_up_tip()\n    p.drop_tip()", "OutOfTipsError"),
+    (LOADS + "p.transfer(100, reservoir['A1'], plate['A1'])", "NameError"),
+    (LOADS + "other = protocol.load_labware('nest_12_reservoir_15ml', 'C2')", "already holds"),
+    (LOADS.replace('"flex_1channel_1000"', '"p300_single_gen2"'), "is not a Flex pipette"),
+    (LOADS.replace("trash = protocol.load_trash_bin(\"A3\")", "") + "p.pick_up_tip()\np.drop_tip()", "no trash bin"),
+    (LOADS + "label = 'Sample ' + 1", "TypeError"),
+    (LOADS + "if 'A1' < 3:\n    pass", "TypeError"),
+])
+def test_errors(body, expected):
+    report = analyze_protocol(flex_protocol(body))
+    assert any(expected in error for error in report.errors), report.errors
+
+
+def test_liquid_handling_trace():
+    body = LOADS + "p.distribute(20, plate['A1'], plate.wells()[1:11])\nprotocol.delay(minutes=1, seconds=5)"
+    report = analyze_protocol(flex_protocol(body))
+    kinds = [step["kind"] for step in report.steps]
+    assert kinds[0] == "pick_up_tip" and kinds[-2] == "drop_tip"
+    assert kinds.count("dispense") == 10
+    assert report.steps[-1] == {"kind": "delay", "slot": None, "seconds": 65.0}
+
+
+# --- QC gate ---
+
+def test_gate_verdicts(monkeypatch):
+    monkeypatch.setattr(static_analyzer, "STATIC_GATE", True)
+    monkeypatch.setattr(static_analyzer, "SKIP_CONFIDENT_SIMULATION", True)
+    passing = flex_protocol(LOADS + "p.pick_up_tip()\np.drop_tip()")
+    assert check_before_simulation(passing) == ""
+    assert check_before_simulation(flex_protocol(LOADS + "p.drop_tip()")).startswith("Static analysis found")
+    assert check_before_simulation(flex_protocol("import math\nprotocol.comment(str(math.pi))")) is None
+
+    monkeypatch.setattr(static_analyzer, "SKIP_CONFIDENT_SIMULATION", False)
+    assert check_before_simulation(passing) is None
+    monkeypatch.setattr(static_analyzer, "STATIC_GATE", False)
+    assert check_before_simulation(flex_protocol(LOADS + "p.drop_tip()")) is None
@@ -0,0 +1,43 @@
+from utils.tip_optimizer import optimize_tip_usage
+
+LOADS = """tips = protocol.load_labware("opentrons_flex_96_tiprack_200ul", "D1")
+{plate} = protocol.load_labware("nest_96_wellplate_200ul_flat", "C2")
+reservoir = protocol.load_labware("nest_12_reservoir_15ml", "D2")
+p = protocol.load_instrument("flex_1channel_1000", "right", tip_racks=[tips])
+"""
+
+ADD_BUFFER = """for well in {plate}.wells()[:24]:
+    p.pick_up_tip()
+    p.aspirate(50, reservoir["A1"])
+    p.dispense(50, well)
+    p.drop_tip()
+"""
+
+
+def test_empty_plate_gets_distribute():
+    code, report = optimize_tip_usage(LOADS.format(plate="dest") + ADD_BUFFER.format(plate="dest"))
+    assert "p.distribute(50, reservoir['A1'], [well for well in dest.wells()[:24]], new_tip=\"once\")" in code
+    assert report["tips_saved"] == 23
+
+
+def test_sample_plate_is_dispensed_into_from_the_top():
+    # "add 50 µL of buffer to each of 24 samples": the wells hold the user's samples
+    code, report = optimize_tip_usage(LOADS.format(plate="samples") + ADD_BUFFER.format(plate="samples"))
+    assert "distribute" not in code
+    assert "p.dispense(50, well.top())" in code
+    assert report["rewrites"][0]["kind"] == "single_tip"
+
+
+def test_plate_used_elsewhere_is_not_assumed_empty():
+    code, _ = optimize_tip_usage(
+        LOADS.format(plate="plate") + 'p.pick_up_tip()\np.mix(3, 50, plate["A1"])\np.drop_tip()\n'
+        + ADD_BUFFER.format(plate="plate")
+    )
+    assert "distribute" not in code
+    assert "p.dispense(50, well.top())" in code
+
+
+def test_small_volumes_into_occupied_wells_keep_fresh_tips():
+    body = LOADS.format(plate="samples") + ADD_BUFFER.format(plate="samples").replace("50", "10")
+    code, report = optimize_tip_usage(body)
+    assert code == body and not report["rewrites"]
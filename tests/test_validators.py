@@ -0,0 +1,33 @@
+import pytest
+
+from utils.validators import ValidationError, structural_checks
+
+PROTOCOL = """from opentrons import protocol_api
+
+requirements = {{"robotType": "Flex", "apiLevel": "2.19"}}
+
+def run(protocol):
+    tips = protocol.load_labware("opentrons_flex_96_tiprack_50ul", "D1")
+    plate = protocol.load_labware("nest_96_wellplate_200ul_flat", "C2")
+    protocol.load_trash_bin("A3")
+    p = protocol.load_instrument("flex_1channel_50", "left", tip_racks=[tips])
+    p.pick_up_tip()
+    p.aspirate({volume}, plate["A1"])
+    p.dispense({volume}, plate["A2"])
+    p.drop_tip()
+"""
+
+
+def test_structural_checks_pass():
+    structural_checks(PROTOCOL.format(volume=20))
+
+
+def test_small_volumes_are_rejected():
+    # Above the 1 µL pipette minimum, but below the 5 µL reliability threshold
+    with pytest.raises(ValidationError, match="below safe accuracy threshold"):
+        structural_checks(PROTOCOL.format(volume=2))
+
+
+def test_analyzer_errors_are_raised():
+    with pytest.raises(ValidationError, match="without a tip attached"):
+        structural_checks(PROTOCOL.format(volume=20).replace("    p.pick_up_tip()\n", ""))
@@ -0,0 +1,136 @@
+"""
+BM25 inverted index stored next to the vector index.
+
+Exact API identifiers ("load_trash_bin", "flex_8channel_1000") are kept as
+whole tokens and also split at underscores, so both the identifier and its
+words match. Rows line up with the rows of the vector store.
+
+Files in the index directory:
+    bm25_terms.txt          vocabulary, one term per line (line number = term ID)
+    bm25_term_offsets.npy   int64 start of each term's postings (plus the end)
+    bm25_postings.npy       int32 row IDs, grouped by term
+    bm25_tfs.npy            uint16 term frequency for each posting
+    bm25_doc_lens.npy       int32 token count of each row
+
+The .npy files are memory-mapped; only the vocabulary is read into a dict.
+"""
+import os
+import re
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+TERMS_FILE = "bm25_terms.txt"
+TERM_OFFSETS_FILE = "bm25_term_offsets.npy"
+POSTINGS_FILE = "bm25_postings.npy"
+TFS_FILE = "bm25_tfs.npy"
+DOC_LENS_FILE = "bm25_doc_lens.npy"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def bm25_tokenize(text: str) -> List[str]:
+    tokens = []
+    # The converted reference escapes underscores in identifiers ("load\_labware")
+    for token in TOKEN_RE.findall(text.lower().replace("\\_", "_")):
+        token = token.strip("_")
+        if not token:
+            continue
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if part)
+    return tokens
+
+
+def write_bm25_index(persist_dir: str, texts: List[str]):
+    term_ids = {}
+    postings: List[List[Tuple[int, int]]] = []
+    doc_lens = []
+
+    for row, text in enumerate(texts):
+        tokens = bm25_tokenize(text)
+        doc_lens.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            if term not in term_ids:
+                term_ids[term] = len(term_ids)
+                postings.append([])
+            postings[term_ids[term]].append((row, tf))
+
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    rows = np.fromiter((row for p in postings for row, _ in p), dtype=np.int32, count=int(offsets[-1]))
+    tfs = np.fromiter(
+        (min(tf, 65535) for p in postings for _, tf in p), dtype=np.uint16, count=int(offsets[-1])
+    )
+
+    with open(os.path.join(persist_dir, TERMS_FILE), "w", encoding="utf-8") as f:
+        f.write("\n".join(term_ids))
+    np.save(os.path.join(persist_dir, TERM_OFFSETS_FILE), offsets)
+    np.save(os.path.join(persist_dir, POSTINGS_FILE), rows)
+    np.save(os.path.join(persist_dir, TFS_FILE), tfs)
+    np.save(os.path.join(persist_dir, DOC_LENS_FILE), np.asarray(doc_lens, dtype=np.int32))
+
+
+def bm25_index_exists(persist_dir: str) -> bool:
+    return all(
+        os.path.exists(os.path.join(persist_dir, name))
+        for name in (TERMS_FILE, TERM_OFFSETS_FILE, POSTINGS_FILE, TFS_FILE, DOC_LENS_FILE)
+    )
+
+
+class BM25Index:
+    def __init__(self, persist_dir: str, k1: float = BM25_K1, b: float = BM25_B):
+        with open(os.path.join(persist_dir, TERMS_FILE), "r", encoding="utf-8") as f:
+            text = f.read()
+        self.term_ids = {term: i for i, term in enumerate(text.split("\n"))} if text else {}
+        self.offsets = np.load(os.path.join(persist_dir, TERM_OFFSETS_FILE), mmap_mode="r")
+        self.postings = np.load(os.path.join(persist_dir, POSTINGS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(persist_dir, TFS_FILE), mmap_mode="r")
+        doc_lens = np.load(os.path.join(persist_dir, DOC_LENS_FILE)).astype(np.float32)
+        self.k1 = k1
+        avgdl = float(doc_lens.mean()) if len(doc_lens) else 1.0
+        # Per-row length normalization is fixed, so precompute it once
+        self._norm = k1 * (1 - b + b * doc_lens / (avgdl or 1.0))
+
+    def __len__(self) -> int:
+        return len(self._norm)
+
+    def close(self):
+        # np.load memmaps unmap once nothing references them
+        self.offsets = self.postings = self.tfs = None
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self), dtype=np.float32)
+        n = len(self)
+        for term in set(bm25_tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            rows = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            np.add.at(scores, rows, idf * tf * (self.k1 + 1) / (tf + self._norm[rows]))
+        return scores
+
+    def search_rows(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """(row, score) for the best-matching rows, best first; rows with no match are left out."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0 or top_k <= 0:
+            return []
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+def load_bm25_index(persist_dir: str):
+    if not bm25_index_exists(persist_dir):
+        return None
+    return BM25Index(persist_dir)
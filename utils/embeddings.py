@@ -0,0 +1,262 @@
+"""
+Pluggable embedding backends for the RAG index.
+
+    openai  OpenAI text-embedding-ada-002 (network, the original behaviour)
+    local   sentence-transformers model on CPU (offline once the model is cached;
+            pip install sentence-transformers)
+    hashed  hashed TF-IDF, no model and no network; IDF weights are fitted on
+            the indexed chunks and saved next to the vectors
+
+The backend and its settings are recorded in the index manifest, and
+load_embedder() rebuilds the same embedder for queries against that index.
+
+Settings (environment variables):
+    CORNUCOPIA_EMBED_BACKEND       backend for new indexes (default openai)
+    CORNUCOPIA_LOCAL_EMBED_MODEL   local model (default sentence-transformers/all-MiniLM-L6-v2)
+    CORNUCOPIA_HASH_DIM            hashed feature dimensions (default 2048)
+    CORNUCOPIA_EMBED_WORKERS       processes for CPU backends (default 1 = in-process)
+    CORNUCOPIA_EMBED_BATCH         texts per batch (default 64)
+"""
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+from utils.vector_store import load_manifest
+
+EMBED_BACKEND = os.getenv("CORNUCOPIA_EMBED_BACKEND", "openai")
+OPENAI_EMBED_MODEL = "text-embedding-ada-002"
+LOCAL_EMBED_MODEL = os.getenv(
+    "CORNUCOPIA_LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+HASH_DIM = int(os.getenv("CORNUCOPIA_HASH_DIM", "2048"))
+EMBED_WORKERS = int(os.getenv("CORNUCOPIA_EMBED_WORKERS", "1"))
+EMBED_BATCH = int(os.getenv("CORNUCOPIA_EMBED_BATCH", "64"))
+
+IDF_FILE = "idf.npy"
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def batches(texts: List[str], size: int) -> List[List[str]]:
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+
+def map_batches(fn, texts: List[str], workers: int, batch_size: int, initializer=None, initargs=()):
+    """Run fn over batches of texts, across a process pool when workers > 1."""
+    chunks = batches(texts, batch_size)
+    if workers <= 1 or len(chunks) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        results = [fn(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)), initializer=initializer, initargs=initargs
+        ) as pool:
+            results = list(pool.map(fn, chunks))
+    return np.vstack(results) if results else np.zeros((0, 0), dtype=np.float32)
+
+
+# --- hashed TF-IDF ---
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _hashed_tf(texts: List[str], dim: int = HASH_DIM) -> np.ndarray:
+    """Sublinear term frequencies folded into dim buckets with signed feature hashing."""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token, count in Counter(tokenize(text)).items():
+            # crc32, unlike hash(), is stable across processes and runs
+            h = zlib.crc32(token.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            matrix[row, h % dim] += sign * (1.0 + math.log(count))
+    return matrix
+
+
+class _HashedTfBatch:
+    """Picklable batch function for the process pool."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        return _hashed_tf(texts, self.dim)
+
+
+class HashedTfidfEmbedder:
+    name = "hashed"
+    # IDF depends on the whole corpus, so any source change re-embeds every chunk
+    fitted = True
+
+    def __init__(self, dim: int = HASH_DIM, workers: int = EMBED_WORKERS, batch_size: int = EMBED_BATCH):
+        self.dim = dim
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idf = np.ones(dim, dtype=np.float32)
+
+    def config(self) -> dict:
+        return {"backend": self.name, "dim": self.dim}
+
+    def fit(self, texts: List[str]):
+        df = np.zeros(self.dim, dtype=np.float32)
+        for text in texts:
+            buckets = {zlib.crc32(t.encode("utf-8")) % self.dim for t in set(tokenize(text))}
+            df[list(buckets)] += 1
+        self.idf = np.log((1 + len(texts)) / (1 + df)).astype(np.float32) + 1.0
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        tf = map_batches(_HashedTfBatch(self.dim), texts, self.workers, self.batch_size)
+        return tf * self.idf if len(texts) else np.zeros((0, self.dim), dtype=np.float32)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return _hashed_tf([text], self.dim)[0] * self.idf
+
+    def save(self, persist_dir: str):
+        np.save(os.path.join(persist_dir, IDF_FILE), self.idf)
+
+    def load(self, persist_dir: str):
+        self.idf = np.load(os.path.join(persist_dir, IDF_FILE))
+
+
+# --- local sentence-transformers model ---
+
+_local_model = None
+
+
+def _init_local_model(model_name: str):
+    global _local_model
+    if _local_model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "The local embedding backend needs sentence-transformers: pip install sentence-transformers"
+            )
+        _local_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_local_batch(texts: List[str]) -> np.ndarray:
+    return _local_model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+
+
+class LocalEmbedder:
+    name = "local"
+    fitted = False
+
+    def __init__(self, model: str = LOCAL_EMBED_MODEL, workers: int = EMBED_WORKERS, batch_size: int = EMBED_BATCH):
+        self.model = model
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def config(self) -> dict:
+        return {"backend": self.name, "model": self.model}
+
+    def fit(self, texts: List[str]):
+        pass
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        # Each pool process loads the model once in its initializer
+        return map_batches(
+            _encode_local_batch, texts, self.workers, self.batch_size,
+            initializer=_init_local_model, initargs=(self.model,),
+        )
+
+    def embed_query(self, text: str) -> np.ndarray:
+        _init_local_model(self.model)
+        return _encode_local_batch([text])[0]
+
+    def save(self, persist_dir: str):
+        pass
+
+    def load(self, persist_dir: str):
+        pass
+
+
+# --- OpenAI ---
+
+class OpenAIEmbedder:
+    name = "openai"
+    fitted = False
+
+    def __init__(self, model: str = OPENAI_EMBED_MODEL, batch_size: int = EMBED_BATCH):
+        self.model = model
+        self.batch_size = batch_size
+        self._client = None
+
+    def config(self) -> dict:
+        return {"backend": self.name, "model": self.model}
+
+    def _embed_model(self):
+        if self._client is None:
+            from llama_index.embeddings.openai import OpenAIEmbedding
+
+            self._client = OpenAIEmbedding(
+                model_name=self.model,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                embed_batch_size=self.batch_size,
+            )
+        return self._client
+
+    def fit(self, texts: List[str]):
+        pass
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        embeddings = self._embed_model().get_text_embedding_batch(texts, show_progress=True)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return np.asarray(self._embed_model().get_query_embedding(text), dtype=np.float32)
+
+    def save(self, persist_dir: str):
+        pass
+
+    def load(self, persist_dir: str):
+        pass
+
+
+EMBEDDERS = {
+    "openai": OpenAIEmbedder,
+    "local": LocalEmbedder,
+    "hashed": HashedTfidfEmbedder,
+}
+
+
+def get_embedder(backend: str = None):
+    """New embedder for building an index."""
+    backend = backend or EMBED_BACKEND
+    if backend not in EMBEDDERS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {sorted(EMBEDDERS)}")
+    return EMBEDDERS[backend]()
+
+
+def embedder_from_config(config: dict, persist_dir: str = None):
+    """Embedder matching a manifest's "embedding" settings."""
+    backend = config.get("backend", "openai")
+    if backend == "hashed":
+        embedder = HashedTfidfEmbedder(dim=config["dim"])
+    elif backend == "local":
+        embedder = LocalEmbedder(model=config["model"])
+    elif backend == "openai":
+        embedder = OpenAIEmbedder(model=config.get("model", OPENAI_EMBED_MODEL))
+    else:
+        raise ValueError(f"Unknown embedding backend {backend!r}")
+    if persist_dir:
+        embedder.load(persist_dir)
+    return embedder
+
+
+def load_embedder(persist_dir: str):
+    """Embedder an existing index was built with, for embedding queries."""
+    manifest = load_manifest(persist_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No index manifest in {persist_dir}")
+    config = manifest["settings"].get("embedding", {"backend": "openai"})
+    return embedder_from_config(config, persist_dir)
@@ -1,3 +1,5 @@
+import re
+
 def get_fixed_header():
     return """
 metadata = {
@@ -13,3 +15,12 @@ requirements = {
 
 def run(protocol):
 """
+
+def get_api_level(code: str = None) -> str:
+    """apiLevel declared in `code` (requirements or metadata), else the fixed header's."""
+    for source in (code, get_fixed_header()):
+        if source:
+            m = re.search(r"""['"]apiLevel['"]\s*:\s*['"]([\d.]+)['"]""", source)
+            if m:
+                return m.group(1)
+    return ""
@@ -0,0 +1,210 @@
+"""
+Registry of RAG indexes, one or more per Opentrons API version.
+
+Indexes are discovered from index/*/manifest.json (create_index.py records
+the apiLevel of the doc it indexed). An index is only opened when a request
+first targets its version, and open indexes are kept in an LRU capped by
+their on-disk size (CORNUCOPIA_RAG_MEMORY_MB, default 512).
+
+The index directory is rescanned when a manifest appears, disappears or
+changes, so indexes that create_index.py builds while the app runs are
+picked up (and rebuilt ones reopened) without a restart.
+
+Requests are routed by apiLevel: the exact version if it is indexed,
+otherwise the newest indexed version below it (older docs still describe
+valid calls), otherwise the oldest one above it.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from utils.retrieval import HybridRetriever
+from utils.vector_store import MANIFEST_FILE, load_manifest
+
+INDEX_ROOT = "index"
+RAG_MEMORY_MB = float(os.getenv("CORNUCOPIA_RAG_MEMORY_MB", "512"))
+
+VERSION_FROM_NAME_RE = re.compile(r"(?:python_api_|^v)(\d)(\d+)_")
+
+
+def api_level_from_name(name: str) -> Optional[str]:
+    """'python_api_219_docs.md' / 'v219_ref' -> '2.19'."""
+    match = VERSION_FROM_NAME_RE.search(os.path.basename(name))
+    return f"{match.group(1)}.{match.group(2)}" if match else None
+
+
+def version_key(api_level: str):
+    return tuple(int(part) for part in api_level.split("."))
+
+
+def index_size(persist_dir: str) -> int:
+    return sum(
+        entry.stat().st_size for entry in os.scandir(persist_dir) if entry.is_file()
+    )
+
+
+class IndexRegistry:
+    def __init__(self, root: str = INDEX_ROOT, max_bytes: float = RAG_MEMORY_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.versions: Dict[str, List[str]] = {}  # apiLevel -> index names
+        self._loaded: "OrderedDict[str, HybridRetriever]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._failed = set()  # names already reported as unloadable
+        self._users: Dict[HybridRetriever, int] = {}  # retrievers_for() callers not yet released
+        self._retired = set()  # evicted while in use: closed on their last release()
+        self._manifest_mtimes: Dict[str, float] = {}
+        self.loads = 0
+        self.evictions = 0
+        self.scans = 0
+        self.scan()
+
+    def manifest_mtimes(self) -> Dict[str, float]:
+        """Index directory name -> manifest mtime, for directories that have one."""
+        mtimes = {}
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                try:
+                    mtimes[entry.name] = os.stat(os.path.join(entry.path, MANIFEST_FILE)).st_mtime
+                except OSError:
+                    pass
+        return mtimes
+
+    def scan(self):
+        """Re-read which indexes exist (e.g. after create_index ran)."""
+        mtimes = self.manifest_mtimes()
+        versions: Dict[str, List[str]] = {}
+        for name in sorted(mtimes):
+            try:
+                manifest = load_manifest(os.path.join(self.root, name))
+            except (OSError, ValueError):
+                manifest = None
+            if manifest is None:
+                continue
+            api_level = manifest.get("api_level") or api_level_from_name(name)
+            if api_level:
+                versions.setdefault(api_level, []).append(name)
+        self.versions = versions
+        self._manifest_mtimes = mtimes
+        self.scans += 1
+
+    def refresh(self):
+        """Rescan if an index was added, removed or rebuilt; rebuilt indexes are reopened on next use."""
+        mtimes = self.manifest_mtimes()
+        if mtimes == self._manifest_mtimes:
+            return
+        changed = {
+            name for name in set(mtimes) | set(self._manifest_mtimes)
+            if mtimes.get(name) != self._manifest_mtimes.get(name)
+        }
+        self.scan()
+        with self._lock:
+            for name in changed:
+                self._failed.discard(name)
+                if name in self._loaded:
+                    self._retire(self._loaded.pop(name))
+                    del self._sizes[name]
+
+    def resolve(self, api_level: str) -> Optional[str]:
+        """Indexed version to use for a protocol's apiLevel."""
+        self.refresh()
+        if not self.versions:
+            return None
+        if api_level in self.versions:
+            return api_level
+        indexed = sorted(self.versions, key=version_key)
+        try:
+            wanted = version_key(api_level)
+        except (AttributeError, ValueError):
+            return indexed[-1]
+        older = [v for v in indexed if version_key(v) < wanted]
+        return older[-1] if older else indexed[0]
+
+    def _retire(self, retriever: HybridRetriever):
+        """Close a retriever dropped from the LRU, or once its last user releases it. Call with the lock held."""
+        if self._users.get(retriever):
+            self._retired.add(retriever)
+        else:
+            retriever.close()
+
+    def _use(self, retriever: HybridRetriever) -> HybridRetriever:
+        self._users[retriever] = self._users.get(retriever, 0) + 1
+        return retriever
+
+    def release(self, retrievers: List[HybridRetriever]):
+        """Done searching the retrievers from retrievers_for()."""
+        with self._lock:
+            for retriever in retrievers:
+                self._users[retriever] -= 1
+                if not self._users[retriever]:
+                    del self._users[retriever]
+                    if retriever in self._retired:
+                        self._retired.discard(retriever)
+                        retriever.close()
+
+    def _load(self, name: str) -> HybridRetriever:
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._use(self._loaded[name])
+
+        persist_dir = os.path.join(self.root, name)
+        retriever = HybridRetriever(persist_dir)
+        size = index_size(persist_dir)
+
+        with self._lock:
+            if name in self._loaded:  # another thread got there first
+                retriever.close()
+                return self._use(self._loaded[name])
+            self._loaded[name] = retriever
+            self._sizes[name] = size
+            self.loads += 1
+            self._use(retriever)
+            # A request still searching an evicted retriever keeps it open until release()
+            while sum(self._sizes.values()) > self.max_bytes and len(self._loaded) > 1:
+                evicted, evicted_retriever = self._loaded.popitem(last=False)
+                del self._sizes[evicted]
+                self._retire(evicted_retriever)
+                self.evictions += 1
+        return retriever
+
+    def retrievers_for(self, api_level: str) -> List[HybridRetriever]:
+        """Open retrievers for a version; hand them back with release() when done."""
+        version = self.resolve(api_level)
+        if version is None:
+            return []
+        retrievers = []
+        for name in self.versions.get(version, []):  # a rescan may have replaced versions
+            try:
+                retrievers.append(self._load(name))
+            except Exception as e:
+                if name not in self._failed:
+                    self._failed.add(name)
+                    print(f"⚠️ RAG index {name} unavailable: {e}")
+        return retrievers
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "versions": {v: names for v, names in sorted(self.versions.items())},
+                "loaded": list(self._loaded),
+                "loaded_mb": round(sum(self._sizes.values()) / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "scans": self.scans,
+                "in_use": sum(self._users.values()),
+            }
+
+
+_registry: Optional[IndexRegistry] = None
+
+
+def get_index_registry() -> IndexRegistry:
+    global _registry
+    if _registry is None:
+        _registry = IndexRegistry()
+    return _registry
@@ -0,0 +1,185 @@
+"""
+Structure-aware chunker for the markdown produced by convert_to_markdown.py.
+
+The doc is cut into blocks that must stay whole:
+    - a heading and the text under it, up to the next heading
+    - within a section, one API member: its signature line
+      ("aspirate(_self_, ...) → ...", "_property_ api_version", "_class_ ...")
+      through its description, parameters and examples
+    - fenced code blocks are never split, whatever their size
+
+Consecutive blocks are then packed into chunks of up to max_tokens, so short
+members and subsections share a chunk instead of each costing an embedding.
+A chunk never crosses a top-level (# or ##) section, nor a source document
+marker ("<!-- section: document-... -->", written by convert_to_markdown.py).
+Every chunk carries the heading path it sits under ("API Version 2
+Reference/Instruments"), the API members it documents and its source
+document as metadata. Headings restart at each marker, so chunking one
+section alone gives the same chunks as chunking the whole doc.
+"""
+import re
+from typing import List, Tuple
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# Sphinx member signatures as markdownify renders them; underscores in names
+# sometimes come out as "*" / "\_" ("air*gap(\_self*, ...")
+MEMBER_RE = re.compile(
+    r"^(?:_(?:class|property|classmethod|staticmethod|attribute|exception|method)_\s+)"
+    r"|^[A-Za-z][\w.*\\]*\((?:_|\\_)?self"
+    r"|^[A-Za-z][\w.*\\]*\(.*\)\s*→"
+)
+MEMBER_NAME_RE = re.compile(r"^(?:_\w+_\s+)?([A-Za-z][\w.*\\]*)")
+SECTION_MARKER = "<!-- section: {} -->"
+SECTION_MARKER_RE = re.compile(r"^<!-- section: (\S+) -->\s*$")
+
+DEFAULT_MAX_TOKENS = 1024
+SECTION_DEPTH = 2  # chunks don't cross headings at this level or above
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def member_name(signature: str) -> str:
+    name = MEMBER_NAME_RE.match(signature).group(1)
+    name = name.replace("\\_", "_").replace("*", "_").replace("\\", "")
+    return name.split(".")[-1].strip("_")
+
+
+def split_sections(markdown: str) -> List[Tuple[str, str]]:
+    """(section ID, text) for each source document marker; "" for text before the first."""
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    for line in markdown.splitlines():
+        marker = SECTION_MARKER_RE.match(line)
+        if marker:
+            sections.append((marker.group(1), []))
+        else:
+            sections[-1][1].append(line)
+    return [(section_id, "\n".join(lines)) for section_id, lines in sections if section_id or any(lines)]
+
+
+def split_blocks(markdown: str) -> List[dict]:
+    """Cut the doc into unsplittable blocks: {"text", "path" (heading names), "member", "section"}."""
+    blocks = []
+    path: List[str] = []
+    current: List[str] = []
+    member = None
+    section = ""
+    in_fence = False
+
+    def flush():
+        text = "\n".join(current).strip()
+        if text:
+            blocks.append({"text": text, "path": list(path), "member": member, "section": section})
+        current.clear()
+
+    for line in markdown.splitlines():
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+            current.append(line)
+            continue
+        if in_fence:
+            current.append(line)
+            continue
+
+        marker = SECTION_MARKER_RE.match(line)
+        if marker:
+            flush()
+            section = marker.group(1)
+            path, member = [], None
+            continue
+
+        heading = HEADING_RE.match(line)
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            path[level - 1:] = [heading.group(2).replace("\\", "")]
+            # Missing intermediate levels would shift the path; pad them
+            while len(path) < level:
+                path.insert(len(path) - 1, "")
+            member = None
+            current.append(line)
+        elif MEMBER_RE.match(line):
+            flush()
+            member = member_name(line)
+            current.append(line)
+        else:
+            current.append(line)
+    flush()
+    return blocks
+
+
+def common_path(blocks: List[dict]) -> List[str]:
+    """Deepest heading path shared by all blocks of a chunk."""
+    path = blocks[0]["path"]
+    for block in blocks[1:]:
+        n = 0
+        while n < min(len(path), len(block["path"])) and path[n] == block["path"][n]:
+            n += 1
+        path = path[:n]
+    return path
+
+
+def split_paragraphs(text: str, max_tokens: int) -> List[str]:
+    """Split an oversized block at blank lines outside code fences."""
+    parts, current, size, in_fence = [], [], 0, False
+    for line in text.splitlines():
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+        if not line.strip() and not in_fence and size >= max_tokens:
+            parts.append("\n".join(current).strip())
+            current, size = [], 0
+            continue
+        current.append(line)
+        size += estimate_tokens(line)
+    if current:
+        parts.append("\n".join(current).strip())
+    return [part for part in parts if part]
+
+
+def chunk_markdown(markdown: str, max_tokens: int = DEFAULT_MAX_TOKENS) -> List[dict]:
+    """
+    Chunks of a converted markdown doc, in document order:
+    {"text", "metadata": {"header_path", "symbols", "section"}}.
+    """
+    chunks = []
+    pending: List[dict] = []
+    pending_tokens = 0
+
+    def emit():
+        nonlocal pending_tokens
+        if not pending:
+            return
+        symbols = [block["member"] for block in pending if block["member"]]
+        chunks.append({
+            "text": "\n\n".join(block["text"] for block in pending),
+            "metadata": {
+                "header_path": "/".join(name for name in common_path(pending) if name),
+                "symbols": ", ".join(dict.fromkeys(symbols)),
+                "section": pending[0]["section"],
+            },
+        })
+        pending.clear()
+        pending_tokens = 0
+
+    for block in split_blocks(markdown):
+        tokens = estimate_tokens(block["text"])
+        if tokens > max_tokens:
+            emit()
+            for part in split_paragraphs(block["text"], max_tokens):
+                pending.append(dict(block, text=part))
+                emit()
+            continue
+        same_section = (
+            pending
+            and pending[0]["section"] == block["section"]
+            and pending[0]["path"][:SECTION_DEPTH] == block["path"][:SECTION_DEPTH]
+        )
+        if pending and (not same_section or pending_tokens + tokens > max_tokens):
+            emit()
+        pending.append(block)
+        pending_tokens += tokens
+    emit()
+    return chunks
@@ -0,0 +1,228 @@
+"""
+Hybrid retrieval over an index directory: dense vectors + BM25, fused with
+reciprocal rank fusion (RRF).
+
+RRF only looks at ranks, so the cosine and BM25 scores never need to be
+put on the same scale: score(row) = sum over retrievers of 1 / (RRF_K + rank).
+
+get_protocol_context() packs the best snippets for a generation request into
+a token budget (CORNUCOPIA_RAG_* settings below). Contexts for free-form
+prompts are kept in a semantic cache (utils/semantic_cache.py), so a
+near-duplicate prompt reuses the context of an earlier one.
+"""
+import os
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from utils.bm25 import load_bm25_index
+from utils.embeddings import load_embedder
+from utils.markdown_chunker import estimate_tokens
+from utils.semantic_cache import SemanticCache
+from utils.vector_store import load_vector_store
+
+RRF_K = 60
+CANDIDATES = 20  # results taken from each retriever before fusing
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked lists of row IDs into one (row, score) list, best first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever:
+    """Dense + BM25 retrieval over one index directory."""
+
+    def __init__(self, persist_dir: str):
+        self.persist_dir = persist_dir
+        self.store = load_vector_store(persist_dir)
+        if self.store is None:
+            raise FileNotFoundError(f"No vector index in {persist_dir}, run create_index.py first")
+        self.embedder = load_embedder(persist_dir)
+        self.bm25 = load_bm25_index(persist_dir)  # None for indexes built before BM25
+
+    def close(self):
+        """Release the index's memory maps; the retriever can't search afterwards."""
+        self.store.close()
+        if self.bm25 is not None:
+            self.bm25.close()
+
+    def search(
+        self, query: str, top_k: int = 5, candidates: int = CANDIDATES, query_embedding=None
+    ) -> List[dict]:
+        """
+        Top-k chunks for a query, each with its fused "score". query_embedding
+        skips embedding the query again when the caller already has it (it
+        must come from this index's embedder).
+        """
+        if query_embedding is None:
+            query_embedding = self.embedder.embed_query(query)
+        dense = [row for row, _ in self.store.search_rows(query_embedding, candidates)]
+        rankings = [dense]
+        if self.bm25 is not None:
+            rankings.append([row for row, _ in self.bm25.search_rows(query, candidates)])
+
+        results = []
+        for row, score in reciprocal_rank_fusion(rankings)[:top_k]:
+            node = self.store.node(row)
+            node["score"] = score
+            results.append(node)
+        return results
+
+
+# --- Context for protocol generation ---
+
+RAG_ENABLED = os.getenv("CORNUCOPIA_RAG", "1") != "0"
+RAG_TOP_K = int(os.getenv("CORNUCOPIA_RAG_TOP_K", "6"))
+RAG_TOKEN_BUDGET = int(os.getenv("CORNUCOPIA_RAG_TOKEN_BUDGET", "1500"))
+DEFAULT_API_LEVEL = "2.19"
+
+# Fixed queries for the known experiment types, so their context is
+# retrieved once and shared by every request of that type
+EXPERIMENT_QUERIES = {
+    "serial_dilution": "serial dilution transfer mix_after pick_up_tip aspirate dispense",
+    "pcr_setup": "PCR setup distribute master mix thermocycler temperature module",
+    "plate_washing": "plate washing aspirate dispense blow_out air_gap trash",
+    "sample_transfer": "transfer samples between plates pick_up_tip drop_tip new_tip",
+    "cell_culture": "cell culture media exchange heater-shaker module",
+    "enzyme_assay": "enzyme assay distribute substrate mix incubate",
+}
+
+_context_cache: Dict[Tuple[str, str], str] = {}  # (version, experiment type) -> context
+_semantic_caches: Dict[str, SemanticCache] = {}  # version -> free-form prompt contexts
+_context_lock = threading.Lock()
+
+
+def semantic_cache_for(version: str) -> SemanticCache:
+    with _context_lock:
+        if version not in _semantic_caches:
+            _semantic_caches[version] = SemanticCache()
+        return _semantic_caches[version]
+
+
+def context_cache_stats() -> dict:
+    with _context_lock:
+        caches = dict(_semantic_caches)
+        fixed = len(_context_cache)
+    return {
+        "experiment_contexts": fixed,
+        "semantic": {version: cache.stats() for version, cache in sorted(caches.items())},
+    }
+
+
+def pack_context(results: List[dict], token_budget: int) -> str:
+    """Join snippets best-first, skipping any that would overflow the budget."""
+    parts, used, seen = [], 0, set()
+    for result in results:
+        if result["id"] in seen:
+            continue
+        heading = result.get("metadata", {}).get("header_path", "").strip("/")
+        snippet = f"### {heading}\n{result['text'].strip()}" if heading else result["text"].strip()
+        cost = estimate_tokens(snippet)
+        if used + cost > token_budget:
+            continue
+        parts.append(snippet)
+        used += cost
+        seen.add(result["id"])
+    return "\n\n".join(parts)
+
+
+def can_reuse_embedding(retriever: HybridRetriever, embedder) -> bool:
+    """
+    Whether a query embedded by `embedder` can be searched in retriever's
+    index. Each retriever loads its own embedder, so this compares configs;
+    fitted embedders (hashed TF-IDF) carry per-index weights, so only the
+    index the embedding came from can reuse it.
+    """
+    return retriever.embedder is embedder or (
+        not embedder.fitted and retriever.embedder.config() == embedder.config()
+    )
+
+
+def get_protocol_context(
+    clean_prompt: str,
+    experiment_type: str = "generic",
+    api_level: str = DEFAULT_API_LEVEL,
+    top_k: int = RAG_TOP_K,
+    token_budget: int = RAG_TOKEN_BUDGET,
+) -> str:
+    """
+    API documentation snippets for a generation request, at most token_budget
+    tokens, from the indexes of the protocol's apiLevel (see
+    utils/index_registry.py). Known experiment types share one cached context
+    per version; other prompts go through the version's semantic cache, so
+    near-duplicates skip retrieval and exact repeats skip the embedding too.
+    Returns "" when RAG is disabled or no index is available.
+    """
+    if not RAG_ENABLED:
+        return ""
+
+    # Imported here because the registry builds on HybridRetriever above
+    from utils.index_registry import get_index_registry
+
+    registry = get_index_registry()
+    version = registry.resolve(api_level)
+    if version is None:
+        return ""
+
+    fixed_query = experiment_type in EXPERIMENT_QUERIES
+    query = EXPERIMENT_QUERIES[experiment_type] if fixed_query else clean_prompt
+    key = (version, experiment_type)
+    cache = semantic_cache_for(version)
+    if fixed_query:
+        with _context_lock:
+            if key in _context_cache:
+                return _context_cache[key]
+    elif cache.enabled:
+        context = cache.lookup(query)
+        if context is not None:
+            return context
+
+    retrievers = registry.retrievers_for(version)
+    try:
+        if not retrievers:
+            return ""
+
+        # Embed the prompt once: it is the semantic cache key and, for indexes
+        # built with the same embedder, the dense query
+        embedder = retrievers[0].embedder
+        embedding, failed = None, False
+        if not fixed_query and cache.enabled:
+            try:
+                embedding = embedder.embed_query(query)
+            except Exception as e:
+                failed = True
+                print(f"⚠️ RAG query embedding failed: {e}")
+            if embedding is not None:
+                hit = cache.search(embedding)
+                if hit is not None:
+                    return hit[0]
+
+        results = []
+        for retriever in retrievers:
+            shared = embedding is not None and can_reuse_embedding(retriever, embedder)
+            try:
+                results.extend(
+                    retriever.search(query, top_k=top_k, query_embedding=embedding if shared else None)
+                )
+            except Exception as e:
+                failed = True
+                print(f"⚠️ RAG retrieval failed for {retriever.persist_dir}: {e}")
+        # RRF scores are comparable across indexes of the same shape
+        results.sort(key=lambda result: result["score"], reverse=True)
+        context = pack_context(results, token_budget)
+
+        # Don't pin a partial context from a transient failure (e.g. embedding API down)
+        if not failed:
+            if fixed_query:
+                with _context_lock:
+                    _context_cache[key] = context
+            elif embedding is not None:
+                cache.put(query, embedding, context)
+        return context
+    finally:
+        # Lets the registry close retrievers evicted while this request used them
+        registry.release(retrievers)
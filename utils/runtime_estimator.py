@@ -0,0 +1,357 @@
+"""
+Run-time estimates for protocols, from a timing model of the Flex.
+
+A protocol is reduced to steps (dicts with a "kind" and, depending on the
+kind, "slot", "volume", "flow_rate", "pipette", "seconds"). The steps come
+from one of three places:
+    the static analyzer's trace      utils/static_analyzer.py (no simulation)
+    an opentrons_simulate run log    steps_from_simulation_log()
+    robot-server commands            steps_from_commands(), for runs and analyses
+
+Each step costs a fixed overhead for its kind. Aspirates and dispenses add
+volume / flow rate, and moving to another deck slot adds a slot-change
+time plus travel at a fitted seconds per mm. Delays count at face value.
+
+The parameters ship with rough defaults. calibrate_runtime.py fits them
+from completed robot runs and writes CORNUCOPIA_RUNTIME_MODEL
+(default runtime_model.json), which load_timing_model() picks up.
+"""
+import json
+import math
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RUNTIME_MODEL_PATH = os.getenv("CORNUCOPIA_RUNTIME_MODEL", "runtime_model.json")
+
+DEFAULT_PARAMETERS = {
+    "pick_up_tip_s": 4.0,
+    "drop_tip_s": 3.0,
+    "aspirate_s": 1.0,
+    "dispense_s": 0.8,
+    "blow_out_s": 1.0,
+    "touch_tip_s": 2.0,
+    "liquid_time_scale": 1.0,  # × volume / flow rate
+    "slot_change_s": 1.5,  # raise, lower and settle when the next step is in another slot
+    "travel_s_per_mm": 0.004,
+    "run_overhead_s": 20.0,  # homing and setup at the start of a run
+}
+FIXED_COST_KINDS = ("pick_up_tip", "drop_tip", "aspirate", "dispense", "blow_out", "touch_tip")
+LIQUID_KINDS = {"aspirate", "dispense"}
+
+# Default flow rates (µL/s) at apiLevel 2.19 by pipette volume, when a step doesn't carry one
+DEFAULT_FLOW_RATES = {"aspirate": {1000: 716.0, 200: 716.0, 50: 35.0},
+                      "dispense": {1000: 716.0, 200: 716.0, 50: 57.0}}
+
+# Slot centers on the Flex deck (mm from D1)
+SLOT_PITCH_X, SLOT_PITCH_Y = 164.0, 107.0
+SLOT_RE = re.compile(r"([A-D][1-4])$")  # movableTrashA3, cutoutD1...
+WASTE_CHUTE_SLOT = "D3"  # 1ChannelWasteChute, 8ChannelWasteChute, gripperWasteChute...
+LOG_SLOT_RE = re.compile(r"on (?:slot )?([A-D][1-4])\b")
+PIPETTE_VOLUME_RE = re.compile(r"_(\d+)$")
+
+LOG_PATTERNS = [
+    ("pick_up_tip", re.compile(r"^Picking up tip")),
+    ("drop_tip", re.compile(r"^(?:Dropping|Returning) tip")),
+    ("aspirate", re.compile(r"^Aspirating ([\d.]+) uL .*? at ([\d.]+) uL/sec")),
+    ("dispense", re.compile(r"^Dispensing ([\d.]+) uL .*? at ([\d.]+) uL/sec")),
+    ("blow_out", re.compile(r"^Blowing out")),
+    ("touch_tip", re.compile(r"^Touching tip")),
+    ("delay", re.compile(r"^Delaying for (\d+) minutes and ([\d.]+) seconds")),
+]
+
+# robot-server commandType -> step kind
+COMMAND_KINDS = {
+    "pickUpTip": "pick_up_tip",
+    "dropTip": "drop_tip",
+    "moveToAddressableAreaForDropTip": "drop_tip",
+    "dropTipInPlace": "drop_tip",
+    "aspirate": "aspirate",
+    "aspirateInPlace": "aspirate",
+    "dispense": "dispense",
+    "dispenseInPlace": "dispense",
+    "blowout": "blow_out",
+    "blowOutInPlace": "blow_out",
+    "touchTip": "touch_tip",
+    "waitForDuration": "delay",
+}
+
+
+def slot_position(slot: Optional[str]):
+    if not slot or slot[0] not in "ABCD":
+        return None
+    return (int(slot[1]) - 1) * SLOT_PITCH_X, ("DCBA".index(slot[0])) * SLOT_PITCH_Y
+
+
+def slot_distance(a: Optional[str], b: Optional[str]) -> float:
+    pa, pb = slot_position(a), slot_position(b)
+    if pa is None or pb is None:
+        return 0.0
+    return math.hypot(pa[0] - pb[0], pa[1] - pb[1])
+
+
+def default_flow_rate(kind: str, pipette: Optional[str]) -> float:
+    rates = DEFAULT_FLOW_RATES[kind]
+    match = PIPETTE_VOLUME_RE.search(pipette or "")
+    return rates.get(int(match.group(1)), rates[1000]) if match else rates[1000]
+
+
+def step_features(step: dict, previous_slot: Optional[str]) -> Dict[str, float]:
+    """What a step costs in model units: fixed cost count, liquid seconds, travel."""
+    kind = step["kind"]
+    features = {f"{kind}_s": 1.0} if kind in FIXED_COST_KINDS else {}
+    if kind in LIQUID_KINDS and step.get("volume"):
+        flow_rate = step.get("flow_rate") or default_flow_rate(kind, step.get("pipette"))
+        features["liquid_time_scale"] = step["volume"] / flow_rate
+    slot = step.get("slot")
+    if slot and previous_slot and slot != previous_slot:
+        features["slot_change_s"] = 1.0
+        features["travel_s_per_mm"] = slot_distance(previous_slot, slot)
+    return features
+
+
+class TimingModel:
+    def __init__(self, parameters: dict = None, fitted_on: dict = None):
+        self.parameters = {**DEFAULT_PARAMETERS, **(parameters or {})}
+        self.fitted_on = fitted_on  # runs / commands / error of the last calibration
+
+    @property
+    def calibrated(self) -> bool:
+        return self.fitted_on is not None
+
+    def estimate(self, steps: List[dict]) -> dict:
+        """Expected duration of the steps, with a breakdown by kind."""
+        by_kind: Dict[str, float] = {"setup": self.parameters["run_overhead_s"]}
+        previous_slot = None
+        for step in steps:
+            if step["kind"] == "delay":
+                seconds = step.get("seconds", 0.0)
+            else:
+                features = step_features(step, previous_slot)
+                seconds = sum(self.parameters[name] * value for name, value in features.items())
+                previous_slot = step.get("slot") or previous_slot
+            by_kind[step["kind"]] = by_kind.get(step["kind"], 0.0) + seconds
+        total = sum(by_kind.values())
+        return {
+            "seconds": round(total, 1),
+            "minutes": round(total / 60, 1),
+            "steps": len(steps),
+            "by_kind": {kind: round(seconds, 1) for kind, seconds in by_kind.items()},
+            "calibrated": self.calibrated,
+        }
+
+    def to_dict(self) -> dict:
+        return {"parameters": self.parameters, "fitted_on": self.fitted_on}
+
+    def save(self, path: str = RUNTIME_MODEL_PATH):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+_model: Optional[TimingModel] = None
+_model_mtime: Optional[float] = None
+
+
+def load_timing_model(path: str = RUNTIME_MODEL_PATH) -> TimingModel:
+    """The calibrated model if calibrate_runtime.py wrote one (reloaded when it changes), else defaults."""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if _model is None or mtime != _model_mtime:
+        _model, _model_mtime = TimingModel(), mtime
+        if mtime is not None:
+            try:
+                with open(path, "r") as f:
+                    saved = json.load(f)
+                _model = TimingModel(saved.get("parameters"), saved.get("fitted_on"))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring runtime model {path}: {e}")
+    return _model
+
+
+# --- Step sources ---
+
+def steps_from_simulation_log(run_log: str) -> List[dict]:
+    """Steps from opentrons_simulate's run log (format_runlog text)."""
+    steps = []
+    for line in run_log.splitlines():
+        text = line.strip()
+        for kind, pattern in LOG_PATTERNS:
+            match = pattern.match(text)
+            if not match:
+                continue
+            step = {"kind": kind}
+            if kind == "delay":
+                step["seconds"] = int(match.group(1)) * 60 + float(match.group(2))
+            else:
+                slots = LOG_SLOT_RE.findall(text)
+                if slots:
+                    step["slot"] = slots[-1]
+                elif "Waste Chute" in text:
+                    step["slot"] = WASTE_CHUTE_SLOT
+                if kind in LIQUID_KINDS:
+                    step["volume"], step["flow_rate"] = float(match.group(1)), float(match.group(2))
+            steps.append(step)
+            break
+    return steps
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def steps_from_commands(commands: List[dict]) -> List[dict]:
+    """
+    Steps from robot-server commands (a run's /commands or a protocol
+    analysis). Finished commands also carry their measured "duration".
+    """
+    labware_slots: Dict[str, str] = {}
+    pipettes: Dict[str, str] = {}
+    steps = []
+    for command in commands:
+        command_type = command.get("commandType")
+        params = command.get("params") or {}
+        result = command.get("result") or {}
+        if command_type == "loadLabware":
+            location = params.get("location") or {}
+            slot = location.get("slotName") or location.get("addressableAreaName")
+            if not slot and location.get("labwareId"):  # on an adapter
+                slot = labware_slots.get(location["labwareId"])
+            if result.get("labwareId") and slot:
+                labware_slots[result["labwareId"]] = slot
+            continue
+        if command_type == "loadPipette":
+            if result.get("pipetteId"):
+                pipettes[result["pipetteId"]] = params.get("pipetteName")
+            continue
+
+        kind = COMMAND_KINDS.get(command_type)
+        if kind is None:
+            continue
+        started, completed = _parse_time(command.get("startedAt")), _parse_time(command.get("completedAt"))
+        duration = completed - started if started is not None and completed is not None else None
+
+        if command_type == "dropTipInPlace" and steps and steps[-1]["kind"] == "drop_tip":
+            # The trash drop is two commands: move to the bin, then drop
+            if duration is not None and "duration" in steps[-1]:
+                steps[-1]["duration"] += duration
+            continue
+
+        step = {"kind": kind, "pipette": pipettes.get(params.get("pipetteId"))}
+        if kind == "delay":
+            step["seconds"] = float(params.get("seconds", 0.0))
+        slot = labware_slots.get(params.get("labwareId"))
+        area = params.get("addressableAreaName")
+        if not slot and area:
+            match = SLOT_RE.search(area)
+            slot = match.group(1) if match else WASTE_CHUTE_SLOT if "WasteChute" in area else None
+        if slot:
+            step["slot"] = slot
+        if kind in LIQUID_KINDS:
+            step["volume"] = params.get("volume")
+            step["flow_rate"] = params.get("flowRate")
+        if duration is not None:
+            step["duration"] = duration
+        steps.append(step)
+    return steps
+
+
+def estimate_protocol_file(path: str, model: TimingModel = None) -> Optional[dict]:
+    """
+    Estimate for a protocol file. Uses the static analyzer's trace when it
+    models the whole protocol, else the (cached) simulator run log; None if
+    neither works.
+    """
+    from utils.io_helpers import read_file
+    from utils.simulation_cache import simulate_with_cache
+    from utils.static_analyzer import analyze_protocol
+
+    model = model or load_timing_model()
+    try:
+        report = analyze_protocol(read_file(path))
+        if report.confident:
+            steps, source = report.steps, "static"
+        else:
+            result = simulate_with_cache(path)
+            if not result.ok:
+                return None
+            steps, source = steps_from_simulation_log(result.stdout), "simulation"
+    except Exception as e:
+        print(f"⚠️ Run-time estimate failed: {e}")
+        return None
+    return {**model.estimate(steps), "source": source}
+
+
+# --- Calibration ---
+
+def non_negative_least_squares(matrix: np.ndarray, measured: np.ndarray) -> np.ndarray:
+    """
+    Least squares with every coefficient >= 0: refit without the most
+    negative column, pinned to zero, until none is negative.
+    """
+    free = list(range(matrix.shape[1]))
+    coefficients = np.zeros(matrix.shape[1])
+    while free:
+        fitted, *_ = np.linalg.lstsq(matrix[:, free], measured, rcond=None)
+        if fitted.min() >= 0:
+            coefficients[free] = fitted
+            break
+        free.pop(int(np.argmin(fitted)))
+    return coefficients
+
+
+def fit_timing_model(runs: List[List[dict]], base: TimingModel = None) -> TimingModel:
+    """
+    Least-squares fit of the model parameters to the measured command
+    durations of completed runs (lists of robot-server commands). Kinds
+    that never occur keep the base model's values.
+    """
+    base = base or TimingModel()
+    rows, durations, overheads = [], [], []
+    for commands in runs:
+        steps = steps_from_commands(commands)
+        previous_slot = None
+        for step in steps:
+            if step["kind"] != "delay" and "duration" in step:
+                rows.append(step_features(step, previous_slot))
+                durations.append(step["duration"])
+            previous_slot = step.get("slot") or previous_slot
+        # Time spent outside modeled steps (homing, loads...)
+        started = [_parse_time(c.get("startedAt")) for c in commands]
+        completed = [_parse_time(c.get("completedAt")) for c in commands]
+        started = [t for t in started if t is not None]
+        completed = [t for t in completed if t is not None]
+        if started and completed:
+            modeled = sum(step.get("duration", 0.0) for step in steps)
+            overheads.append(max(0.0, max(completed) - min(started) - modeled))
+
+    names = sorted({name for row in rows for name in row})
+    if len(rows) <= len(names):
+        raise ValueError(f"Need more than {len(names)} timed commands to calibrate, got {len(rows)}")
+
+    matrix = np.array([[row.get(name, 0.0) for name in names] for row in rows])
+    measured = np.array(durations)
+    coefficients = non_negative_least_squares(matrix, measured)
+    parameters = dict(base.parameters)
+    parameters.update({name: float(value) for name, value in zip(names, coefficients)})
+    if overheads:
+        parameters["run_overhead_s"] = float(np.median(overheads))
+
+    predicted = matrix @ np.array([parameters[name] for name in names])
+    return TimingModel(parameters, fitted_on={
+        "runs": len(runs),
+        "commands": len(rows),
+        "mean_abs_error_s": round(float(np.mean(np.abs(predicted - measured))), 3),
+        "fitted_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
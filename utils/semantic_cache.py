@@ -0,0 +1,120 @@
+"""
+Semantic cache for documentation lookups.
+
+Entries are keyed on the query embedding: a new query whose embedding has
+cosine similarity >= threshold with a cached one gets that entry's value
+(a retrieval set, a packed context, an LLM answer...). Repeats of the exact
+same text (case and whitespace aside) are answered before any embedding is
+computed, so they cost neither an embedding call nor the work behind it.
+
+The cache holds at most max_entries values and evicts the least recently
+used. Embeddings live in one preallocated matrix, so a lookup is a single
+matrix-vector product.
+
+Settings (environment variables):
+    CORNUCOPIA_SEMANTIC_CACHE_SIZE       entries per cache (default 256, 0 disables)
+    CORNUCOPIA_SEMANTIC_CACHE_THRESHOLD  cosine similarity for a hit (default 0.95)
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("CORNUCOPIA_SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("CORNUCOPIA_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class SemanticCache:
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()  # text -> (slot, value)
+        self._matrix: Optional[np.ndarray] = None  # allocated on the first put, once the dim is known
+        self._used = np.zeros(max(max_entries, 0), dtype=bool)
+        self._slot_keys = [None] * max(max_entries, 0)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, text: str) -> Optional[Any]:
+        """Value cached for this exact query text; no embedding needed."""
+        key = normalize_query(text)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key][1]
+        return None
+
+    def search(self, embedding) -> Optional[Tuple[Any, float]]:
+        """(value, similarity) of the closest cached query above the threshold."""
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        with self._lock:
+            if self._matrix is None or not self._used.any() or not norm or query.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+            scores = self._matrix @ (query / norm)
+            scores[~self._used] = -1.0
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            key = self._slot_keys[slot]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return self._entries[key][1], float(scores[slot])
+
+    def put(self, text: str, embedding, value: Any):
+        if not self.enabled:
+            return
+        key = normalize_query(text)
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                # First entry, or the embedder changed: start over at the new dim
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._used[:] = False
+                self._entries.clear()
+
+            if key in self._entries:
+                slot = self._entries.pop(key)[0]
+            elif len(self._entries) >= self.max_entries:
+                _, (slot, _) = self._entries.popitem(last=False)
+            else:
+                slot = int(np.flatnonzero(~self._used)[0])
+
+            self._matrix[slot] = vector / norm if norm else 0.0
+            self._used[slot] = bool(norm)  # a zero vector can only be hit by exact text
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used[:] = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+            }
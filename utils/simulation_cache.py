@@ -0,0 +1,176 @@
+"""
+Content-addressed cache of simulation results.
+
+Keyed by a hash of the normalized protocol source plus its apiLevel, so a
+protocol that was already simulated (e.g. the same template regenerated) is a
+file lookup instead of another simulator run.
+
+Settings (environment variables):
+    CORNUCOPIA_SIM_CACHE       set to 0 to disable the cache
+    CORNUCOPIA_SIM_CACHE_DIR   on-disk location (default .cache/simulations)
+    CORNUCOPIA_SIM_CACHE_MAX   max cached protocols before LRU eviction (default 1000)
+    CORNUCOPIA_SIM_CACHE_TTL   entry lifetime in seconds (default 7 days)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from utils.fixed_header import get_api_level
+from utils.io_helpers import read_file
+from utils.simulator_pool import SimulationResult, get_simulator_pool
+
+
+def normalize_protocol(code: str) -> str:
+    """Drop differences that can't change the simulation, keeping line numbers stable for error messages."""
+    lines = []
+    for line in code.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        line = line.rstrip()
+        if line.lstrip().startswith("#"):
+            line = ""
+        lines.append(line)
+    return "\n".join(lines).rstrip("\n")
+
+
+def protocol_key(code: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(get_api_level(code).encode())
+    digest.update(b"\0")
+    digest.update(normalize_protocol(code).encode())
+    return digest.hexdigest()
+
+
+class SimulationCache:
+    """One JSON file per protocol key; file mtime doubles as the LRU access time."""
+
+    def __init__(self, cache_dir: str = None, max_entries: int = None, ttl_seconds: float = None):
+        self.cache_dir = cache_dir or os.getenv("CORNUCOPIA_SIM_CACHE_DIR", os.path.join(".cache", "simulations"))
+        self.max_entries = max_entries or int(os.getenv("CORNUCOPIA_SIM_CACHE_MAX", "1000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("CORNUCOPIA_SIM_CACHE_TTL", str(7 * 24 * 3600)))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, code: str) -> Optional[SimulationResult]:
+        path = self._path(protocol_key(code))
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self._count("hits")
+        return SimulationResult(ok=entry["ok"], stdout=entry["stdout"], stderr=entry["stderr"])
+
+    def put(self, code: str, result: SimulationResult):
+        if result.infrastructure_error:
+            return  # timeouts and crashes say more about the machine than the protocol
+        key = protocol_key(code)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "created": time.time(),
+            "api_level": get_api_level(code),
+            "ok": result.ok,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+        }
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _entries(self) -> list:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _mtime, path in entries[: len(entries) - self.max_entries]:
+            self._remove(path)
+            self._count("evictions")
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for _mtime, path in self._entries():
+            self._remove(path)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries()),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_simulation_cache() -> Optional[SimulationCache]:
+    """Process-wide cache, or None when disabled with CORNUCOPIA_SIM_CACHE=0."""
+    global _cache
+    if os.getenv("CORNUCOPIA_SIM_CACHE", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SimulationCache()
+        return _cache
+
+
+def simulate_with_cache(path: str) -> SimulationResult:
+    """Simulate the protocol at `path`, reusing the result of an identical earlier protocol."""
+    cache = get_simulation_cache()
+    if cache is None:
+        return get_simulator_pool().simulate(path)
+
+    code = read_file(path)
+    cached = cache.get(code)
+    if cached is not None:
+        return cached
+    result = get_simulator_pool().simulate(path)
+    cache.put(code, result)
+    return result
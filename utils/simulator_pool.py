@@ -0,0 +1,255 @@
+"""
+Pool of warm Opentrons simulator workers.
+
+Each worker is a long-lived process (utils/simulator_worker.py) that keeps the
+Opentrons API and labware definitions imported, so a protocol simulation costs
+a fraction of a second instead of a full `opentrons_simulate` start-up.
+
+Settings (environment variables):
+    CORNUCOPIA_SIM_WORKERS   number of workers (default 2)
+    CORNUCOPIA_SIM_TIMEOUT   per-protocol timeout in seconds (default 120)
+    CORNUCOPIA_SIM_MAX_JOBS  jobs a worker runs before it is recycled (default 100)
+    CORNUCOPIA_SIM_PYTHON    interpreter with `opentrons` installed (default: this one)
+    CORNUCOPIA_SIM_RETRY     seconds on `opentrons_simulate` after workers fail to start,
+                             doubled per consecutive failure up to 10 minutes (default 30)
+"""
+import atexit
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator_worker.py")
+STARTUP_TIMEOUT = 60.0
+STARTUP_RETRY = float(os.getenv("CORNUCOPIA_SIM_RETRY", "30"))
+STARTUP_RETRY_MAX = 600.0
+
+
+@dataclass
+class SimulationResult:
+    ok: bool
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+    timed_out: bool = False
+    infrastructure_error: bool = False  # the simulator failed, not the protocol (timeouts, crashes)
+
+
+class WorkerError(Exception):
+    pass
+
+
+class SimulatorWorker:
+    """One simulator process plus a reader thread feeding its stdout lines into a queue."""
+
+    def __init__(self, python: str):
+        self.proc = subprocess.Popen(
+            [python, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self.jobs_done = 0
+        self.ready = False
+        self._lines: queue.Queue = queue.Queue()
+        self._ids = itertools.count()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+
+    def _read_stdout(self):
+        for line in self.proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)  # EOF: process exited
+
+    def _next_message(self, timeout: float) -> dict:
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError
+        if line is None:
+            raise WorkerError("simulator worker exited unexpectedly")
+        return json.loads(line)
+
+    def wait_ready(self, timeout: float = STARTUP_TIMEOUT) -> None:
+        if self.ready:
+            return
+        try:
+            msg = self._next_message(timeout)
+        except TimeoutError:
+            raise WorkerError("simulator worker did not start in time")
+        if not msg.get("ready"):
+            raise WorkerError(msg.get("error", "simulator worker failed to start"))
+        self.ready = True
+
+    def run(self, path: str, timeout: float) -> dict:
+        job_id = next(self._ids)
+        try:
+            self.proc.stdin.write(json.dumps({"id": job_id, "path": path}) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f"simulator worker is gone: {e}")
+        msg = self._next_message(timeout)
+        self.jobs_done += 1
+        return msg
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self):
+        if self.alive():
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+class SimulatorPool:
+    """Thread-safe pool of warm simulator workers with per-job timeouts and crash recycling."""
+
+    def __init__(self, size: int = None, timeout: float = None, max_jobs_per_worker: int = None, python: str = None):
+        self.size = size or int(os.getenv("CORNUCOPIA_SIM_WORKERS", "2"))
+        self.timeout = timeout or float(os.getenv("CORNUCOPIA_SIM_TIMEOUT", "120"))
+        self.max_jobs_per_worker = max_jobs_per_worker or int(os.getenv("CORNUCOPIA_SIM_MAX_JOBS", "100"))
+        self.python = python or os.getenv("CORNUCOPIA_SIM_PYTHON", sys.executable)
+        self.startup_failures = 0  # in a row; workers are retried after a growing cooldown
+        self._retry_at = 0.0
+        self._idle: queue.Queue = queue.Queue()
+        self._slots = threading.Semaphore(self.size)
+        self._closed = False
+        self._started = False
+
+    @property
+    def available(self) -> bool:
+        """False while cooling down after workers failed to start (e.g. no Opentrons for self.python)."""
+        return time.monotonic() >= self._retry_at
+
+    def _startup_failed(self, reason: str):
+        if not self.available:
+            return  # another request already started the cooldown
+        self.startup_failures += 1
+        cooldown = min(STARTUP_RETRY * 2 ** (self.startup_failures - 1), STARTUP_RETRY_MAX)
+        self._retry_at = time.monotonic() + cooldown
+        print(f"⚠️ Simulator workers unavailable, using opentrons_simulate for {cooldown:.0f}s: {reason}")
+
+    def start(self):
+        """Spawn all workers now so the first request doesn't pay the import cost."""
+        if self._started:
+            return
+        self._started = True
+        for _ in range(self.size):
+            self._idle.put(SimulatorWorker(self.python))
+
+    def _acquire(self) -> SimulatorWorker:
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            worker = SimulatorWorker(self.python)
+        if not worker.alive():
+            worker.close()
+            worker = SimulatorWorker(self.python)
+        return worker
+
+    def _release(self, worker: SimulatorWorker):
+        if self._closed or not worker.alive() or worker.jobs_done >= self.max_jobs_per_worker:
+            worker.close()
+        else:
+            self._idle.put(worker)
+
+    def simulate(self, path: str) -> SimulationResult:
+        """Simulate a protocol file, returning its run log (stdout) and error text (stderr)."""
+        path = os.path.abspath(path)
+        if not self.available:
+            return simulate_subprocess(path, self.timeout)
+
+        start = time.monotonic()
+        with self._slots:
+            for attempt in range(2):  # one retry if the worker crashes mid-job
+                worker = self._acquire()
+                try:
+                    worker.wait_ready()
+                    msg = worker.run(path, self.timeout)
+                except TimeoutError:
+                    worker.close()
+                    return SimulationResult(
+                        ok=False,
+                        stderr=f"SimulationTimeout: protocol did not finish within {self.timeout:.0f}s",
+                        duration=time.monotonic() - start,
+                        timed_out=True,
+                        infrastructure_error=True,
+                    )
+                except WorkerError as e:
+                    worker.close()
+                    if not worker.ready:
+                        reason = str(e).strip().splitlines()[-1] if str(e).strip() else "unknown error"
+                        self._startup_failed(reason)
+                        return simulate_subprocess(path, self.timeout)
+                    if attempt == 0:
+                        continue
+                    return SimulationResult(
+                        ok=False,
+                        stderr=f"SimulatorCrashed: {e}",
+                        duration=time.monotonic() - start,
+                        infrastructure_error=True,
+                    )
+                self.startup_failures = 0
+                self._release(worker)
+                return SimulationResult(
+                    ok=msg["ok"],
+                    stdout=msg.get("stdout", ""),
+                    stderr=msg.get("stderr", ""),
+                    duration=time.monotonic() - start,
+                )
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def simulate_subprocess(path: str, timeout: float = None) -> SimulationResult:
+    """Cold path: one `opentrons_simulate` process per protocol."""
+    start = time.monotonic()
+    try:
+        proc = subprocess.run(
+            ["opentrons_simulate", path],
+            capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return SimulationResult(
+            ok=False,
+            stderr=f"SimulationTimeout: protocol did not finish within {timeout:.0f}s",
+            duration=time.monotonic() - start,
+            timed_out=True,
+            infrastructure_error=True,
+        )
+    return SimulationResult(
+        ok=proc.returncode == 0,
+        stdout=proc.stdout,
+        stderr=proc.stderr if proc.returncode != 0 else "",
+        duration=time.monotonic() - start,
+        infrastructure_error=proc.returncode < 0,  # killed by a signal
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_simulator_pool() -> SimulatorPool:
+    """Process-wide pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SimulatorPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,62 @@
+"""
+Long-lived Opentrons simulator worker.
+
+Started by utils/simulator_pool.py. Imports the Opentrons API once, then reads
+one JSON job per line on stdin ({"id": ..., "path": ...}) and writes one JSON
+result per line on stdout ({"id", "ok", "stdout", "stderr"}).
+
+Only depends on the standard library and `opentrons`, so it can be run by any
+interpreter that has Opentrons installed (see CORNUCOPIA_SIM_PYTHON).
+"""
+import json
+import os
+import sys
+import traceback
+
+
+def _format_error(exc: BaseException) -> str:
+    # Match what the `opentrons_simulate` CLI prints to stderr
+    if hasattr(exc, "to_stderr_string"):
+        return exc.to_stderr_string()
+    return traceback.format_exc()
+
+
+def run_job(simulate_module, path: str) -> dict:
+    """Simulate one protocol file in a fresh ProtocolContext."""
+    try:
+        with open(path, "r") as f:
+            runlog, _bundle = simulate_module.simulate(f, file_name=os.path.basename(path))
+        return {"ok": True, "stdout": simulate_module.format_runlog(runlog), "stderr": ""}
+    except BaseException as e:  # protocols may call sys.exit(); keep the worker alive
+        return {"ok": False, "stdout": "", "stderr": _format_error(e)}
+
+
+def main() -> int:
+    # Anything the protocol prints must not corrupt the result channel
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    try:
+        from opentrons import simulate
+    except Exception:
+        out.write(json.dumps({"ready": False, "error": traceback.format_exc()}) + "\n")
+        out.flush()
+        return 1
+
+    out.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        result = run_job(simulate, job["path"])
+        result["id"] = job.get("id")
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1152 @@
+"""
+Static analyzer for generated Opentrons protocols.
+
+Runs the run(protocol) body against a model of the Flex deck instead of
+opentrons_simulate. Loads are resolved to labware / pipette objects and
+loops are unrolled (up to CORNUCOPIA_STATIC_MAX_STEPS statements), so tip
+and volume bookkeeping is exact for the template code and for most of
+what the agent writes, in a few milliseconds.
+
+Errors are failures the simulator would hit as well: running out of tips,
+aspirating without a tip or past the pipette's capacity, two items in one
+deck slot, an undefined name. Warnings are likely mistakes the simulator
+accepts: a well filled past its capacity, a volume under the pipette's
+minimum.
+
+A protocol is `confident` when it only used calls, keyword arguments and
+labware the model covers, every argument had a type the model checks
+(wells, positive volumes) and it had no errors. check_before_simulation() turns that into the
+QC gate: errors reject the protocol without simulating, and confident
+protocols skip the simulator. The report also keeps the robot actions in
+order (`steps`), which utils/runtime_estimator.py prices into a run time.
+
+Settings (environment variables):
+    CORNUCOPIA_STATIC_GATE        set to 0 to always go straight to the simulator
+    CORNUCOPIA_STATIC_SKIP_SIM    set to 0 to simulate confident protocols too
+    CORNUCOPIA_STATIC_MAX_STEPS   statements to unroll before giving up (default 100000)
+"""
+import ast
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from utils.tip_optimizer import PIPETTE_MIN_VOLUME
+
+STATIC_GATE = os.getenv("CORNUCOPIA_STATIC_GATE", "1") != "0"
+SKIP_CONFIDENT_SIMULATION = os.getenv("CORNUCOPIA_STATIC_SKIP_SIM", "1") != "0"
+MAX_STEPS = int(os.getenv("CORNUCOPIA_STATIC_MAX_STEPS", "100000"))
+
+CHANNELS_PER_COLUMN = 8
+
+VALID_FLEX_SLOTS = {f"{r}{c}" for r in "ABCD" for c in "123"}
+STAGING_SLOTS = {f"{r}4" for r in "ABCD"}
+TRASH_SLOTS = {f"{r}{c}" for r in "ABCD" for c in "13"}
+# OT-2 style slot numbers, which the Flex API maps onto its grid
+OT2_SLOTS = {str(n): f"{'DCBA'[(n - 1) // 3]}{(n - 1) % 3 + 1}" for n in range(1, 13)}
+
+FLEX_PIPETTES = {
+    "flex_1channel_50", "flex_1channel_1000",
+    "flex_8channel_50", "flex_8channel_1000",
+    "flex_96channel_200", "flex_96channel_1000",
+}
+KNOWN_LABWARE = {
+    "opentrons_flex_96_tiprack_50ul",
+    "opentrons_flex_96_tiprack_200ul",
+    "opentrons_flex_96_tiprack_1000ul",
+    "opentrons_flex_96_filtertiprack_50ul",
+    "opentrons_flex_96_filtertiprack_200ul",
+    "opentrons_flex_96_filtertiprack_1000ul",
+    "nest_96_wellplate_200ul_flat",
+    "nest_96_wellplate_100ul_pcr_full_skirt",
+    "nest_96_wellplate_2ml_deep",
+    "corning_96_wellplate_360ul_flat",
+    "biorad_96_wellplate_200ul_pcr",
+    "corning_384_wellplate_112ul_flat",
+    "nest_12_reservoir_15ml",
+    "nest_1_reservoir_195ml",
+    "nest_1_reservoir_290ml",
+}
+# rows, columns by well count
+WELL_GRID = {96: (8, 12), 384: (16, 24), 12: (1, 12), 1: (1, 1), 24: (4, 6), 48: (6, 8), 6: (2, 3)}
+
+WELL_COUNT_RE = re.compile(r"_(\d+)_(?:wellplate|tiprack|filtertiprack|reservoir|tuberack)")
+VOLUME_RE = re.compile(r"_(\d+(?:\.\d+)?)(ul|ml)(?:_|$)")
+WELL_NAME_RE = re.compile(r"^([A-P])(\d+)$")
+EPSILON = 1e-6
+
+NO_OP_PROTOCOL_CALLS = {"comment", "delay", "pause", "home", "set_rail_lights"}
+NO_OP_PIPETTE_CALLS = {"blow_out", "touch_tip", "move_to", "home", "prepare_to_aspirate"}
+# Parameters the model checks, by call; other keyword arguments (mix_after,
+# blow_out, ...) change what runs, so they make the result not confident
+PROTOCOL_PARAMETERS = {
+    "load_labware": ("load_name", "location", "label", "namespace", "version"),
+    "load_adapter": ("load_name", "location", "namespace", "version"),
+    "load_trash_bin": ("location",),
+    "load_waste_chute": (),
+    "load_instrument": ("instrument_name", "mount", "tip_racks", "replace"),
+    "load_module": ("module_name", "location", "configuration"),
+    "delay": ("seconds", "minutes", "msg"),
+    "comment": ("msg",),
+    "pause": ("msg",),
+    "home": (),
+    "set_rail_lights": ("on",),
+}
+LIQUID_HANDLING_PARAMETERS = ("volume", "source", "dest", "new_tip", "mix_before", "mix_after")
+PIPETTE_PARAMETERS = {
+    "pick_up_tip": ("location",),
+    "drop_tip": ("location", "home_after"),
+    "return_tip": ("home_after",),
+    "aspirate": ("volume", "location", "rate"),
+    "dispense": ("volume", "location", "rate"),
+    "mix": ("repetitions", "volume", "location", "rate"),
+    "air_gap": ("volume", "height"),
+    "blow_out": ("location",),
+    "touch_tip": ("location", "radius", "v_offset", "speed"),
+    "move_to": ("location", "force_direct", "minimum_z_height", "speed"),
+    "home": (),
+    "prepare_to_aspirate": (),
+    "transfer": LIQUID_HANDLING_PARAMETERS,
+    "distribute": LIQUID_HANDLING_PARAMETERS,
+    "consolidate": LIQUID_HANDLING_PARAMETERS,
+}
+NEW_TIP_VALUES = ("always", "once", "never")
+# Values Python itself operates on; a TypeError between these is a real TypeError
+PLAIN_TYPES = (int, float, str, bool, list, tuple, dict, range, type(None))
+
+BUILTINS = {
+    "range": range, "len": len, "int": int, "float": float, "round": round, "min": min, "max": max,
+    "abs": abs, "list": list, "enumerate": enumerate, "zip": zip, "reversed": reversed,
+    "sorted": sorted, "sum": sum, "str": str,
+}
+
+
+@dataclass
+class StaticReport:
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    unsupported: List[str] = field(default_factory=list)  # why the result isn't confident
+    tips_used: Dict[str, int] = field(default_factory=dict)  # tip rack -> tips picked up
+    duration_ms: float = 0.0
+    steps: List[dict] = field(default_factory=list)  # robot actions in order, for run-time estimates
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def confident(self) -> bool:
+        return self.ok and not self.unsupported
+
+    def format_errors(self) -> str:
+        lines = [f"Static analysis found {len(self.errors)} problem(s) before simulation:"]
+        return "\n".join(lines + [f"  {error}" for error in self.errors])
+
+    def to_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "confident": self.confident,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "unsupported": self.unsupported,
+            "tips_used": self.tips_used,
+            "duration_ms": round(self.duration_ms, 2),
+            "steps": len(self.steps),
+        }
+
+
+class _Unknown:
+    """A value the model can't compute; using it makes the result not confident."""
+
+    def __repr__(self):
+        return "<unknown>"
+
+
+UNKNOWN = _Unknown()
+
+
+class _Stop(Exception):
+    """The protocol can't run past this point (or the step budget ran out)."""
+
+
+class ProtocolContextModel:
+    pass
+
+
+class LabwareModel:
+    def __init__(self, var: str, load_name: str, slot: Optional[str]):
+        self.var = var
+        self.load_name = load_name
+        self.slot = slot
+        match = WELL_COUNT_RE.search(load_name)
+        self.rows, self.columns = WELL_GRID.get(int(match.group(1)) if match else 96, (8, 12))
+        match = VOLUME_RE.search(load_name)
+        self.max_volume = float(match.group(1)) * (1000 if match.group(2) == "ml" else 1) if match else None
+        self.named = False
+        self.is_tiprack = "tiprack" in load_name
+        self.tips = [True] * (self.rows * self.columns) if self.is_tiprack else None
+        self.volumes = [0.0] * (self.rows * self.columns)
+        self.peak = 0.0
+        self.peak_line = 0
+        # Built once: loops call plate.wells() / columns() on every iteration
+        self._wells = [WellModel(self, i) for i in range(self.rows * self.columns)]
+        self._columns = [self._wells[c * self.rows:(c + 1) * self.rows] for c in range(self.columns)]
+        self._rows = [self._wells[r::self.rows] for r in range(self.rows)]
+
+    def well(self, index: int) -> "WellModel":
+        if not 0 <= index < len(self._wells):
+            raise IndexError(f"{self.var} has no well {index}")
+        return self._wells[index]
+
+    def wells(self) -> list:
+        return list(self._wells)
+
+    def columns_list(self) -> list:
+        return [list(column) for column in self._columns]
+
+    def rows_list(self) -> list:
+        return [list(row) for row in self._rows]
+
+    def index_of(self, name: str) -> int:
+        match = WELL_NAME_RE.match(name)
+        row = ord(match.group(1)) - ord("A") if match else -1
+        column = int(match.group(2)) - 1 if match else -1
+        if not (0 <= row < self.rows and 0 <= column < self.columns):
+            raise KeyError(f"{self.var} has no well {name}")
+        return column * self.rows + row
+
+
+class WellModel:
+    __slots__ = ("labware", "index")
+
+    def __init__(self, labware: LabwareModel, index: int):
+        self.labware = labware
+        self.index = index
+
+
+class TrashModel:
+    def __init__(self, slot: str):
+        self.slot = slot
+
+
+class ModuleModel:
+    def __init__(self, slot: Optional[str]):
+        self.slot = slot
+
+
+class PipetteModel:
+    def __init__(self, var: str, model: str, mount: str, tip_racks: list):
+        self.var = var
+        self.model = model
+        self.mount = mount
+        self.tip_racks = tip_racks
+        self.named = False
+        match = re.search(r"_(\d+)channel_(\d+)$", model)
+        self.channels = int(match.group(1)) if match else 1
+        self.nominal_volume = float(match.group(2)) if match else 1000.0
+        self.min_volume = PIPETTE_MIN_VOLUME.get(int(self.nominal_volume), 1.0)
+        self.has_tip = False
+        self.volume = 0.0
+        self.tip_volume = None  # of the tip on the pipette
+        self.tip_slot = None  # where that tip came from, for return_tip()
+
+    @property
+    def max_volume(self) -> float:
+        return min(self.nominal_volume, self.tip_volume or self.nominal_volume)
+
+
+class Method:
+    __slots__ = ("owner", "name")
+
+    def __init__(self, owner, name: str):
+        self.owner = owner
+        self.name = name
+
+
+class ProtocolAnalyzer:
+    def __init__(self, code: str, max_steps: int = MAX_STEPS):
+        self.code = code
+        self.max_steps = max_steps
+        self.report = StaticReport()
+        self.env: Dict[str, object] = {}
+        self.maybe_defined = set()  # names assigned inside code the model skipped
+        self.star_imported = False
+        self.slots: Dict[str, str] = {}  # slot -> what occupies it
+        self.mounts: Dict[str, str] = {}
+        self.labware: List[LabwareModel] = []
+        self.trash_loaded = False
+        self.trash_slot = None
+        self.steps = 0
+        self.line = 0
+
+    # --- reporting ---
+
+    def error(self, message: str, stop: bool = False):
+        error = f"line {self.line}: {message}"
+        if error not in self.report.errors:  # once per line, not per loop iteration
+            self.report.errors.append(error)
+        if stop:
+            raise _Stop()
+
+    def state_error(self, message: str, stop: bool = True):
+        """
+        An error that depends on tip, trash or volume state. Code the model
+        skipped may have changed that state, so after anything unsupported
+        it only makes the result not confident.
+        """
+        if self.report.unsupported:
+            self.unsupported(f"couldn't verify: {message}")
+            if stop:
+                raise _Stop()
+        else:
+            self.error(message, stop=stop)
+
+    def warn(self, message: str):
+        warning = f"line {self.line}: {message}"
+        if warning not in self.report.warnings:
+            self.report.warnings.append(warning)
+
+    def unsupported(self, message: str):
+        note = f"line {self.line}: {message}"
+        if note not in self.report.unsupported:
+            self.report.unsupported.append(note)
+
+    # --- entry point ---
+
+    def analyze(self) -> StaticReport:
+        start = time.perf_counter()
+        try:
+            tree = ast.parse(self.code)
+        except SyntaxError as e:
+            self.line = e.lineno or 0
+            self.error(f"SyntaxError: {e.msg}")
+            tree = None
+
+        if tree is not None:
+            body = tree.body
+            run = next((n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name == "run"), None)
+            if run is not None:
+                body = run.body
+                for node in tree.body:
+                    if node is not run:
+                        self.declare(node)
+                self.line = run.lineno
+                if self.robot_type(tree) != "Flex":
+                    self.unsupported("only Flex protocols are modeled")
+                    body = []
+                if run.args.args:
+                    self.env[run.args.args[0].arg] = ProtocolContextModel()
+            else:
+                self.env["protocol"] = ProtocolContextModel()  # a bare run() body
+            try:
+                self.exec_block(body)
+            except _Stop:
+                pass
+            self.finish()
+
+        self.report.duration_ms = (time.perf_counter() - start) * 1000
+        return self.report
+
+    @staticmethod
+    def robot_type(tree: ast.Module) -> str:
+        """requirements["robotType"] of a full protocol file (OT-2 when not given)."""
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == "requirements" for target in node.targets
+            ):
+                try:
+                    return ast.literal_eval(node.value).get("robotType", "OT-2")
+                except (ValueError, AttributeError):
+                    return "Flex"  # can't tell; let the pipette checks decide
+        return "OT-2"
+
+    def finish(self):
+        for labware in self.labware:
+            if labware.is_tiprack:
+                used = labware.tips.count(False)
+                if used:
+                    self.report.tips_used[labware.var] = used
+            elif labware.max_volume and labware.peak > labware.max_volume + EPSILON:
+                self.line = labware.peak_line
+                self.warn(
+                    f"wells of {labware.var} reach {labware.peak:g} µL, over their {labware.max_volume:g} µL"
+                )
+
+    # --- statements ---
+
+    def tick(self):
+        self.steps += 1
+        if self.steps > self.max_steps:
+            self.unsupported(f"stopped after {self.max_steps} steps")
+            raise _Stop()
+
+    def skip(self, node: ast.AST, reason: str):
+        """Code the model doesn't run: whatever it assigns becomes unknown."""
+        self.unsupported(reason)
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                self.maybe_defined.add(child.id)
+                self.env[child.id] = UNKNOWN
+            elif isinstance(child, (ast.FunctionDef, ast.ClassDef)):
+                self.maybe_defined.add(child.name)
+                self.env[child.name] = UNKNOWN
+
+    def declare(self, node: ast.AST):
+        """
+        Names a statement binds without running it (module level code,
+        imports): run() may use them, but their values are unknown.
+        """
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                self.maybe_defined.add(child.id)
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.maybe_defined.add(child.name)
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                for alias in child.names:
+                    if alias.name == "*":
+                        self.star_imported = True  # any name may come from the module
+                    self.maybe_defined.add(alias.asname or alias.name.split(".")[0])
+
+    def exec_block(self, statements: list):
+        for statement in statements:
+            self.exec_statement(statement)
+
+    def exec_statement(self, node: ast.stmt):
+        self.tick()
+        self.line = node.lineno
+        if isinstance(node, ast.Expr):
+            self.eval(node.value)
+        elif isinstance(node, ast.Assign):
+            value = self.eval(node.value)
+            for target in node.targets:
+                self.assign(target, value)
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            self.assign(node.target, self.eval(node.value))
+        elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            current = self.eval(node.target)
+            self.assign(node.target, self.binary(node.op, current, self.eval(node.value)))
+        elif isinstance(node, ast.For) and not node.orelse:
+            iterable = self.eval(node.iter)
+            if iterable is UNKNOWN or not self.iterable(iterable):
+                self.skip(node, "loop over a value the model can't compute")
+                return
+            for item in list(iterable):
+                self.assign(node.target, item)
+                self.exec_block(node.body)
+        elif isinstance(node, ast.If):
+            test = self.eval(node.test)
+            if test is UNKNOWN:
+                self.skip(node, "condition the model can't compute")
+                return
+            self.exec_block(node.body if test else node.orelse)
+        elif isinstance(node, ast.Pass):
+            pass
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            self.declare(node)
+        elif isinstance(node, ast.Return):
+            raise _Stop()
+        else:
+            self.skip(node, f"{type(node).__name__} statements aren't modeled")
+
+    @staticmethod
+    def iterable(value) -> bool:
+        return isinstance(value, (list, tuple, range, dict, str, enumerate, zip, reversed))
+
+    def assign(self, target: ast.AST, value):
+        if isinstance(target, ast.Name):
+            if isinstance(value, (LabwareModel, PipetteModel)) and not value.named:
+                value.var, value.named = target.id, True  # name it in messages
+            self.env[target.id] = value
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            if value is UNKNOWN or not self.iterable(value):
+                for element in target.elts:
+                    self.assign(element, UNKNOWN)
+                return
+            values = list(value)
+            if len(values) != len(target.elts):
+                self.error(f"cannot unpack {len(values)} values into {len(target.elts)} names", stop=True)
+            for element, item in zip(target.elts, values):
+                self.assign(element, item)
+        elif isinstance(target, ast.Attribute):
+            owner = self.eval(target.value)
+            if isinstance(owner, PipetteModel) and target.attr == "tip_racks":
+                if value is UNKNOWN or not isinstance(value, (list, tuple)):
+                    self.unsupported(f"{owner.var}.tip_racks set to a value the model can't compute")
+                    owner.tip_racks = [UNKNOWN]
+                    return
+                owner.tip_racks = list(value)
+            # flow rates, clearances and the like don't change what's checked
+        else:
+            self.unsupported("assignment target isn't modeled")
+
+    # --- expressions ---
+
+    def eval(self, node: ast.AST):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id in self.env:
+                return self.env[node.id]
+            if node.id in BUILTINS:
+                return BUILTINS[node.id]
+            if node.id in self.maybe_defined or self.star_imported:
+                self.unsupported(f"value of '{node.id}' the model can't compute")
+                return UNKNOWN
+            self.error(f"NameError: name '{node.id}' is not defined", stop=True)
+        if isinstance(node, (ast.List, ast.Tuple)):
+            values = [self.eval(element) for element in node.elts]
+            return values if isinstance(node, ast.List) else tuple(values)
+        if isinstance(node, ast.Dict):
+            return UNKNOWN
+        if isinstance(node, ast.BinOp):
+            return self.binary(node.op, self.eval(node.left), self.eval(node.right))
+        if isinstance(node, ast.UnaryOp):
+            operand = self.eval(node.operand)
+            if isinstance(operand, (int, float)) and not isinstance(operand, bool):
+                if isinstance(node.op, ast.USub):
+                    return -operand
+                if isinstance(node.op, ast.UAdd):
+                    return operand
+            if operand is UNKNOWN:
+                return UNKNOWN
+            if isinstance(node.op, ast.Not):
+                return not operand
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                return self.type_error(TypeError(f"bad operand type for unary {'-' if isinstance(node.op, ast.USub) else '+'}: "
+                                                 f"'{type(operand).__name__}'"), operand)
+            self.unsupported(f"{type(node.op).__name__} operator isn't modeled")
+            return UNKNOWN
+        if isinstance(node, ast.Compare):
+            return self.compare(node)
+        if isinstance(node, ast.BoolOp):
+            values = [self.eval(value) for value in node.values]
+            if any(value is UNKNOWN for value in values):
+                return UNKNOWN
+            return all(values) if isinstance(node.op, ast.And) else any(values)
+        if isinstance(node, ast.IfExp):
+            test = self.eval(node.test)
+            if test is UNKNOWN:
+                return UNKNOWN
+            return self.eval(node.body if test else node.orelse)
+        if isinstance(node, ast.Subscript):
+            return self.subscript(self.eval(node.value), node.slice)
+        if isinstance(node, ast.Attribute):
+            return self.attribute(self.eval(node.value), node.attr)
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        if isinstance(node, ast.ListComp) and len(node.generators) == 1:
+            return self.list_comprehension(node)
+        if isinstance(node, ast.JoinedStr):
+            return ""
+        self.unsupported(f"{type(node).__name__} expressions aren't modeled")
+        return UNKNOWN
+
+    def binary(self, op: ast.operator, left, right):
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        operations = {
+            ast.Add: lambda a, b: a + b, ast.Sub: lambda a, b: a - b, ast.Mult: lambda a, b: a * b,
+            ast.Div: lambda a, b: a / b, ast.FloorDiv: lambda a, b: a // b, ast.Mod: lambda a, b: a % b,
+            ast.Pow: lambda a, b: a ** b,
+        }
+        operation = operations.get(type(op))
+        if operation is None:
+            self.unsupported(f"{type(op).__name__} operator isn't modeled")
+            return UNKNOWN
+        try:
+            return operation(left, right)
+        except ZeroDivisionError:
+            self.error("ZeroDivisionError", stop=True)
+        except TypeError as e:
+            return self.type_error(e, left, right)
+
+    def type_error(self, e: TypeError, *operands):
+        """A TypeError on plain values fails in Python too; on modeled API objects it's the model's gap."""
+        if all(isinstance(operand, PLAIN_TYPES) for operand in operands):
+            self.error(f"TypeError: {e}", stop=True)
+        self.unsupported("operation on API objects the model can't compute")
+        return UNKNOWN
+
+    def compare(self, node: ast.Compare):
+        left = self.eval(node.left)
+        operations = {
+            ast.Eq: lambda a, b: a == b, ast.NotEq: lambda a, b: a != b, ast.Lt: lambda a, b: a < b,
+            ast.LtE: lambda a, b: a <= b, ast.Gt: lambda a, b: a > b, ast.GtE: lambda a, b: a >= b,
+            ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+        }
+        for op, comparator in zip(node.ops, node.comparators):
+            right = self.eval(comparator)
+            operation = operations.get(type(op))
+            if operation is None:
+                self.unsupported(f"{type(op).__name__} comparison isn't modeled")
+                return UNKNOWN
+            if left is UNKNOWN or right is UNKNOWN:
+                return UNKNOWN
+            try:
+                if not operation(left, right):
+                    return False
+            except TypeError as e:
+                return self.type_error(e, left, right)
+            left = right
+        return True
+
+    def subscript(self, value, index_node: ast.AST):
+        if isinstance(index_node, ast.Slice):
+            bounds = [self.eval(part) if part is not None else None
+                      for part in (index_node.lower, index_node.upper, index_node.step)]
+            if value is UNKNOWN or any(bound is UNKNOWN for bound in bounds):
+                return UNKNOWN
+            index = slice(*bounds)
+        else:
+            index = self.eval(index_node)
+        if value is UNKNOWN or index is UNKNOWN:
+            return UNKNOWN
+        if isinstance(value, LabwareModel) and isinstance(index, str):
+            try:
+                return value.well(value.index_of(index))
+            except KeyError as e:
+                self.error(f"KeyError: {e.args[0]}", stop=True)
+        try:
+            return value[index]
+        except (IndexError, KeyError) as e:
+            self.error(f"{type(e).__name__}: index {index!r} out of range", stop=True)
+        except TypeError:
+            self.unsupported("subscript the model can't compute")
+            return UNKNOWN
+
+    def attribute(self, owner, name: str):
+        if owner is UNKNOWN:
+            return UNKNOWN
+        if isinstance(owner, PipetteModel):
+            if name == "tip_racks":
+                return owner.tip_racks
+            if name in ("max_volume", "min_volume", "channels", "has_tip"):
+                return getattr(owner, name)
+            if name == "current_volume":
+                return owner.volume
+            if name in ("flow_rate", "well_bottom_clearance"):
+                return UNKNOWN
+        if isinstance(owner, (ProtocolContextModel, PipetteModel, LabwareModel, WellModel, ModuleModel, dict)):
+            return Method(owner, name)
+        self.unsupported(f"attribute .{name} isn't modeled")
+        return UNKNOWN
+
+    def list_comprehension(self, node: ast.ListComp):
+        generator = node.generators[0]
+        iterable = self.eval(generator.iter)
+        if iterable is UNKNOWN or not self.iterable(iterable):
+            return UNKNOWN
+        saved = dict(self.env)
+        values = []
+        try:
+            for item in list(iterable):
+                self.tick()
+                self.assign(generator.target, item)
+                if all(self.eval(condition) for condition in generator.ifs):
+                    values.append(self.eval(node.elt))
+        finally:
+            # Comprehension variables don't leak into the run() body
+            self.env = saved
+        return values
+
+    # --- calls ---
+
+    def call(self, node: ast.Call):
+        self.tick()
+        if any(isinstance(arg, ast.Starred) for arg in node.args) or any(kw.arg is None for kw in node.keywords):
+            self.unsupported("*args / **kwargs calls aren't modeled")
+            return UNKNOWN
+        function = self.eval(node.func)
+        args = [self.eval(arg) for arg in node.args]
+        kwargs = {kw.arg: self.eval(kw.value) for kw in node.keywords}
+        if function is UNKNOWN:
+            self.unsupported("call the model can't resolve")
+            return UNKNOWN
+        if isinstance(function, Method):
+            owner, name = function.owner, function.name
+            if isinstance(owner, ProtocolContextModel):
+                self.check_parameters(f"protocol.{name}", PROTOCOL_PARAMETERS.get(name), args, kwargs)
+                return self.protocol_call(name, args, kwargs)
+            if isinstance(owner, PipetteModel):
+                self.check_parameters(f"{owner.var}.{name}", PIPETTE_PARAMETERS.get(name), args, kwargs)
+                return self.pipette_call(owner, name, args, kwargs)
+            if isinstance(owner, LabwareModel):
+                return self.labware_call(owner, name, args, kwargs)
+            if isinstance(owner, WellModel) and name in ("top", "bottom", "center"):
+                return owner  # same well, different height
+            if isinstance(owner, dict) and name in ("keys", "values", "items", "get"):
+                return getattr(owner, name)(*args, **kwargs)
+            self.unsupported(f".{name}() isn't modeled")
+            return UNKNOWN
+        if function in BUILTINS.values():
+            if any(value is UNKNOWN for value in args + list(kwargs.values())):
+                return UNKNOWN
+            try:
+                result = function(*args, **kwargs)
+            except (TypeError, ValueError) as e:
+                self.error(f"{type(e).__name__}: {e}", stop=True)
+            # Materialize lazy iterators so they can be iterated more than once
+            return list(result) if isinstance(result, (enumerate, zip, reversed)) else result
+        self.unsupported("call the model can't resolve")
+        return UNKNOWN
+
+    def check_parameters(self, call: str, parameters: Optional[tuple], args: list, kwargs: dict):
+        """Arguments outside the ones the model checks make the result not confident."""
+        if parameters is None:
+            return  # the call itself is reported as not modeled
+        unchecked = [name for name in kwargs if name not in parameters]
+        if len(args) > len(parameters):
+            unchecked.append(f"{len(args)} positional arguments")
+        if unchecked:
+            self.unsupported(f"{call}() arguments the model doesn't check: {', '.join(unchecked)}")
+
+    @staticmethod
+    def argument(args: list, kwargs: dict, position: int, name: str, default=None):
+        if len(args) > position:
+            return args[position]
+        return kwargs.get(name, default)
+
+    def occupy(self, slot, what: str) -> Optional[str]:
+        if slot is UNKNOWN or not isinstance(slot, (str, int)):
+            self.unsupported(f"slot of {what} the model can't compute")
+            return None
+        slot = OT2_SLOTS.get(str(slot), str(slot))
+        if slot in STAGING_SLOTS:
+            self.unsupported(f"{what} in staging slot {slot} (needs a staging area fixture)")
+        elif slot not in VALID_FLEX_SLOTS:
+            self.error(f"invalid Flex deck slot '{slot}' for {what}")
+            return slot
+        if slot in self.slots:
+            self.error(f"slot {slot} already holds {self.slots[slot]}; can't also load {what}")
+        self.slots[slot] = f"{what} (line {self.line})"
+        return slot
+
+    def protocol_call(self, name: str, args: list, kwargs: dict):
+        if name == "delay":
+            seconds = self.number(self.argument(args, kwargs, 0, "seconds", 0), "delay seconds")
+            minutes = self.number(self.argument(args, kwargs, 1, "minutes", 0), "delay minutes")
+            self.trace("delay", None, seconds=(seconds or 0.0) + 60 * (minutes or 0.0))
+            return None
+        if name in NO_OP_PROTOCOL_CALLS:
+            return None
+        if name in ("load_labware", "load_adapter"):
+            load_name = self.argument(args, kwargs, 0, "load_name")
+            location = self.argument(args, kwargs, 1, "location")
+            if not isinstance(load_name, str):
+                self.unsupported("labware load name the model can't compute")
+                self.occupy(location, "labware")
+                return UNKNOWN
+            if load_name not in KNOWN_LABWARE:
+                # Its wells and tips can't be checked, so nothing downstream may error on them
+                self.unsupported(f"labware '{load_name}' isn't in the analyzer's labware list")
+                self.occupy(location, load_name)
+                return UNKNOWN
+            labware = LabwareModel(load_name, load_name, None)
+            labware.slot = self.occupy(location, load_name)
+            self.labware.append(labware)
+            return labware
+        if name == "load_trash_bin":
+            location = self.argument(args, kwargs, 0, "location", "A3")
+            slot = OT2_SLOTS.get(str(location), str(location))
+            if location is UNKNOWN:
+                self.unsupported("trash bin location the model can't compute")
+                slot = None
+            elif slot not in TRASH_SLOTS:
+                self.error(f"a trash bin can't go in slot {slot} (columns 1 and 3 only)")
+            else:
+                self.occupy(slot, "trash bin")
+            self.trash_loaded = True
+            self.trash_slot = self.trash_slot or slot
+            return TrashModel(slot)
+        if name == "load_waste_chute":
+            self.occupy("D3", "waste chute")
+            self.trash_loaded = True
+            self.trash_slot = self.trash_slot or "D3"
+            return TrashModel("D3")
+        if name == "load_instrument":
+            return self.load_instrument(args, kwargs)
+        if name == "load_module":
+            self.unsupported("modules aren't modeled")
+            location = self.argument(args, kwargs, 1, "location")
+            return ModuleModel(self.occupy(location, "module") if location is not None else None)
+        self.unsupported(f"protocol.{name}() isn't modeled")
+        return UNKNOWN
+
+    def load_instrument(self, args: list, kwargs: dict) -> PipetteModel:
+        model = self.argument(args, kwargs, 0, "instrument_name")
+        mount = self.argument(args, kwargs, 1, "mount")
+        tip_racks = self.argument(args, kwargs, 2, "tip_racks") or []
+        if not isinstance(model, str) or not isinstance(mount, str):
+            self.unsupported("pipette the model can't compute")
+            return UNKNOWN
+        if model not in FLEX_PIPETTES:
+            self.error(f"'{model}' is not a Flex pipette", stop=True)
+        mounts = ("left", "right") if "96channel" in model else (mount,)
+        for each in mounts:
+            if each not in ("left", "right"):
+                self.error(f"invalid mount '{each}'", stop=True)
+            if each in self.mounts:
+                self.error(f"{each} mount already holds {self.mounts[each]}", stop=True)
+            self.mounts[each] = model
+        if tip_racks is UNKNOWN:
+            self.unsupported("tip racks the model can't compute")
+            tip_racks = [UNKNOWN]
+        return PipetteModel(f"{model} ({mount})", model, mount, list(tip_racks))
+
+    def labware_call(self, labware: LabwareModel, name: str, args: list, kwargs: dict):
+        if name == "wells":
+            return labware.wells()
+        if name == "columns":
+            return labware.columns_list()
+        if name == "rows":
+            return labware.rows_list()
+        if name == "wells_by_name":
+            return {well_name: labware.well(labware.index_of(well_name)) for well_name in self.well_names(labware)}
+        if name == "well" and args and isinstance(args[0], (int, str)):
+            return self.subscript_well(labware, args[0])
+        if name == "set_offset":
+            return None
+        if name == "load_labware":  # on an adapter: no deck slot of its own
+            load_name = self.argument(args, kwargs, 0, "name")
+            if not isinstance(load_name, str) or load_name not in KNOWN_LABWARE:
+                self.unsupported(f"labware '{load_name}' isn't in the analyzer's labware list")
+                return UNKNOWN
+            child = LabwareModel(str(load_name), str(load_name), labware.slot)
+            self.labware.append(child)
+            return child
+        self.unsupported(f"labware .{name}() isn't modeled")
+        return UNKNOWN
+
+    @staticmethod
+    def well_names(labware: LabwareModel) -> list:
+        return [f"{chr(ord('A') + r)}{c + 1}" for c in range(labware.columns) for r in range(labware.rows)]
+
+    def subscript_well(self, labware: LabwareModel, key):
+        try:
+            return labware.well(labware.index_of(key) if isinstance(key, str) else key)
+        except (IndexError, KeyError) as e:
+            self.error(f"{type(e).__name__}: {e.args[0]}", stop=True)
+
+    # --- pipettes ---
+
+    def channel_wells(self, pipette: PipetteModel, location) -> list:
+        """Wells (with repeats) a pipette's channels reach at a location."""
+        if not isinstance(location, WellModel):
+            return []
+        labware = location.labware
+        if pipette.channels == 1:
+            return [location.index]
+        if pipette.channels > CHANNELS_PER_COLUMN:
+            return list(range(len(labware.volumes)))
+        if labware.rows >= CHANNELS_PER_COLUMN:
+            row, column = location.index % labware.rows, location.index // labware.rows
+            step = labware.rows // CHANNELS_PER_COLUMN
+            rows = range(row, min(labware.rows, row + step * CHANNELS_PER_COLUMN), step)
+            return [column * labware.rows + r for r in rows]
+        return [location.index] * pipette.channels  # all channels in one trough well
+
+    def add_liquid(self, pipette: PipetteModel, location, volume: float):
+        for index in self.channel_wells(pipette, location):
+            labware = location.labware
+            labware.volumes[index] = max(0.0, labware.volumes[index] + volume)
+            if labware.volumes[index] > labware.peak:
+                labware.peak = labware.volumes[index]
+                labware.peak_line = self.line
+
+    def number(self, value, what: str) -> Optional[float]:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if value is not None:
+            self.unsupported(f"{what} the model can't compute")
+        return None
+
+    def volume(self, value, what: str):
+        """A volume argument: a positive float, None when not given, UNKNOWN when the model can't check it."""
+        if value is None:
+            return None
+        volume = self.number(value, what)
+        if volume is None:
+            return UNKNOWN
+        if volume <= 0:
+            self.unsupported(f"{what} {volume:g} µL isn't a positive volume")
+            return UNKNOWN
+        return volume
+
+    def location(self, value, what: str, allowed=(WellModel,)) -> bool:
+        """Whether a location argument is one the model tracks (None: the pipette's current position)."""
+        if value is None or isinstance(value, allowed):
+            return True
+        if value is not UNKNOWN:
+            shown = repr(value) if isinstance(value, PLAIN_TYPES) else type(value).__name__
+            self.unsupported(f"{what} {shown} isn't a well the model tracks")
+        else:
+            self.unsupported(f"{what} the model can't compute")
+        return False
+
+    def next_tips(self, pipette: PipetteModel) -> Optional[LabwareModel]:
+        """Mark the tips the next pick_up_tip() takes; None when out of tips, UNKNOWN if untracked."""
+        if any(rack is UNKNOWN for rack in pipette.tip_racks):
+            self.unsupported(f"{pipette.var} has tip racks the model can't compute")
+            return UNKNOWN
+        for rack in pipette.tip_racks:
+            if not isinstance(rack, LabwareModel) or not rack.is_tiprack:
+                self.error(f"{pipette.var} has a tip rack that isn't a tip rack", stop=True)
+            if pipette.channels == 1:
+                if True in rack.tips:
+                    rack.tips[rack.tips.index(True)] = False
+                    return rack
+            elif pipette.channels > CHANNELS_PER_COLUMN:
+                if all(rack.tips):
+                    rack.tips = [False] * len(rack.tips)
+                    return rack
+            else:
+                for column in range(rack.columns):
+                    tips = range(column * rack.rows, (column + 1) * rack.rows)
+                    if all(rack.tips[i] for i in tips):
+                        for i in tips:
+                            rack.tips[i] = False
+                        return rack
+        return None
+
+    def pick_up_tip(self, pipette: PipetteModel, location=None):
+        if pipette.has_tip:
+            self.state_error(f"{pipette.var}: pick_up_tip() while a tip is still attached")
+        if location is not None:
+            rack = None
+            if not isinstance(location, WellModel) or not location.labware.is_tiprack:
+                self.unsupported("pick_up_tip() location the model can't compute")
+            else:
+                for index in self.channel_wells(pipette, location):
+                    location.labware.tips[index] = False
+                rack = location.labware
+        else:
+            if not pipette.tip_racks:
+                self.state_error(f"{pipette.var}: pick_up_tip() but the pipette has no tip_racks")
+            rack = self.next_tips(pipette)
+            if rack is None:
+                total = sum(len(r.tips) for r in pipette.tip_racks)
+                self.state_error(f"OutOfTipsError: {pipette.var} has used all {total} tips in its tip racks")
+        pipette.has_tip = True
+        pipette.volume = 0.0
+        tracked = isinstance(rack, LabwareModel)
+        pipette.tip_volume = rack.max_volume if tracked else None
+        pipette.tip_slot = rack.slot if tracked else None
+        self.trace("pick_up_tip", pipette, slot=pipette.tip_slot)
+
+    def drop_tip(self, pipette: PipetteModel, location=None, returning: bool = False):
+        if not pipette.has_tip:
+            self.state_error(f"{pipette.var}: drop_tip() without a tip attached")
+        if location is None and not returning and not self.trash_loaded:
+            self.state_error("drop_tip() with no trash bin or waste chute loaded")
+        if location is not None:
+            self.trace("drop_tip", pipette, location)
+        else:
+            self.trace("drop_tip", pipette, slot=pipette.tip_slot if returning else self.trash_slot)
+        pipette.has_tip = False
+        pipette.volume = 0.0
+
+    def require_tip(self, pipette: PipetteModel, action: str):
+        if not pipette.has_tip:
+            self.state_error(f"{pipette.var}: {action} without a tip attached")
+
+    def aspirate(self, pipette: PipetteModel, volume: Optional[float], location):
+        self.require_tip(pipette, "aspirate()")
+        if volume is None:
+            volume = pipette.max_volume - pipette.volume
+        if pipette.volume + volume > pipette.max_volume + EPSILON:
+            self.state_error(
+                f"{pipette.var}: aspirating {volume:g} µL on top of {pipette.volume:g} µL "
+                f"exceeds its {pipette.max_volume:g} µL",
+                stop=False,
+            )
+        elif 0 < volume < pipette.min_volume:
+            self.warn(f"{pipette.var}: {volume:g} µL is under its {pipette.min_volume:g} µL minimum")
+        pipette.volume += volume
+        self.add_liquid(pipette, location, -volume)
+        self.trace("aspirate", pipette, location, volume=volume)
+
+    def dispense(self, pipette: PipetteModel, volume: Optional[float], location):
+        self.require_tip(pipette, "dispense()")
+        if volume is None:
+            volume = pipette.volume
+        if volume > pipette.volume + EPSILON:
+            self.warn(f"{pipette.var}: dispensing {volume:g} µL but only {pipette.volume:g} µL was aspirated")
+            volume = pipette.volume
+        pipette.volume -= volume
+        self.add_liquid(pipette, location, volume)
+        self.trace("dispense", pipette, location, volume=volume)
+
+    def mix(self, pipette: PipetteModel, mix: Optional[tuple], location):
+        """mix() or a transfer's mix_before / mix_after: (repetitions, volume or None for the tip's capacity)."""
+        if mix is None:
+            return
+        repetitions, volume = mix
+        self.require_tip(pipette, "mix()")
+        if volume is not None and volume > pipette.max_volume + EPSILON:
+            self.error(f"{pipette.var}: mixing {volume:g} µL exceeds its {pipette.max_volume:g} µL")
+        for _ in range(repetitions):
+            self.trace("aspirate", pipette, location, volume=volume or pipette.max_volume)
+            self.trace("dispense", pipette, location, volume=volume or pipette.max_volume)
+
+    def trace(self, kind: str, pipette: Optional[PipetteModel], location=None, slot: Optional[str] = None, **extra):
+        """Record a robot action for the run-time estimate."""
+        if isinstance(location, WellModel):
+            slot = location.labware.slot
+        elif isinstance(location, (TrashModel, LabwareModel)):
+            slot = location.slot
+        step = {"kind": kind, "slot": slot, **extra}
+        if pipette is not None:
+            step["pipette"] = pipette.model
+        self.report.steps.append(step)
+
+    def liquid_handling(self, pipette: PipetteModel, name: str, args: list, kwargs: dict):
+        """transfer / distribute / consolidate, unrolled into tips, aspirates and dispenses."""
+        volume = self.volume(self.argument(args, kwargs, 0, "volume"), f"{name}() volume")
+        sources = self.argument(args, kwargs, 1, "source")
+        dests = self.argument(args, kwargs, 2, "dest")
+        new_tip = kwargs.get("new_tip", "once")
+        sources = sources if isinstance(sources, list) else [sources]
+        dests = dests if isinstance(dests, list) else [dests]
+        if volume is None or volume is UNKNOWN:
+            if volume is None:
+                self.unsupported(f"{name}() without a volume")
+            return None
+        if new_tip not in NEW_TIP_VALUES:
+            self.unsupported(f"{name}() new_tip={new_tip!r} isn't one the model checks")
+            return None
+        # Only wells and flat lists of wells; anything else (a well name, a
+        # labware, nested lists) is left to the simulator
+        wells = [self.location(well, f"{name}() location") for well in sources + dests if well is not None]
+        if not all(wells) or None in sources + dests:
+            if None in sources + dests:
+                self.unsupported(f"{name}() without a source or destination")
+            return None
+        mixes = {}
+        for option in ("mix_before", "mix_after"):
+            mix = kwargs.get(option)
+            if mix is None:
+                continue
+            if not (isinstance(mix, (tuple, list)) and len(mix) == 2 and isinstance(mix[0], int)
+                    and not isinstance(mix[0], bool) and mix[0] > 0 and self.volume(mix[1], option) not in (None, UNKNOWN)):
+                self.unsupported(f"{name}() {option}={mix!r} isn't a (repetitions, volume) pair")
+                return None
+            mixes[option] = (mix[0], float(mix[1]))
+        if not sources or not dests:
+            return pipette
+
+        capacity = pipette.max_volume if pipette.has_tip else min(
+            [pipette.nominal_volume] + [rack.max_volume for rack in pipette.tip_racks if isinstance(rack, LabwareModel)]
+        )
+        splits = max(1, math.ceil(volume / capacity))
+        part = volume / splits
+        # (sources aspirated, dests dispensed into) per aspiration
+        groups = []
+        if name == "distribute":
+            per_aspiration = max(1, int((capacity - pipette.min_volume) // part)) if part else 1
+            for start in range(0, len(dests), per_aspiration):
+                groups += [([sources[0]], dests[start:start + per_aspiration])] * splits
+        elif name == "consolidate":
+            per_aspiration = max(1, int(capacity // part)) if part else 1
+            for start in range(0, len(sources), per_aspiration):
+                groups += [(sources[start:start + per_aspiration], [dests[0]])] * splits
+        else:
+            for index in range(max(len(sources), len(dests))):
+                groups += [([sources[index % len(sources)]], [dests[index % len(dests)]])] * splits
+
+        if new_tip == "never":
+            self.require_tip(pipette, f"{name}(new_tip='never')")
+        elif new_tip == "once":
+            self.pick_up_tip(pipette)
+        for group_sources, group_dests in groups:
+            if new_tip == "always":
+                self.pick_up_tip(pipette)
+            for source in group_sources:
+                self.mix(pipette, mixes.get("mix_before"), source)
+                self.aspirate(pipette, part * len(group_dests), source)
+            for dest in group_dests:
+                self.dispense(pipette, part * len(group_sources), dest)
+                self.mix(pipette, mixes.get("mix_after"), dest)
+            if new_tip == "always":
+                self.drop_tip(pipette)
+        if new_tip == "once":
+            self.drop_tip(pipette)
+        return pipette
+
+    def pipette_call(self, pipette: PipetteModel, name: str, args: list, kwargs: dict):
+        if name == "pick_up_tip":
+            self.pick_up_tip(pipette, self.argument(args, kwargs, 0, "location"))
+        elif name in ("drop_tip", "return_tip"):
+            location = None if name == "return_tip" else self.argument(args, kwargs, 0, "location")
+            if not self.location(location, f"{name}() location", (WellModel, TrashModel)):
+                return UNKNOWN
+            self.drop_tip(pipette, location, returning=name == "return_tip")
+        elif name in ("aspirate", "dispense"):
+            volume = self.volume(self.argument(args, kwargs, 0, "volume"), f"{name} volume")
+            location = self.argument(args, kwargs, 1, "location")
+            allowed = (WellModel, TrashModel) if name == "dispense" else (WellModel,)
+            if volume is UNKNOWN or not self.location(location, f"{name}() location", allowed):
+                return UNKNOWN
+            (self.aspirate if name == "aspirate" else self.dispense)(pipette, volume, location)
+        elif name == "mix":
+            volume = self.volume(self.argument(args, kwargs, 1, "volume"), "mix volume")
+            repetitions = self.argument(args, kwargs, 0, "repetitions", 1)
+            location = self.argument(args, kwargs, 2, "location")
+            if not isinstance(repetitions, int) or isinstance(repetitions, bool) or repetitions < 1:
+                self.unsupported(f"mix repetitions {repetitions!r} the model can't check")
+                return UNKNOWN
+            if volume is UNKNOWN or not self.location(location, "mix() location"):
+                return UNKNOWN
+            self.mix(pipette, (repetitions, volume), location)
+        elif name == "air_gap":
+            volume = self.volume(self.argument(args, kwargs, 0, "volume"), "air gap volume")
+            if volume is UNKNOWN:
+                return UNKNOWN
+            self.aspirate(pipette, volume, None)
+        elif name in ("transfer", "distribute", "consolidate"):
+            return self.liquid_handling(pipette, name, args, kwargs)
+        elif name in NO_OP_PIPETTE_CALLS:
+            if name == "touch_tip":
+                self.require_tip(pipette, "touch_tip()")
+            if name in ("blow_out", "touch_tip"):
+                self.trace(name, pipette, self.argument(args, kwargs, 0, "location"))
+        else:
+            self.unsupported(f"pipette .{name}() isn't modeled")
+            return UNKNOWN
+        return pipette
+
+
+def analyze_protocol(code: str) -> StaticReport:
+    """Check a full protocol file or a bare run(protocol) body."""
+    return ProtocolAnalyzer(code).analyze()
+
+
+_gate_counts = {"rejected": 0, "skipped": 0, "simulated": 0}
+_gate_lock = threading.Lock()
+
+
+def check_before_simulation(code: str) -> Optional[str]:
+    """
+    QC gate in front of the simulator. Returns the errors when the protocol
+    is rejected, "" when it passed confidently and simulation is skipped,
+    None when it should still be simulated.
+    """
+    if not STATIC_GATE:
+        return None
+    report = analyze_protocol(code)
+    if not report.ok:
+        outcome, verdict = "rejected", report.format_errors()
+    elif report.confident and SKIP_CONFIDENT_SIMULATION:
+        outcome, verdict = "skipped", ""
+    else:
+        outcome, verdict = "simulated", None
+    with _gate_lock:
+        _gate_counts[outcome] += 1
+    return verdict
+
+
+def static_gate_stats() -> dict:
+    with _gate_lock:
+        return {"enabled": STATIC_GATE, "skip_confident": SKIP_CONFIDENT_SIMULATION, **_gate_counts}
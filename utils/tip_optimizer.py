@@ -0,0 +1,336 @@
+"""
+Tip-usage optimizer for generated run(protocol) bodies.
+
+The generators write every liquid-handling loop as
+    for ...:
+        pipette.pick_up_tip()
+        pipette.aspirate(v, source)
+        pipette.dispense(v, dest)
+        pipette.drop_tip()
+which spends a fresh tip, and a trip to the tip rack and the trash, on every
+well. This pass rewrites the loops where a fresh tip buys nothing:
+
+    - reagent-to-many: the source is the same every iteration (a reservoir
+      well, not a sample) and nothing is mixed in the destination.
+    - Into known-empty wells (labware loaded in this code that nothing but
+      the loop touches, and whose name or label doesn't say it holds
+      samples) these become one pipette.distribute(...,
+      new_tip="once"), which multi-dispenses several wells per aspiration,
+      or a single-tip loop when the volume is too large for that.
+    - Any other destination may already hold samples the user loaded, so
+      the tip is kept clean by dispensing at the top of the wells, one well
+      per aspiration (no distribute). Volumes below MIN_TOP_DISPENSE_UL
+      don't leave the tip reliably from there, so those loops keep fresh
+      tips.
+
+Contamination-sensitive loops are left alone: a per-iteration source
+(samples, well-to-well and serial transfers, removing liquid from wells) or
+a mix in the destination.
+
+The report counts the tips and aspirations saved and estimates the robot
+time saved from rough Flex timings (the constants below).
+"""
+import ast
+import math
+import os
+import re
+from typing import List, Optional, Set, Tuple
+
+OPTIMIZE_TIPS = os.getenv("CORNUCOPIA_OPTIMIZE_TIPS", "1") != "0"
+
+# Rough Flex timings, including the gantry moves to the tip rack / trash / source
+TIP_PICKUP_SECONDS = 7.0
+TIP_DROP_SECONDS = 5.0
+ASPIRATE_TRIP_SECONDS = 3.0
+
+MIN_TOP_DISPENSE_UL = 20
+# distribute() aspirates this much extra (the pipette's minimum volume)
+PIPETTE_MIN_VOLUME = {1000: 5.0, 200: 5.0, 50: 1.0}
+
+# Labware named like this holds liquid the user put there before the run
+SAMPLE_LABWARE_RE = re.compile(r"sample|specimen|patient|cell|culture|lysate", re.IGNORECASE)
+CAPACITY_RE = re.compile(r"_(\d+)(?:ul)?$")
+CHANNELS_RE = re.compile(r"_(\d+)channel_")
+
+
+def _method_call(stmt: ast.stmt, method: str) -> Optional[ast.Call]:
+    """The call if stmt is `<something>.<method>(...)`."""
+    if (
+        isinstance(stmt, ast.Expr)
+        and isinstance(stmt.value, ast.Call)
+        and isinstance(stmt.value.func, ast.Attribute)
+        and stmt.value.func.attr == method
+    ):
+        return stmt.value
+    return None
+
+
+def _names(node: ast.AST) -> Set[str]:
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def _root_name(node: ast.AST) -> Optional[str]:
+    """'plate' for plate.wells()[i], plate.rows()[0][1:] ..."""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _constant_number(node: ast.AST) -> Optional[float]:
+    try:
+        value = ast.literal_eval(node)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _iterations(iter_node: ast.AST) -> Optional[int]:
+    """Loop count when it is static: range(...) with constant bounds, or a constant slice."""
+    if isinstance(iter_node, ast.Call) and isinstance(iter_node.func, ast.Name) and iter_node.func.id == "range":
+        args = [_constant_number(arg) for arg in iter_node.args]
+        if args and None not in args:
+            return len(range(*[int(arg) for arg in args]))
+    if isinstance(iter_node, ast.Subscript) and isinstance(iter_node.slice, ast.Slice):
+        lower = _constant_number(iter_node.slice.lower) if iter_node.slice.lower else 0.0
+        upper = _constant_number(iter_node.slice.upper) if iter_node.slice.upper else None
+        if lower is not None and upper is not None and iter_node.slice.step is None:
+            return max(0, int(upper) - int(lower))
+    return None
+
+
+def _dispense_targets(node: ast.AST) -> Set[str]:
+    """Labware names liquid is dispensed into anywhere under node."""
+    targets = set()
+    for call in ast.walk(node):
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)):
+            continue
+        if call.func.attr == "dispense" and len(call.args) >= 2:
+            targets.add(_root_name(call.args[1]))
+        elif call.func.attr in ("transfer", "distribute", "consolidate") and len(call.args) >= 3:
+            targets.add(_root_name(call.args[2]))
+    targets.discard(None)
+    return targets
+
+
+def _labware_references(tree: ast.AST) -> dict:
+    """How often each labware variable loaded in this code is referenced (sample labware left out)."""
+    loaded = {
+        stmt.targets[0].id
+        for stmt in ast.walk(tree)
+        if isinstance(stmt, ast.Assign)
+        and len(stmt.targets) == 1
+        and isinstance(stmt.targets[0], ast.Name)
+        and isinstance(stmt.value, ast.Call)
+        and isinstance(stmt.value.func, ast.Attribute)
+        and stmt.value.func.attr == "load_labware"
+        and not SAMPLE_LABWARE_RE.search(ast.unparse(stmt))  # variable name or label
+    }
+    references = dict.fromkeys(loaded, 0)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id in references:
+            references[node.id] += 1
+    return references
+
+
+def _known_empty(loop: ast.For, dest: ast.AST, source: ast.AST, filled: Set[str], labware_refs: dict) -> bool:
+    """Whether dest's wells are empty: loaded here, and nothing outside this loop touches the labware."""
+    labware = _root_name(dest)
+    if labware in _names(loop.target):  # `for well in plate.wells(): ... dispense(v, well)`
+        labware = _root_name(loop.iter)
+    if labware not in labware_refs or labware in filled or labware == _root_name(source):
+        return False
+    in_loop = sum(1 for node in ast.walk(loop) if isinstance(node, ast.Name) and node.id == labware)
+    return in_loop == labware_refs[labware]
+
+
+def _tip_capacity(tree: ast.AST) -> Optional[float]:
+    """Smallest pipette / tip rack volume loaded by the protocol."""
+    capacities = []
+    for call in ast.walk(tree):
+        if (
+            isinstance(call, ast.Call)
+            and isinstance(call.func, ast.Attribute)
+            and call.func.attr in ("load_instrument", "load_labware")
+            and call.args
+            and isinstance(call.args[0], ast.Constant)
+            and isinstance(call.args[0].value, str)
+        ):
+            load_name = call.args[0].value
+            if call.func.attr == "load_labware" and "tiprack" not in load_name:
+                continue
+            match = CAPACITY_RE.search(load_name)
+            if match:
+                capacities.append(float(match.group(1)))
+    return min(capacities) if capacities else None
+
+
+def _pipette_channels(tree: ast.AST) -> dict:
+    """Channels of each pipette variable (`p = protocol.load_instrument("flex_8channel_1000", ...)`)."""
+    channels = {}
+    for stmt in ast.walk(tree):
+        if (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.value, ast.Call)
+            and isinstance(stmt.value.func, ast.Attribute)
+            and stmt.value.func.attr == "load_instrument"
+            and stmt.value.args
+            and isinstance(stmt.value.args[0], ast.Constant)
+        ):
+            match = CHANNELS_RE.search(str(stmt.value.args[0].value))
+            channels[ast.unparse(stmt.targets[0])] = int(match.group(1)) if match else 1
+    return channels
+
+
+class TipRewrite:
+    def __init__(self, loop: ast.For, replacement: List[str], kind: str, pick_ups_saved: int,
+                 tips_per_pick_up: int, aspirations_saved: int):
+        self.loop = loop
+        self.replacement = replacement
+        self.kind = kind
+        self.pick_ups_saved = pick_ups_saved
+        # A multichannel pick-up takes one tip per channel
+        self.tips_saved = pick_ups_saved * tips_per_pick_up
+        self.aspirations_saved = aspirations_saved
+
+    def to_dict(self) -> dict:
+        return {
+            "line": self.loop.lineno,
+            "kind": self.kind,
+            "tips_saved": self.tips_saved,
+            "aspirations_saved": self.aspirations_saved,
+        }
+
+
+def _plan_rewrite(
+    loop: ast.For, filled: Set[str], capacity: Optional[float], repeats: int, channels: dict, labware_refs: dict
+) -> Optional[TipRewrite]:
+    """TipRewrite for a per-well fresh-tip loop that can share one tip, else None."""
+    body = loop.body
+    if len(body) != 4 or loop.orelse:
+        return None
+    pick_up, aspirate, dispense, drop = (
+        _method_call(body[0], "pick_up_tip"),
+        _method_call(body[1], "aspirate"),
+        _method_call(body[2], "dispense"),
+        _method_call(body[3], "drop_tip"),
+    )
+    if not (pick_up and aspirate and dispense and drop):
+        return None
+    pipettes = {ast.unparse(call.func.value) for call in (pick_up, aspirate, dispense, drop)}
+    if len(pipettes) != 1 or pick_up.args or pick_up.keywords or drop.args or drop.keywords:
+        return None
+    if len(aspirate.args) != 2 or len(dispense.args) != 2 or aspirate.keywords or dispense.keywords:
+        return None
+    if ast.unparse(aspirate.args[0]) != ast.unparse(dispense.args[0]):
+        return None
+
+    loop_vars = _names(loop.target)
+    volume_node, source, dest = aspirate.args[0], aspirate.args[1], dispense.args[1]
+    # A source that changes per iteration is a sample: fresh tips
+    if _names(source) & loop_vars or _names(volume_node) & loop_vars or not _names(dest) & loop_vars:
+        return None
+
+    volume = _constant_number(volume_node)
+    dest_code = ast.unparse(dest)
+    empty = _known_empty(loop, dest, source, filled, labware_refs)
+    if not empty:
+        # The wells may hold liquid (e.g. samples on a plate the user loaded):
+        # keep the tip out of it
+        if volume is None or volume < MIN_TOP_DISPENSE_UL:
+            return None
+        dest_code = f"{dest_code}.top()"
+
+    pipette = pipettes.pop()
+    n = _iterations(loop.iter)
+    count = n if n is not None else 1
+    per_aspirate = 1
+    if volume and capacity and empty:
+        per_aspirate = max(1, int((capacity - PIPETTE_MIN_VOLUME.get(int(capacity), 1.0)) // volume))
+
+    volume_code, source_code = ast.unparse(volume_node), ast.unparse(source)
+    target, iter_code = ast.unparse(loop.target), ast.unparse(loop.iter)
+    if per_aspirate >= 2:
+        kind = "distribute"
+        replacement = [
+            f"{pipette}.distribute({volume_code}, {source_code}, "
+            f"[{dest_code} for {target} in {iter_code}], new_tip=\"once\")"
+        ]
+        aspirations_after = math.ceil(count / per_aspirate)
+    else:
+        kind = "single_tip"
+        replacement = [
+            f"{pipette}.pick_up_tip()",
+            f"for {target} in {iter_code}:",
+            f"    {pipette}.aspirate({volume_code}, {source_code})",
+            f"    {pipette}.dispense({volume_code}, {dest_code})",
+            f"{pipette}.drop_tip()",
+        ]
+        aspirations_after = count
+    return TipRewrite(
+        loop, replacement, kind,
+        pick_ups_saved=(count - 1) * repeats,
+        tips_per_pick_up=channels.get(pipette, 1),
+        aspirations_saved=(count - aspirations_after) * repeats,
+    )
+
+
+def _plan_rewrites(
+    statements: List[ast.stmt], filled: Set[str], capacity, repeats: int, channels: dict, labware_refs: dict, rewrites: list
+):
+    for stmt in statements:
+        if isinstance(stmt, ast.For):
+            rewrite = _plan_rewrite(stmt, filled, capacity, repeats, channels, labware_refs)
+            if rewrite is not None:
+                rewrites.append(rewrite)
+            else:
+                n = _iterations(stmt.iter)
+                inner_filled = set(filled)
+                if n is None or n > 1:
+                    # A later iteration finds the wells this loop fills
+                    inner_filled |= _dispense_targets(stmt)
+                _plan_rewrites(stmt.body, inner_filled, capacity, repeats * (n or 1), channels, labware_refs, rewrites)
+        elif isinstance(stmt, (ast.If, ast.With, ast.While, ast.Try)):
+            _plan_rewrites(getattr(stmt, "body", []), filled, capacity, repeats, channels, labware_refs, rewrites)
+            _plan_rewrites(getattr(stmt, "orelse", []), filled, capacity, repeats, channels, labware_refs, rewrites)
+        filled |= _dispense_targets(stmt)
+
+
+def estimate_seconds_saved(pick_ups_saved: int, aspirations_saved: int) -> float:
+    return pick_ups_saved * (TIP_PICKUP_SECONDS + TIP_DROP_SECONDS) + aspirations_saved * ASPIRATE_TRIP_SECONDS
+
+
+def optimize_tip_usage(code: str) -> Tuple[str, dict]:
+    """
+    Rewrite a run(protocol) body (unindented) to use fewer tips.
+    Returns (code, report); code that doesn't parse is returned unchanged.
+    """
+    report = {"tips_saved": 0, "aspirations_saved": 0, "seconds_saved": 0.0, "rewrites": []}
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, report
+
+    rewrites: List[TipRewrite] = []
+    _plan_rewrites(
+        tree.body, set(), _tip_capacity(tree), 1, _pipette_channels(tree), _labware_references(tree), rewrites
+    )
+    if not rewrites:
+        return code, report
+
+    # Splice from the bottom up so earlier line numbers stay valid; this keeps
+    # the comments and layout of everything that isn't rewritten
+    lines = code.splitlines()
+    for rewrite in sorted(rewrites, key=lambda r: r.loop.lineno, reverse=True):
+        pad = " " * rewrite.loop.col_offset
+        lines[rewrite.loop.lineno - 1:rewrite.loop.end_lineno] = [pad + line for line in rewrite.replacement]
+
+    pick_ups_saved = sum(r.pick_ups_saved for r in rewrites)
+    aspirations_saved = sum(r.aspirations_saved for r in rewrites)
+    report.update(
+        tips_saved=sum(r.tips_saved for r in rewrites),
+        aspirations_saved=aspirations_saved,
+        seconds_saved=round(estimate_seconds_saved(pick_ups_saved, aspirations_saved), 1),
+        rewrites=[r.to_dict() for r in sorted(rewrites, key=lambda r: r.loop.lineno)],
+    )
+    return "\n".join(lines) + ("\n" if code.endswith("\n") else ""), report
@@ -2,14 +2,7 @@
 import re
 from typing import Dict, Optional, Tuple, List
 
-VALID_FLEX_SLOTS = {f"{r}{c}" for r in "ABCD" for c in "123"}
-LABWARE_WHITELIST = {
-    "opentrons_flex_96_tiprack_1000ul",
-    "nest_96_wellplate_200ul_flat",
-    "nest_12_reservoir_15ml",
-    "opentrons_flex_trash",
-}
-PIPETTE_WHITELIST = {"flex_8channel_1000", "flex_1channel_50", "flex_1channel_1000"}
+from utils.static_analyzer import analyze_protocol
 
 RISK_KEYWORDS = [
     "pathogen", "bsL3", "bsL4", "live virus", "toxic", "carcinogen",
@@ -20,28 +13,14 @@ class ValidationError(Exception):
     pass
 
 def structural_checks(code: str) -> None:
-    # Pipette models
-    for m in re.findall(r'load_instrument\("([^"]+)"', code):
-        if m not in PIPETTE_WHITELIST:
-            raise ValidationError(f"Unsupported pipette '{m}'")
+    """Raise ValidationError with the static analyzer's errors (deck slots, pipettes, tips, volumes)."""
+    report = analyze_protocol(code)
+    if report.errors:
+        raise ValidationError("; ".join(report.errors))
 
-    # Labware load names and slots
-    for load_name, slot in re.findall(r'load_labware\("([^"]+)",\s*"([^"]+)"\)', code):
-        if load_name not in LABWARE_WHITELIST:
-            raise ValidationError(f"Unsupported labware '{load_name}'")
-        if slot not in VALID_FLEX_SLOTS:
-            raise ValidationError(f"Invalid slot '{slot}' for Flex")
-
-    # Trash slot sanity (optional but nice)
-    for slot in re.findall(r'load_trash_bin\("([^"]+)"\)', code):
-        if slot not in VALID_FLEX_SLOTS:
-            raise ValidationError(f"Invalid trash slot '{slot}'")
-
-    # Basic volume sanity: disallow > 1000 µL on p1000_8 and < 10 µL transfers for reliability
+    # Stricter than the pipettes' own minimums: < 5 µL transfers are unreliable
     for vol_s in re.findall(r'(?:aspirate|dispense)\((\d+)', code):
         v = int(vol_s)
-        if v > 1000:
-            raise ValidationError(f"Volume {v} µL exceeds 1000 µL limit")
         if v < 5:
             raise ValidationError(f"Volume {v} µL is below safe accuracy threshold")
 
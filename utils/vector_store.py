@@ -0,0 +1,152 @@
+"""
+Compact on-disk vector store for the RAG index.
+
+An index directory holds:
+    vectors.npy        float32 or float16 matrix, one L2-normalized row per chunk
+    nodes.bin          UTF-8 JSON records ({"id", "text", "metadata"}) back to back
+    nodes_offsets.npy  int64 byte offsets into nodes.bin (one per chunk, plus the end)
+    manifest.json      what was indexed and how (written by create_index.py)
+
+Opening a store memory-maps all three files, so there's nothing to parse at
+startup; a record is only decoded when a search returns it.
+"""
+import json
+import mmap
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+NODES_FILE = "nodes.bin"
+OFFSETS_FILE = "nodes_offsets.npy"
+MANIFEST_FILE = "manifest.json"
+VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+def load_manifest(persist_dir: str) -> Optional[dict]:
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(persist_dir: str, manifest: dict):
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_vector_store(
+    persist_dir: str,
+    ids: List[str],
+    texts: List[str],
+    metadatas: List[dict],
+    embeddings,
+    dtype: str = "float32",
+):
+    """Write a store, replacing any existing one in persist_dir."""
+    os.makedirs(persist_dir, exist_ok=True)
+    matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+
+    offsets = [0]
+    with open(os.path.join(persist_dir, NODES_FILE + ".tmp"), "wb") as f:
+        for node_id, text, metadata in zip(ids, texts, metadatas):
+            record = json.dumps(
+                {"id": node_id, "text": text, "metadata": metadata},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+
+    # np.save appends .npy, so the temp names keep that suffix
+    np.save(os.path.join(persist_dir, "tmp_" + VECTORS_FILE), matrix.astype(VECTOR_DTYPES[dtype]))
+    np.save(os.path.join(persist_dir, "tmp_" + OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+    for tmp, final in [
+        (NODES_FILE + ".tmp", NODES_FILE),
+        ("tmp_" + VECTORS_FILE, VECTORS_FILE),
+        ("tmp_" + OFFSETS_FILE, OFFSETS_FILE),
+    ]:
+        os.replace(os.path.join(persist_dir, tmp), os.path.join(persist_dir, final))
+
+
+def vector_store_exists(persist_dir: str) -> bool:
+    return all(
+        os.path.exists(os.path.join(persist_dir, name))
+        for name in (VECTORS_FILE, NODES_FILE, OFFSETS_FILE)
+    )
+
+
+class VectorStore:
+    """Read-only, memory-mapped view of a store written by write_vector_store."""
+
+    def __init__(self, persist_dir: str):
+        self.persist_dir = persist_dir
+        self.vectors = np.load(os.path.join(persist_dir, VECTORS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(persist_dir, OFFSETS_FILE), mmap_mode="r")
+        self._nodes_file = open(os.path.join(persist_dir, NODES_FILE), "rb")
+        if os.fstat(self._nodes_file.fileno()).st_size:
+            self._nodes = mmap.mmap(self._nodes_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._nodes = b""
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def node(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._nodes[start:end].decode("utf-8"))
+
+    def ids(self) -> List[str]:
+        return [self.node(row)["id"] for row in range(len(self))]
+
+    def search_rows(self, query_embedding, top_k: int = 5) -> List[Tuple[int, float]]:
+        """(row, cosine similarity) for the top-k rows, best first."""
+        if len(self) == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = np.asarray(self.vectors @ query, dtype=np.float32)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def search(self, query_embedding, top_k: int = 5) -> List[dict]:
+        """Top-k chunks by cosine similarity, best first, each with a "score"."""
+        results = []
+        for row, score in self.search_rows(query_embedding, top_k):
+            node = self.node(row)
+            node["score"] = score
+            results.append(node)
+        return results
+
+    def close(self):
+        if isinstance(self._nodes, mmap.mmap):
+            self._nodes.close()
+        self._nodes_file.close()
+        # np.load memmaps unmap once nothing references them
+        self.vectors = self.offsets = None
+
+
+def load_vector_store(persist_dir: str) -> Optional[VectorStore]:
+    if not vector_store_exists(persist_dir):
+        return None
+    return VectorStore(persist_dir)